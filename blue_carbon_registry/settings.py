@@ -33,7 +33,8 @@ INSTALLED_APPS = [
 CSRF_TRUSTED_ORIGINS = ['https://hashchain.up.railway.app']
 
 MIDDLEWARE = [
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'registry.middleware.AsyncWhiteNoiseMiddleware',
+    'registry.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,7 +48,7 @@ ROOT_URLCONF = 'blue_carbon_registry.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'registry.metrics.InstrumentedTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -66,7 +67,16 @@ WSGI_APPLICATION = 'blue_carbon_registry.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('REGISTRY_DATABASE') or BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of reopening per request.
+        # asgi.py turns this off: async requests run their queries on a thread
+        # per request, and a connection kept open on it would leak.
+        'CONN_MAX_AGE': int(os.environ.get('REGISTRY_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # atomic() takes the write lock up front; see registry/db.py.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -96,6 +106,12 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]  # ✅ static folder where logo.png is
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic fingerprints, precompresses (gzip and brotli) and adds WebP
+# copies of images; see registry.storage.StaticAssetStorage.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'registry.storage.StaticAssetStorage'},
+}
 # Optional: to serve media files (images uploaded by users)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -117,3 +133,45 @@ MESSAGE_TAGS = {
 }
 
 AUTH_USER_MODEL = 'registry.User'
+
+# Sessions and the session's user are read from the cache; see registry.auth.
+AUTHENTICATION_BACKENDS = ['registry.auth.CachedModelBackend']
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Registry
+REGISTRY_LEDGER_CHECKPOINT_INTERVAL = 1024
+REGISTRY_BULK_VERIFY_MAX_RECORDS = 5000  # ids past this are reported as over_limit, not processed
+REGISTRY_IMPORT_BATCH_SIZE = 2000  # rows per write transaction; the write lock is released between batches
+REGISTRY_IMPORT_GEOJSON_MAX_BYTES = 32 * 1024 * 1024  # GeoJSON is parsed whole; CSV streams and has no cap
+REGISTRY_DERIVATIVES_ASYNC = True
+REGISTRY_DERIVATIVE_WORKERS = 2
+REGISTRY_DUPLICATE_SITE_RADIUS_KM = 0.5
+REGISTRY_DUPLICATE_IMAGE_DISTANCE = 6  # max differing dHash bits for photos flagged as near-duplicates
+REGISTRY_UPLOAD_MAX_BYTES = 25 * 1024 * 1024  # per plantation image; larger uploads are cut off mid-stream
+REGISTRY_UPLOAD_MAX_PIXELS = 50_000_000  # checked from the image header, before any pixels are decoded
+REGISTRY_UPLOAD_PARTIAL_DIR = os.path.join(BASE_DIR, 'partial_uploads')  # resumable uploads; same filesystem as MEDIA_ROOT
+REGISTRY_UPLOAD_CHUNK_SIZE = 512 * 1024  # chunk size suggested to resumable upload clients
+REGISTRY_UPLOAD_CHUNK_MAX_BYTES = 8 * 1024 * 1024  # larger chunks are refused before they are read
+REGISTRY_UPLOAD_SESSION_TTL_HOURS = 48  # idle resumable uploads are removed by manage.py purge_uploads
+REGISTRY_SQLITE_PRAGMAS = {}  # overrides for registry.db.DEFAULT_PRAGMAS
+REGISTRY_WRITE_LOCK = True  # queue writers on a file lock beside the database
+REGISTRY_WRITE_RETRIES = 5
+REGISTRY_WRITE_BACKOFF = 0.05
+REGISTRY_METRICS_ENABLED = True
+REGISTRY_METRICS_BUFFER = 1000  # recent requests kept for latency quantiles
+REGISTRY_METRICS_DUPLICATE_QUERIES = 5  # same SQL this often in one request is flagged as N+1
+REGISTRY_METRICS_TOKEN = os.environ.get('REGISTRY_METRICS_TOKEN', '')  # optional bearer token for scrapers
+REGISTRY_FEED_TOKEN = os.environ.get('REGISTRY_FEED_TOKEN', '')  # optional bearer token for change feed consumers
+REGISTRY_FRAGMENT_CACHE_TTL = 3600  # seconds; fragments are invalidated by generation, not by expiry
+REGISTRY_USER_CACHE_TTL = 300  # seconds; cached users are invalidated on save, not by expiry
+REGISTRY_ASYNC_VIEWS = os.environ.get('REGISTRY_ASYNC_VIEWS') == '1'  # asgi.py routes read-only views to registry.async_views
+
+# A file cache is shared by every worker process on the host, so a bump made
+# by one worker invalidates the dashboard fragments of all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('REGISTRY_CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
@@ -0,0 +1,170 @@
+"""
+Read-only JSON API, version 1, over sites, plantation records and credits.
+
+Lists are keyset-paginated in creation order, so a client that keeps the
+last ``next_cursor`` can poll for new rows. ``?fields=`` selects a sparse
+fieldset. Rows are read with ``values_list()``, so related fields are
+joined in the same query and only the requested columns are fetched.
+
+Each page is answered in two steps. First the page's keys are read from the
+ordering index. Together with the resource's generation for the client
+they give a strong ETag. A conditional request that still matches gets a
+304 before any row is fetched or serialized. No timestamp column changes
+when a record's species or a credit's amount is edited, and none can see a
+joined site being renamed, so the generation carries those changes. It is
+kept per resource and per owner, with one more for admins, and only writes
+that touch what the client can see bump it (see ``fragments``). For the
+same reason there is no Last-Modified date: an If-Modified-Since check
+would miss those edits.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+
+from . import fragments
+from .exports import CREDIT_COLUMNS, RECORD_COLUMNS
+from .models import ProjectSite, PlantationRecord, CarbonCredit
+from .pagination import encode_cursor, seek
+
+API_VERSION = 1
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+SITE_COLUMNS = [
+    ('site_id', 'id'),
+    ('name', 'name'),
+    ('ecosystem_type', 'ecosystem_type'),
+    ('location_lat', 'location_lat'),
+    ('location_lng', 'location_lng'),
+    ('area_ha', 'area_ha'),
+    ('geohash', 'geohash'),
+    ('created_date', 'created_date'),
+    ('owner', 'created_by__username'),
+    ('organization', 'created_by__organization'),
+]
+
+
+class Resource:
+    def __init__(self, name, model, columns, ordering, stamps, owner):
+        self.name = name
+        self.model = model
+        self.columns = dict(columns)
+        self.ordering = ordering
+        # Timestamps read with the keys; they go into the ETag.
+        self.stamps = stamps
+        self.key_fields = list(ordering) + [field for field in stamps if field not in ordering]
+        self.owner = owner
+
+    def generation_scope(self, user):
+        return fragments.api_scope(self.name, None if user.role == 'ADMIN' else user.pk)
+
+    def visible_to(self, user):
+        queryset = self.model.objects.all()
+        if user.role != 'ADMIN':
+            queryset = queryset.filter(**{self.owner: user})
+        return queryset
+
+
+RESOURCES = {
+    'sites': Resource('sites', ProjectSite, SITE_COLUMNS, ('created_date', 'id'), ('created_date',),
+                      owner='created_by'),
+    'records': Resource('records', PlantationRecord, RECORD_COLUMNS, ('upload_date', 'id'),
+                        ('upload_date', 'verified_date'), owner='uploaded_by'),
+    'credits': Resource('credits', CarbonCredit, CREDIT_COLUMNS, ('issued_date', 'id'), ('issued_date',),
+                        owner='project_site__created_by'),
+}
+
+
+def parse_fields(resource, value):
+    """Return the requested column names, all of them by default."""
+    if not value:
+        return list(resource.columns)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in resource.columns]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(resource.columns)}.')
+    return list(dict.fromkeys(names))
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    if not value.isdigit() or not 1 <= int(value) <= MAX_LIMIT:
+        raise ValueError(f'limit must be a number from 1 to {MAX_LIMIT}.')
+    return int(value)
+
+
+def _cursor(resource, key):
+    # ``key`` starts with the ordering values, as read by respond().
+    instance = resource.model(**dict(zip(resource.ordering, key)))
+    opts = resource.model._meta
+    return encode_cursor([opts.get_field(f).value_to_string(instance) for f in resource.ordering])
+
+
+def etag(scope, keys, generation):
+    """Strong ETag for a page, from its keys and the resource's generation."""
+    state = [API_VERSION, scope, keys, generation]
+    digest = hashlib.sha256(json.dumps(state, cls=DjangoJSONEncoder).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _keys(resource, user, cursor, limit):
+    queryset, _ = seek(resource.visible_to(user), resource.ordering, cursor)
+    return queryset.values_list(*resource.key_fields)[:limit + 1]
+
+
+def _check(request, user, names, cursor, limit, keys, generation):
+    """``(keys, has_more, tag, response)``; the response is a 304 when the client's copy is current."""
+    has_more = len(keys) > limit
+    keys = [list(key) for key in keys[:limit]]
+    scope = [request.path, names, cursor, limit, 'all' if user.role == 'ADMIN' else user.pk]
+    tag = etag(scope, keys, generation)
+    return keys, has_more, tag, get_conditional_response(request, etag=tag)
+
+
+def _rows(resource, names, keys):
+    ids = [key[resource.key_fields.index('id')] for key in keys]
+    paths = [resource.columns[name] for name in names]
+    return ids, resource.model.objects.filter(pk__in=ids).values_list('pk', *paths)
+
+
+def _page(resource, names, cursor, keys, has_more, ids, rows):
+    rows = {row[0]: dict(zip(names, row[1:])) for row in rows}
+    return JsonResponse({
+        'version': API_VERSION,
+        'data': [rows[pk] for pk in ids if pk in rows],
+        'has_more': has_more,
+        'next_cursor': _cursor(resource, keys[-1]) if keys else cursor,
+    })
+
+
+def _headers(response, tag):
+    response['ETag'] = tag
+    # Responses depend on the session; clients and proxies revalidate every time.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def respond(request, resource, user, names, cursor, limit):
+    """The page after ``cursor`` as a response, or a 304 when the client's copy is current."""
+    keys = list(_keys(resource, user, cursor, limit))
+    generation = fragments.generation(resource.generation_scope(user))
+    keys, has_more, tag, response = _check(request, user, names, cursor, limit, keys, generation)
+    if response is None:
+        ids, rows = _rows(resource, names, keys)
+        response = _page(resource, names, cursor, keys, has_more, ids, rows)
+    return _headers(response, tag)
+
+
+async def arespond(request, resource, user, names, cursor, limit):
+    """``respond`` for async views."""
+    keys = [key async for key in _keys(resource, user, cursor, limit)]
+    generation = await fragments.ageneration(resource.generation_scope(user))
+    keys, has_more, tag, response = _check(request, user, names, cursor, limit, keys, generation)
+    if response is None:
+        ids, rows = _rows(resource, names, keys)
+        response = _page(resource, names, cursor, keys, has_more, ids, [row async for row in rows])
+    return _headers(response, tag)
@@ -0,0 +1,119 @@
+"""
+Async variants of the read-only views, served only under asgi.py.
+
+WSGI stays the default deployment and routes to the sync views in
+``views``: there every async view would pay for a thread hop per query
+and gain nothing. asgi.py sets ``REGISTRY_ASYNC_VIEWS`` and ``urls`` then
+routes here instead. Under uvicorn a slow export download or a long-polled
+change feed waits on the event loop rather than holding a worker. Each view
+checks and parses its request the same way as its sync twin in ``views``.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_safe
+
+from . import api, derivatives, duplicates, events, exports, fragments, rollups
+from .pagination import akeyset_page
+from .stats import aorganization_stats, aregistry_stats
+from .views import (
+    ADMIN_QUEUE_PAGE_SIZE, admin_dashboard_context, api_query, export_response, feed_query, feed_response,
+    home_context, ngo_dashboard_context, pending_queue,
+)
+
+
+async def render_async(request, template_name, context):
+    """Render on a worker thread: templates may still evaluate lazy querysets."""
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def home(request):
+    return await render_async(request, 'registry/home.html', home_context(await aregistry_stats()))
+
+
+@login_required
+async def ngo_dashboard(request):
+    user = await request.auser()
+    if user.role not in ['NGO', 'COMMUNITY']:
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+
+    context = ngo_dashboard_context(user, await aorganization_stats(user), await fragments.acontext(user.pk))
+    return await render_async(request, 'registry/ngo_dashboard.html', context)
+
+
+@login_required
+async def admin_dashboard(request):
+    user = await request.auser()
+    if user.role != 'ADMIN':
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+
+    pending_records = await akeyset_page(pending_queue(), ('upload_date', 'id'), request.GET.get('after'),
+                                         ADMIN_QUEUE_PAGE_SIZE)
+    await derivatives.aattach(pending_records.items)
+    await duplicates.aflag(pending_records.items)
+    context = admin_dashboard_context(pending_records, await aregistry_stats(), await fragments.acontext())
+    return await render_async(request, 'registry/admin_dashboard.html', context)
+
+
+@login_required
+async def export_data(request, dataset, fmt):
+    user = await request.auser()
+    if user.role != 'ADMIN':
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+    return export_response(request, dataset, fmt, exports.astream)
+
+
+@require_safe
+async def api_list(request, resource):
+    query = api_query(request, await request.auser(), resource)
+    if isinstance(query, HttpResponse):
+        return query
+    return await api.arespond(request, *query)
+
+
+@require_safe
+async def events_feed(request):
+    """Change events after ``?since=``. With ``?wait=``, hold the request until one arrives."""
+    query = feed_query(request, await request.auser())
+    if isinstance(query, HttpResponse):
+        return query
+    since, limit, timeout = query
+    return feed_response(await events.apoll(since, limit + 1, timeout), since, limit)
+
+
+@require_safe
+async def rollup_report(request):
+    """Summed rollup buckets grouped by ``?group_by=``. Owners see their own sites only."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        group_by, measures, filters = rollups.parse_report(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    owner = None if user.role == 'ADMIN' else user
+    rows = [row async for row in rollups.report(group_by, measures, owner=owner, **filters)]
+    return JsonResponse({'group_by': group_by, 'measures': measures, 'rows': rows})
+
+
+@require_safe
+async def rollup_chart(request):
+    """One measure over years or months, one dataset per ``?series=`` value."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        x, series, measure, filters = rollups.parse_chart(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    owner = None if user.role == 'ADMIN' else user
+    group_by = [x, series] if series else [x]
+    rows = [row async for row in rollups.report(group_by, [measure], owner=owner, **filters)]
+    return JsonResponse(rollups.chart(rows, x, series, measure))
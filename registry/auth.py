@@ -0,0 +1,70 @@
+"""
+Cached user lookups for ``AuthenticationMiddleware``.
+
+Sessions are stored with the ``cached_db`` engine, so loading one reads the
+shared cache and not the database. ``CachedModelBackend`` does the same for
+the session's user: it keeps the ``User`` in the cache, so a role check on
+a warm session runs no auth queries at all.
+
+Each cached user is stored with its owner's generation, a random token
+kept in the cache alongside it, and both are read in one ``get_many``.
+Saving or deleting a user stores a new generation (see ``signals``), so the
+next request loads the user from the database again. As in ``fragments``,
+the bump happens immediately and again after commit. A request that read
+the old row just before the change can still cache it, but only under the
+old generation, which nothing reads any more. A generation that goes
+missing is replaced by a fresh token for the same reason.
+
+Updates that bypass ``save()`` (``QuerySet.update()``, raw SQL) must call
+``forget`` themselves.
+"""
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _keys(user_id):
+    return f'registry:auth:user:{user_id}', f'registry:auth:generation:{user_id}'
+
+
+def user_cache_ttl():
+    return getattr(settings, 'REGISTRY_USER_CACHE_TTL', 300)
+
+
+def _forget_now(user_ids):
+    cache.set_many({_keys(user_id)[1]: uuid.uuid4().hex for user_id in user_ids}, timeout=None)
+
+
+def forget(*user_ids):
+    """Drop these users from the cache; their next request reloads them."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        _forget_now(user_ids)
+        transaction.on_commit(lambda: _forget_now(user_ids))
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` whose ``get_user`` is served from the cache while the user is unchanged."""
+
+    def get_user(self, user_id):
+        user_key, generation_key = _keys(user_id)
+        found = cache.get_many([user_key, generation_key])
+        generation = found.get(generation_key)
+        if generation is None:
+            cache.add(generation_key, uuid.uuid4().hex, timeout=None)
+            generation = cache.get(generation_key)
+        entry = found.get(user_key)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+
+        user = super().get_user(user_id)
+        if user is not None:
+            cache.set(user_key, (generation, user), user_cache_ttl())
+        return user
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
@@ -0,0 +1,145 @@
+"""
+Carbon-credit pricing.
+
+Credits are ``number_of_plants * base rate * ecosystem multiplier`` rounded
+half-even to two places, exactly as ``round(Decimal, 2)`` does. The engine
+works on whole columns at once: per-plant rates are converted to scaled
+integers up front, so each row costs one integer multiply and a divmod
+instead of a chain of Decimal operations.
+
+Querysets are priced in the database. ``price_records`` annotates each
+record with ``number_of_plants`` times its ecosystem's scaled rate, a
+``CASE`` over the ecosystem types. With the standard rates the scale is
+two places, so that product is already the credits in hundredths and no
+rounding is left to do; ``total`` then sums it in the same query.
+
+``build_credits`` makes the unsaved ``CarbonCredit`` rows for verified
+records, transaction hashes included, so issuance paths can insert them
+with ``bulk_create``.
+"""
+from decimal import Decimal
+
+from django.db.models import BigIntegerField, Case, Count, F, Sum, Value, When
+
+from .models import CarbonCredit, PlantationRecord
+
+BASE_CREDITS_PER_PLANT = Decimal('0.5')
+ECOSYSTEM_MULTIPLIERS = {
+    'MANGROVE': Decimal('1.5'),
+    'SEAGRASS': Decimal('1.2'),
+    'MARSH': Decimal('1.0'),
+}
+DEFAULT_MULTIPLIER = Decimal('1.0')
+CREDIT_PLACES = 2
+QUERYSET_CHUNK_SIZE = 5000
+
+
+class CreditEngine:
+    def __init__(self, base_rate=BASE_CREDITS_PER_PLANT, multipliers=None, default_multiplier=DEFAULT_MULTIPLIER):
+        multipliers = ECOSYSTEM_MULTIPLIERS if multipliers is None else multipliers
+        rates = {eco: base_rate * multiplier for eco, multiplier in multipliers.items()}
+        default_rate = base_rate * default_multiplier
+
+        # Fixed-point scale: enough decimal places to hold every per-plant
+        # rate exactly, and never fewer than the output precision.
+        self.scale = max([CREDIT_PLACES] + [-r.as_tuple().exponent for r in [*rates.values(), default_rate]])
+        self.rate_units = {eco: int(rate.scaleb(self.scale)) for eco, rate in rates.items()}
+        self.default_units = int(default_rate.scaleb(self.scale))
+        self._divisor = 10 ** (self.scale - CREDIT_PLACES)
+
+    def _round(self, units):
+        # Round half-even from ``scale`` places down to CREDIT_PLACES.
+        if self._divisor == 1:
+            return units
+        quotient, remainder = divmod(units, self._divisor)
+        doubled = remainder * 2
+        if doubled > self._divisor or (doubled == self._divisor and quotient % 2):
+            quotient += 1
+        return quotient
+
+    def calculate_cents(self, plants, ecosystem_types):
+        """Credits for each (plants, ecosystem) pair as integer hundredths."""
+        rate_units = self.rate_units
+        default_units = self.default_units
+        return [
+            self._round(count * rate_units.get(eco, default_units))
+            for count, eco in zip(plants, ecosystem_types)
+        ]
+
+    def calculate(self, plants, ecosystem_types):
+        """Credits for each (plants, ecosystem) pair as two-place Decimals."""
+        return [Decimal(cents).scaleb(-CREDIT_PLACES) for cents in self.calculate_cents(plants, ecosystem_types)]
+
+    @property
+    def exact(self):
+        """Whether the scaled products are already whole hundredths."""
+        return self._divisor == 1
+
+    def units_expression(self):
+        """SQL for a record's credits in ``scale``-place integer units."""
+        plants = F('number_of_plants')
+        return Case(
+            *[When(project_site__ecosystem_type=eco, then=plants * Value(units))
+              for eco, units in self.rate_units.items()],
+            default=plants * Value(self.default_units),
+            output_field=BigIntegerField(),
+        )
+
+    def price_records(self, queryset):
+        """Annotate a ``PlantationRecord`` queryset with ``credit_units``."""
+        return queryset.annotate(credit_units=self.units_expression())
+
+    def calculate_queryset(self, queryset, chunk_size=QUERYSET_CHUNK_SIZE):
+        """
+        Yield ``(record_id, credits)`` for a ``PlantationRecord`` queryset.
+        The products are computed in SQL; only rates with more than two
+        places leave rounding to do here.
+        """
+        rows = self.price_records(queryset).values_list('pk', 'credit_units').iterator(chunk_size)
+        round_units = (lambda units: units) if self.exact else self._round
+        for record_id, units in rows:
+            yield record_id, Decimal(round_units(units)).scaleb(-CREDIT_PLACES)
+
+    def total(self, queryset):
+        """``(records, credits)`` for a ``PlantationRecord`` queryset."""
+        if not self.exact:
+            amounts = [amount for _, amount in self.calculate_queryset(queryset)]
+            return len(amounts), sum(amounts, Decimal('0.00'))
+        totals = self.price_records(queryset).aggregate(records=Count('pk'), units=Sum('credit_units'))
+        return totals['records'], Decimal(totals['units'] or 0).scaleb(-CREDIT_PLACES)
+
+
+default_engine = CreditEngine()
+
+
+def calculate_credits(plants, ecosystem_types):
+    return default_engine.calculate(plants, ecosystem_types)
+
+
+def credits_for_records(queryset, chunk_size=QUERYSET_CHUNK_SIZE):
+    return default_engine.calculate_queryset(queryset, chunk_size)
+
+
+def build_credits(records, amounts, ids=None):
+    """
+    Unsaved credits for verified ``records`` and their ``amounts``, with
+    ``txn_hash`` set and ready for ``bulk_create``. Only ``project_site_id``
+    is read; a project site already loaded on a record is shared with its
+    credit. ``ids`` optionally supplies the credits' UUIDs.
+    """
+    ids = iter(ids) if ids is not None else None
+    credits = []
+    for record, amount in zip(records, amounts):
+        credit = CarbonCredit(
+            project_site_id=record.project_site_id,
+            plantation_record=record,
+            year=record.date_planted.year,
+            credits_issued=amount,
+        )
+        if ids is not None:
+            credit.id = next(ids)
+        if PlantationRecord.project_site.is_cached(record):
+            credit.project_site = record.project_site
+        credit.txn_hash = credit.build_txn_hash()
+        credits.append(credit)
+    return credits
@@ -0,0 +1,199 @@
+"""
+SQLite tuning for several gunicorn workers sharing one database file.
+
+Every new SQLite connection gets the pragmas in ``sqlite_pragmas()``: WAL so
+readers never block the writer, ``synchronous=NORMAL`` (safe under WAL),
+a memory map for reads and a busy timeout so writers queue instead of
+failing at once. Settings also make ``atomic()`` issue ``BEGIN IMMEDIATE``.
+A write transaction takes the lock when it starts, not halfway through
+when it first writes, so SQLite can never deadlock two writers that both
+read first.
+
+``write_transaction`` runs a function in such a transaction. Writers first
+queue on an exclusive ``flock`` next to the database file. SQLite's own
+busy handler polls with growing sleeps, and under steady load one writer
+can starve for seconds, whereas the kernel lock wakes waiters as soon as
+it is released. If the database lock still cannot be taken within the
+busy timeout the call is retried with jittered exponential backoff. Time
+spent waiting is recorded in ``lock_metrics``.
+"""
+import functools
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to SQLite's busy handler alone.
+    fcntl = None
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'database is busy')
+# A BEGIN IMMEDIATE slower than this counts as having waited for the lock.
+CONTENDED_SECONDS = 0.002
+
+
+def sqlite_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'REGISTRY_SQLITE_PRAGMAS', {})}
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in sqlite_pragmas().items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return any(text in message for text in LOCK_ERRORS)
+
+
+def _lock_path(alias):
+    connection = connections[alias]
+    if fcntl is None or connection.vendor != 'sqlite' or not getattr(settings, 'REGISTRY_WRITE_LOCK', True):
+        return None
+    if connection.is_in_memory_db():
+        return None
+    return f"{connection.settings_dict['NAME']}.write-lock"
+
+
+@contextmanager
+def serialized_writes(alias=DEFAULT_DB_ALIAS):
+    """Hold the cross-process writer lock for ``alias`` (if it has one)."""
+    path = _lock_path(alias)
+    if path is None:
+        yield
+        return
+    with open(path, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class LockMetrics:
+    """Process-wide counters for write transactions and lock waits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.transactions = 0
+            self.contended = 0
+            self.retries = 0
+            self.failures = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def record_begin(self, seconds):
+        with self._lock:
+            self.transactions += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if seconds >= CONTENDED_SECONDS:
+                self.contended += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'transactions': self.transactions,
+                'contended': self.contended,
+                'retries': self.retries,
+                'failures': self.failures,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+            }
+
+
+lock_metrics = LockMetrics()
+
+
+def write_transaction(func=None, *, using=None, retries=None, backoff=None):
+    """
+    Decorator running ``func`` in an immediate write transaction, retrying
+    the whole call if the database stays locked.
+
+    ``func`` may run more than once, so it must read whatever it writes
+    inside the transaction. Nested inside an existing ``atomic()`` block it
+    simply runs in a savepoint: the outer transaction already holds the lock
+    and only it could be retried.
+    """
+    if func is None:
+        return functools.partial(write_transaction, using=using, retries=retries, backoff=backoff)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        alias = using or DEFAULT_DB_ALIAS
+        if connections[alias].in_atomic_block:
+            with transaction.atomic(using=alias):
+                return func(*args, **kwargs)
+
+        attempts = 1 + (retries if retries is not None else getattr(settings, 'REGISTRY_WRITE_RETRIES', 5))
+        delay = backoff if backoff is not None else getattr(settings, 'REGISTRY_WRITE_BACKOFF', 0.05)
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                with serialized_writes(alias), transaction.atomic(using=alias):
+                    lock_metrics.record_begin(time.perf_counter() - started)
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if not is_lock_error(exc) or attempt == attempts - 1:
+                    lock_metrics.record_failure()
+                    raise
+                lock_metrics.record_retry()
+                time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    return wrapper
+
+
+@contextmanager
+def scratch_database(alias=DEFAULT_DB_ALIAS):
+    """
+    Point ``alias`` at a freshly migrated SQLite file in a temporary
+    directory, yield its path, then restore the configured database. Used by
+    the load test and benchmarks so they never touch real data.
+    """
+    from django.core.management import call_command
+
+    connection = connections[alias]
+    original = connection.settings_dict.copy()
+    scratch = tempfile.mkdtemp(prefix='registry-scratch-')
+    path = os.path.join(scratch, 'scratch.sqlite3')
+    connections.close_all()
+    connection.settings_dict.update(NAME=path, OPTIONS=dict(original.get('OPTIONS', {})))
+    try:
+        call_command('migrate', database=alias, verbosity=0)
+        yield path
+    finally:
+        connections.close_all()
+        connection.settings_dict.clear()
+        connection.settings_dict.update(original)
+        shutil.rmtree(scratch, ignore_errors=True)
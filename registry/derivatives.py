@@ -0,0 +1,171 @@
+"""
+Background thumbnails and review-size derivatives for evidence photos.
+
+After an upload is committed its storage name is queued on an in-process
+thread pool, so no external broker is needed. Workers decode the image once,
+apply the EXIF orientation, strip metadata and write a JPEG and a WebP
+thumbnail plus a review-size JPEG. They also store the photo's perceptual
+hash for ``duplicates``. Derivatives are keyed by the source
+file's content-addressed name, so photos shared by several records are
+processed once. Jobs still queued when the process exits are simply
+rebuilt by ``build_derivatives --missing``.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import duplicates
+from .models import PlantationRecord, ImageDerivative, ImageHash
+
+logger = logging.getLogger(__name__)
+
+# kind: (longest edge in pixels, Pillow format, file extension, save options)
+DERIVATIVE_SPECS = {
+    'THUMB_JPEG': (320, 'JPEG', 'jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'THUMB_WEBP': (320, 'WEBP', 'webp', {'quality': 75, 'method': 4}),
+    'REVIEW': (1600, 'JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_queued = set()
+
+
+def _storage():
+    return PlantationRecord._meta.get_field('uploaded_images').storage
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'REGISTRY_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='derivatives',
+            )
+        return _executor
+
+
+def enqueue(source):
+    """Schedule derivatives for ``source`` without blocking the caller."""
+    if not source:
+        return
+    if not getattr(settings, 'REGISTRY_DERIVATIVES_ASYNC', True):
+        build(source)
+        return
+    with _executor_lock:
+        if source in _queued:
+            return
+        _queued.add(source)
+    _pool().submit(_run, source)
+
+
+def _run(source):
+    close_old_connections()
+    try:
+        build(source)
+    except Exception:
+        logger.exception('Building derivatives for %s failed', source)
+    finally:
+        with _executor_lock:
+            _queued.discard(source)
+        close_old_connections()
+
+
+def _encode(image, fmt, options):
+    buffer = io.BytesIO()
+    # No exif= argument: Pillow writes no metadata unless asked to.
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def build(source, force=False):
+    """Create any missing derivatives and the perceptual hash of the stored image ``source``."""
+    existing = set(ImageDerivative.objects.filter(source=source).values_list('kind', flat=True))
+    wanted = [kind for kind in DERIVATIVE_SPECS if force or kind not in existing]
+    hashed = not force and ImageHash.objects.filter(source=source).exists()
+    if not wanted and hashed:
+        return []
+
+    storage = _storage()
+    try:
+        with storage.open(source, 'rb') as original:
+            with Image.open(original) as image:
+                # JPEGs decode at the smallest DCT scale still covering the
+                # largest derivative, a fraction of the full-size memory.
+                largest = max(edge for edge, *_ in DERIVATIVE_SPECS.values())
+                full_size = image.size
+                image.draft('RGB', (largest, largest))
+                drafted = image.size
+                image = ImageOps.exif_transpose(image)
+                if image.size != drafted:  # turned a quarter by its EXIF orientation
+                    full_size = full_size[::-1]
+                source_width, source_height = full_size
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as exc:
+        logger.warning('Cannot build derivatives for %s: %s', source, exc)
+        return []
+
+    if not hashed:
+        duplicates.index(source, image)
+    file_field = ImageDerivative._meta.get_field('file')
+    created = []
+    for kind in wanted:
+        edge, fmt, extension, options = DERIVATIVE_SPECS[kind]
+        derivative = image.copy()
+        derivative.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        content = ContentFile(_encode(derivative, fmt, options))
+        name = file_field.storage.save(file_field.generate_filename(None, f'{kind.lower()}.{extension}'), content)
+        record, _ = ImageDerivative.objects.update_or_create(
+            source=source,
+            kind=kind,
+            defaults={
+                'file': name,
+                'width': derivative.width,
+                'height': derivative.height,
+                'source_width': source_width,
+                'source_height': source_height,
+            },
+        )
+        created.append(record)
+    return created
+
+
+def _sources(records):
+    return {record.uploaded_images.name for record in records if record.uploaded_images}
+
+
+def _assign(records, derivatives):
+    by_source = {}
+    for derivative in derivatives:
+        by_source.setdefault(derivative.source, {})[derivative.kind] = derivative
+    for record in records:
+        kinds = by_source.get(record.uploaded_images.name, {}) if record.uploaded_images else {}
+        record.thumbnail_jpeg = kinds.get('THUMB_JPEG')
+        record.thumbnail_webp = kinds.get('THUMB_WEBP')
+        record.review_image = kinds.get('REVIEW')
+    return records
+
+
+def attach(records):
+    """
+    Set ``thumbnail_jpeg``, ``thumbnail_webp`` and ``review_image`` on each
+    record that has them, using one query for the whole list.
+    """
+    sources = _sources(records)
+    return _assign(records, ImageDerivative.objects.filter(source__in=sources) if sources else ())
+
+
+async def aattach(records):
+    """``attach`` for async views."""
+    sources = _sources(records)
+    derivatives = [d async for d in ImageDerivative.objects.filter(source__in=sources)] if sources else ()
+    return _assign(records, derivatives)
@@ -0,0 +1,176 @@
+"""
+Near-duplicate evidence photos.
+
+Content addressing only merges byte-identical files. A photo that was
+re-encoded, resized or lightly edited before it was reused gets a new name.
+To catch those, the derivative worker stores a 64-bit difference hash
+(dHash) of every photo. Each bit records whether a pixel of a 9x8
+greyscale thumbnail is brighter than its right-hand neighbour. Copies of
+one photo differ in only a few bits.
+
+The hash covers the whole frame, so it does not survive cropping. Trimming
+a thin border moves a few bits, but cutting away more than a few percent
+of the width shifts every column of the thumbnail. A cropped copy then
+looks like an unrelated photo and is not flagged.
+
+Search uses multi-index hashing. The hash is split into four 16-bit
+bands, each in an indexed column. Two hashes within Hamming distance ``d``
+differ in at most ``d // 4`` bits in at least one band. So a search reads
+only rows whose band lies within that radius of the query's band: a few
+dozen indexed values per band rather than a scan of every hash. The exact
+distance is then checked on the candidates. With the default distance of
+6, each band has 17 values.
+
+``flag`` sets ``near_duplicates`` on the records of a page, for the
+verification queue. Records sharing the very same file count too, at
+distance 0.
+"""
+import itertools
+
+from django.conf import settings
+from django.db.models import Q
+from PIL import Image
+
+from .models import ImageHash, PlantationRecord
+
+BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+HASH_SIZE = 8
+
+
+def max_distance():
+    return getattr(settings, 'REGISTRY_DUPLICATE_IMAGE_DISTANCE', 6)
+
+
+def dhash(image):
+    """The 64-bit difference hash of a Pillow image."""
+    grey = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = grey.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + column]
+            value = value << 1 | (left > pixels[row * (HASH_SIZE + 1) + column + 1])
+    return value
+
+
+def bands(value):
+    return [(value >> (BAND_BITS * band)) & BAND_MASK for band in range(BANDS)]
+
+
+def to_signed(value):
+    """A 64-bit hash as the signed integer SQLite and BigIntegerField store."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def distance(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count('1')
+
+
+def neighbours(band, radius):
+    """Every band value within ``radius`` bits of ``band``."""
+    values = [band]
+    for flipped in range(1, radius + 1):
+        for bits in itertools.combinations(range(BAND_BITS), flipped):
+            values.append(band ^ sum(1 << bit for bit in bits))
+    return values
+
+
+def index(source, image):
+    """Store the hash of ``image``, the decoded photo stored as ``source``."""
+    value = dhash(image)
+    ImageHash.objects.update_or_create(
+        source=source,
+        defaults={'dhash': to_signed(value), **{f'band{n}': band for n, band in enumerate(bands(value))}},
+    )
+    return value
+
+
+def _candidates(values, radius):
+    """Hashes sharing a band, within ``radius`` bits, with any of ``values``."""
+    per_band = [set() for _ in range(BANDS)]
+    for value in values:
+        for n, band in enumerate(bands(value)):
+            per_band[n].update(neighbours(band, radius))
+    condition = Q()
+    for n, band_values in enumerate(per_band):
+        condition |= Q(**{f'band{n}__in': band_values})
+    return ImageHash.objects.filter(condition).values_list('source', 'dhash')
+
+
+def similar(value, limit=None):
+    """``(source, distance)`` of stored photos within ``max_distance`` of the hash ``value``, closest first."""
+    limit = max_distance() if limit is None else limit
+    matches = [
+        (source, distance(value, stored))
+        for source, stored in _candidates([value], limit // BANDS).iterator()
+    ]
+    return sorted((match for match in matches if match[1] <= limit), key=lambda match: match[1])
+
+
+def _sources(records):
+    return {record.uploaded_images.name for record in records if record.uploaded_images}
+
+
+def _matches(hashes, candidates, limit):
+    """``{source: {similar source: distance}}`` for the page's ``hashes``."""
+    matches = {}
+    for source, value in hashes:
+        for other, stored in candidates:
+            gap = distance(value, stored)
+            if gap <= limit:
+                matches.setdefault(source, {})[other] = gap
+    return matches
+
+
+def _users_query(sources):
+    return PlantationRecord.objects.filter(uploaded_images__in=sources).values_list(
+        'id', 'uploaded_images', 'species', 'project_site__name',
+    )
+
+
+def _assign(records, matches, users):
+    by_source = {}
+    for record_id, source, species, site in users:
+        by_source.setdefault(source, []).append({'id': record_id, 'species': species, 'site': site})
+    for record in records:
+        found = []
+        source = record.uploaded_images.name if record.uploaded_images else None
+        for other, gap in matches.get(source, {}).items():
+            found.extend(
+                dict(match, distance=gap) for match in by_source.get(other, ()) if match['id'] != record.id
+            )
+        record.near_duplicates = sorted(found, key=lambda match: match['distance'])
+    return records
+
+
+def flag(records):
+    """
+    Set ``near_duplicates`` on each record: the other records whose photo is
+    within ``max_distance``, as dicts with id, species, site and distance.
+    Three queries for the whole list, none if no record has a photo.
+    """
+    limit = max_distance()
+    sources = _sources(records)
+    hashes = list(ImageHash.objects.filter(source__in=sources).values_list('source', 'dhash')) if sources else []
+    if not hashes:
+        return _assign(records, {}, ())
+    matches = _matches(hashes, list(_candidates([value for _, value in hashes], limit // BANDS)), limit)
+    users = _users_query({other for found in matches.values() for other in found})
+    return _assign(records, matches, users)
+
+
+async def aflag(records):
+    """``flag`` for async views."""
+    limit = max_distance()
+    sources = _sources(records)
+    hashes = []
+    if sources:
+        hashes = [row async for row in ImageHash.objects.filter(source__in=sources).values_list('source', 'dhash')]
+    if not hashes:
+        return _assign(records, {}, ())
+    candidates = [row async for row in _candidates([value for _, value in hashes], limit // BANDS)]
+    matches = _matches(hashes, candidates, limit)
+    users = [row async for row in _users_query({other for found in matches.values() for other in found})]
+    return _assign(records, matches, users)
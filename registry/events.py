@@ -0,0 +1,126 @@
+"""
+Change feed for downstream mirrors.
+
+A ``ChangeEvent`` is appended in the same transaction as the change it
+describes: a record being verified or a credit being issued. Sequence
+numbers only grow. Writers hold the SQLite write lock from BEGIN to COMMIT
+(see ``db``), so sequence order is commit order. A consumer that has read
+up to N and asks for the events after N never misses one committed later.
+Consumers sync in O(changes): ``since`` is a range scan on the primary key.
+"""
+import asyncio
+import heapq
+import time
+
+from django.apps import apps as global_apps
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# Long-polling clients re-check for new events this often, for at most MAX_WAIT seconds.
+POLL_INTERVAL = 0.5
+MAX_WAIT = 30
+BACKFILL_CHUNK_SIZE = 2000
+
+RECORD_VERIFIED = 'record.verified'
+CREDIT_ISSUED = 'credit.issued'
+
+
+def record_verified(record):
+    return RECORD_VERIFIED, record.pk, {
+        'record_id': record.pk,
+        'project_site_id': record.project_site_id,
+        'uploaded_by_id': record.uploaded_by_id,
+        'verified_by_id': record.verified_by_id,
+        'verified_date': record.verified_date,
+        'species': record.species,
+        'number_of_plants': record.number_of_plants,
+        'date_planted': record.date_planted,
+    }
+
+
+def credit_issued(credit):
+    return CREDIT_ISSUED, credit.pk, {
+        'credit_id': credit.pk,
+        'txn_hash': credit.txn_hash,
+        'project_site_id': credit.project_site_id,
+        'plantation_record_id': credit.plantation_record_id,
+        'year': credit.year,
+        'credits_issued': credit.credits_issued,
+        'issued_date': credit.issued_date,
+    }
+
+
+def append(events, apps=global_apps):
+    """
+    Store ``(kind, object_id, payload)`` events in the given order. Call
+    inside the transaction that makes the changes.
+    """
+    ChangeEvent = apps.get_model('registry', 'ChangeEvent')
+    ChangeEvent.objects.bulk_create(
+        [ChangeEvent(kind=kind, object_id=object_id, payload=payload) for kind, object_id, payload in events],
+        batch_size=BACKFILL_CHUNK_SIZE,
+    )
+
+
+def _after(sequence, limit):
+    from .models import ChangeEvent
+    return ChangeEvent.objects.filter(sequence__gt=sequence).order_by('sequence')[:limit]
+
+
+def since(sequence, limit=PAGE_SIZE):
+    """The first ``limit`` events after ``sequence``."""
+    return list(_after(sequence, limit))
+
+
+def poll(sequence, limit=PAGE_SIZE, timeout=0):
+    """``since``, re-checking for up to ``timeout`` seconds while there is nothing new."""
+    deadline = time.monotonic() + timeout
+    while True:
+        events = since(sequence, limit)
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0:
+            return events
+        time.sleep(min(POLL_INTERVAL, remaining))
+
+
+async def apoll(sequence, limit=PAGE_SIZE, timeout=0):
+    """``poll`` for async views; waiting does not hold a thread."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        events = [event async for event in _after(sequence, limit)]
+        remaining = deadline - loop.time()
+        if events or remaining <= 0:
+            return events
+        await asyncio.sleep(min(POLL_INTERVAL, remaining))
+
+
+def as_dict(event):
+    return {
+        'sequence': event.sequence,
+        'kind': event.kind,
+        'object_id': event.object_id,
+        'created_at': event.created_at,
+        'payload': event.payload,
+    }
+
+
+def backfill(apps=global_apps, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Append events for everything verified or issued before the feed existed, oldest first."""
+    PlantationRecord = apps.get_model('registry', 'PlantationRecord')
+    CarbonCredit = apps.get_model('registry', 'CarbonCredit')
+    records = PlantationRecord.objects.filter(verified=True).order_by('verified_date', 'id').iterator(chunk_size)
+    credits = CarbonCredit.objects.order_by('issued_date', 'id').iterator(chunk_size)
+    # A record is verified before its credit is issued, so records win ties.
+    merged = heapq.merge(
+        ((record.verified_date or record.upload_date, 0, record_verified(record)) for record in records),
+        ((credit.issued_date, 1, credit_issued(credit)) for credit in credits),
+        key=lambda item: item[:2],
+    )
+    batch = []
+    for _, _, event in merged:
+        batch.append(event)
+        if len(batch) >= chunk_size:
+            append(batch, apps)
+            batch = []
+    append(batch, apps)
@@ -0,0 +1,159 @@
+"""
+Streaming CSV / JSON Lines exports of credits and plantation records.
+
+Rows are read with ``values_list(...).iterator()`` and serialized as they
+arrive, so memory stays flat regardless of export size and the first bytes
+are sent before the query has finished.
+"""
+import csv
+import datetime
+import itertools
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import PlantationRecord, CarbonCredit
+
+EXPORT_CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CREDIT_COLUMNS = [
+    ('txn_hash', 'txn_hash'),
+    ('credit_id', 'id'),
+    ('year', 'year'),
+    ('credits_issued', 'credits_issued'),
+    ('issued_date', 'issued_date'),
+    ('project_site_id', 'project_site_id'),
+    ('project_site', 'project_site__name'),
+    ('ecosystem_type', 'project_site__ecosystem_type'),
+    ('owner', 'project_site__created_by__username'),
+    ('organization', 'project_site__created_by__organization'),
+    ('plantation_record_id', 'plantation_record_id'),
+    ('species', 'plantation_record__species'),
+    ('date_planted', 'plantation_record__date_planted'),
+]
+
+RECORD_COLUMNS = [
+    ('record_id', 'id'),
+    ('project_site_id', 'project_site_id'),
+    ('project_site', 'project_site__name'),
+    ('ecosystem_type', 'project_site__ecosystem_type'),
+    ('species', 'species'),
+    ('number_of_plants', 'number_of_plants'),
+    ('date_planted', 'date_planted'),
+    ('verified', 'verified'),
+    ('verified_date', 'verified_date'),
+    ('upload_date', 'upload_date'),
+    ('uploaded_by', 'uploaded_by__username'),
+    ('organization', 'uploaded_by__organization'),
+]
+
+
+def parse_year(value):
+    """The ``year`` filter from a query parameter; raises ValueError for bad values."""
+    if not value:
+        return None
+    # ``record_rows`` filters up to January 1st of the following year.
+    if not value.isdigit() or not 1 <= int(value) < datetime.MAXYEAR:
+        raise ValueError(f'year must be a year from 1 to {datetime.MAXYEAR - 1}.')
+    return int(value)
+
+
+def credit_rows(year=None, ecosystem_type=None, organization=None):
+    credits = CarbonCredit.objects.all()
+    if year:
+        credits = credits.filter(year=year)
+    if ecosystem_type:
+        credits = credits.filter(project_site__ecosystem_type=ecosystem_type)
+    if organization:
+        credits = credits.filter(project_site__created_by__organization=organization)
+    credits = credits.order_by('issued_date', 'id')
+    return CREDIT_COLUMNS, credits.values_list(*[path for _, path in CREDIT_COLUMNS])
+
+
+def record_rows(year=None, ecosystem_type=None, organization=None):
+    records = PlantationRecord.objects.all()
+    if year:
+        records = records.filter(date_planted__gte=datetime.date(year, 1, 1), date_planted__lt=datetime.date(year + 1, 1, 1))
+    if ecosystem_type:
+        records = records.filter(project_site__ecosystem_type=ecosystem_type)
+    if organization:
+        records = records.filter(uploaded_by__organization=organization)
+    records = records.order_by('upload_date', 'id')
+    return RECORD_COLUMNS, records.values_list(*[path for _, path in RECORD_COLUMNS])
+
+
+DATASETS = {
+    'credits': credit_rows,
+    'records': record_rows,
+}
+
+
+class _Echo:
+    """File-like object whose write() just returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _batched(lines):
+    # Join small lines into larger chunks; one yield per row is slow to send.
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _formatter(columns, fmt):
+    """Return the header lines and a function that formats one row as a line."""
+    names = [name for name, _ in columns]
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        return [writer.writerow(names)], writer.writerow
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return [], lambda row: encoder.encode(dict(zip(names, row))) + '\n'
+
+
+def stream(dataset, fmt, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """Yield the export as text chunks."""
+    columns, queryset = DATASETS[dataset](**filters)
+    header, format_row = _formatter(columns, fmt)
+    rows = queryset.iterator(chunk_size=chunk_size)
+    return _batched(itertools.chain(header, map(format_row, rows)))
+
+
+async def astream(dataset, fmt, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """
+    ``stream`` as an async generator, for ASGI. Django would otherwise read a
+    synchronous iterator to the end before sending the first byte.
+    """
+    columns, queryset = DATASETS[dataset](**filters)
+    header, format_row = _formatter(columns, fmt)
+    # aiterator() would start a values_list() query on the event loop, so
+    # chunks of the ordinary iterator are fetched on the worker thread.
+    rows = queryset.iterator(chunk_size=chunk_size)
+    fetch = sync_to_async(lambda: list(itertools.islice(rows, chunk_size)))
+    buffer = header
+    size = sum(len(line) for line in header)
+    while chunk := await fetch():
+        for row in chunk:
+            line = format_row(row)
+            buffer.append(line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+    if buffer:
+        yield ''.join(buffer)
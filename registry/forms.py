@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import User, ProjectSite, PlantationRecord
+from django.conf import settings
+from .models import User, ProjectSite, PlantationRecord, UploadSession
 from django.contrib.auth.forms import AuthenticationForm
+from PIL import Image
+from . import geo, resumable, uploads
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -19,6 +22,12 @@ class UserRegistrationForm(UserCreationForm):
             self.fields[field].widget.attrs.update({'class': 'form-control'})
 
 class ProjectSiteForm(forms.ModelForm):
+    confirm_nearby = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text='This is a separate site even though others are registered close by.',
+    )
+
     class Meta:
         model = ProjectSite
         fields = ['name', 'location_lat', 'location_lng', 'ecosystem_type', 'area_ha']
@@ -30,10 +39,50 @@ class ProjectSiteForm(forms.ModelForm):
             'area_ha': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        lat = cleaned_data.get('location_lat')
+        lng = cleaned_data.get('location_lng')
+        self.nearby_sites = []
+        if lat is None or lng is None:
+            return cleaned_data
+
+        radius_km = getattr(settings, 'REGISTRY_DUPLICATE_SITE_RADIUS_KM', 0.5)
+        queryset = ProjectSite.objects.all()
+        if self.instance.pk:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        self.nearby_sites = geo.sites_within(lat, lng, radius_km, queryset)
+        if self.nearby_sites and not cleaned_data.get('confirm_nearby'):
+            names = ', '.join(
+                f'{site.name} ({site.distance_km * 1000:.0f} m)' for site in self.nearby_sites[:3]
+            )
+            raise forms.ValidationError(
+                f'This location is within {radius_km * 1000:.0f} m of an existing site: {names}. '
+                'Tick the confirmation box if this really is a separate site.',
+                code='nearby_site',
+            )
+        return cleaned_data
+
+class HeaderCheckedImageField(forms.ImageField):
+    """An ImageField that reads only the upload's header; see ``uploads.inspect_image``."""
+
+    def to_python(self, data):
+        # FileField, not ImageField: that one has Pillow verify the whole file.
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        fmt, _, _ = uploads.inspect_image(f)
+        f.content_type = Image.MIME.get(fmt)
+        return f
+
 class PlantationRecordForm(forms.ModelForm):
+    # Set by resumable-upload.js once the photo has been sent in chunks.
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = PlantationRecord
         fields = ['project_site', 'date_planted', 'species', 'number_of_plants', 'uploaded_images']
+        field_classes = {'uploaded_images': HeaderCheckedImageField}
         widgets = {
             'project_site': forms.Select(attrs={'class': 'form-select'}),
             'date_planted': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
@@ -44,10 +93,39 @@ class PlantationRecordForm(forms.ModelForm):
     
     def __init__(self, user=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.user = user
+        self.upload = None
         if user:
             self.fields['project_site'].queryset = ProjectSite.objects.filter(created_by=user)
+
+    def clean_upload_id(self):
+        upload_id = self.cleaned_data.get('upload_id')
+        if upload_id is None:
+            return None
+        self.upload = UploadSession.objects.filter(pk=upload_id, owner=self.user).first()
+        if self.upload is None:
+            raise forms.ValidationError('The uploaded photo was not found; upload it again.', code='unknown_upload')
+        resumable.check(self.upload)
+        return upload_id
+
+    def save(self, commit=True):
+        if self.upload is not None:
+            self.instance.uploaded_images = resumable.attach(self.upload)
+        return super().save(commit)
+
 class LoginForm(AuthenticationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         for field_name, field in self.fields.items():
-            field.widget.attrs.update({'class': 'form-control'})
\ No newline at end of file
+            field.widget.attrs.update({'class': 'form-control'})
+
+class PlantationImportForm(forms.Form):
+    data_file = forms.FileField(
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.geojson,.json'}),
+        help_text='CSV or GeoJSON with project_site, date_planted, species and number_of_plants.',
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text='Validate the file without saving any records.',
+    )
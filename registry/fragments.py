@@ -0,0 +1,96 @@
+"""
+Generation keys for cached dashboard fragments.
+
+Dashboard templates cache their slow-changing sections with ``{% cache %}``
+and vary them on a generation. There is one generation per owner and one
+global generation. Model signals and the bulk write paths bump the
+generations of everyone affected, so the next render misses the cache and
+rebuilds the fragment. Old fragments are never deleted; nothing looks them
+up any more and they expire. A warm render of an unchanged fragment costs
+one cache lookup and no queries.
+
+The JSON API validates its pages against generations too, one per
+resource (sites, records, credits) and viewer: an owner, or ``all`` for
+admins. ``bump`` is told which resources a write touched, so a credit
+being issued leaves the site pages of every client valid, and one owner's
+edit leaves every other owner's pages valid.
+
+A bump stores a fresh random token rather than incrementing a number. Two
+workers bumping at once through a file cache can therefore never collapse
+into one value. A generation that goes missing (evicted, or the cache was
+cleared) is replaced by a fresh token too, so an old fragment can never be
+served under it again. Bumps happen immediately and again after commit.
+A render that runs between the write and the commit may cache data from
+before the commit, and the second bump orphans that fragment.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL = 'global'
+API_RESOURCES = ('sites', 'records', 'credits')
+
+
+def _key(scope):
+    return f'registry:fragments:generation:{scope}'
+
+
+def fragment_ttl():
+    return getattr(settings, 'REGISTRY_FRAGMENT_CACHE_TTL', 3600)
+
+
+def generation(scope=GLOBAL):
+    key = _key(scope)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        value = cache.get(key)
+    return value
+
+
+async def ageneration(scope=GLOBAL):
+    """``generation`` for async views."""
+    key = _key(scope)
+    value = await cache.aget(key)
+    if value is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        value = await cache.aget(key)
+    return value
+
+
+def _bump_now(scopes):
+    cache.set_many({_key(scope): uuid.uuid4().hex for scope in scopes}, timeout=None)
+
+
+def api_scope(resource, owner_id=None):
+    """The generation of ``resource`` API pages as one owner, or an admin, sees them."""
+    return f'api:{resource}:{"all" if owner_id is None else owner_id}'
+
+
+def bump(*owner_ids, resources=API_RESOURCES):
+    """
+    Invalidate the fragments of these owners and the global ones, and the
+    API pages of ``resources`` as these owners and admins see them.
+    """
+    owners = {owner_id for owner_id in owner_ids if owner_id is not None}
+    scopes = {GLOBAL} | owners | {api_scope(resource, owner) for resource in resources for owner in [*owners, None]}
+    _bump_now(scopes)
+    transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def context(owner_id=None):
+    """Template context for ``{% cache fragment_ttl name ... fragment_generation %}``."""
+    return {
+        'fragment_ttl': fragment_ttl(),
+        'fragment_generation': generation(GLOBAL if owner_id is None else owner_id),
+    }
+
+
+async def acontext(owner_id=None):
+    """``context`` for async views."""
+    return {
+        'fragment_ttl': fragment_ttl(),
+        'fragment_generation': await ageneration(GLOBAL if owner_id is None else owner_id),
+    }
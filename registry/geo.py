@@ -0,0 +1,156 @@
+"""
+Geohash grid index for project sites.
+
+Every ``ProjectSite`` stores the geohash of its coordinates in an indexed
+column. A radius query picks the geohash precision whose cells are at least
+as large as the radius, then scans the 3x3 block of cells around the point
+as index range scans. Only the few rows inside those cells are checked with
+exact haversine distance. No GIS extension is required.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+
+# Approximate cell height/width in km at each precision (at the equator).
+CELL_SIZE_KM = {
+    1: (4992.6, 5009.4),
+    2: (624.1, 1252.3),
+    3: (156.0, 156.5),
+    4: (19.5, 39.1),
+    5: (4.9, 4.9),
+    6: (0.61, 1.2),
+    7: (0.152, 0.153),
+    8: (0.019, 0.038),
+    9: (0.0048, 0.0048),
+}
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    lat, lng = float(lat), float(lng)
+    while len(chars) < precision:
+        interval, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def decode_bounds(geohash):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return lat_range, lng_range
+
+
+def neighbours(geohash):
+    """The cell itself plus the eight cells around it."""
+    (lat_min, lat_max), (lng_min, lng_max) = decode_bounds(geohash)
+    lat_step = lat_max - lat_min
+    lng_step = lng_max - lng_min
+    center_lat = (lat_min + lat_max) / 2
+    center_lng = (lng_min + lng_max) / 2
+    cells = set()
+    for dlat in (-1, 0, 1):
+        lat = center_lat + dlat * lat_step
+        if not -90 <= lat <= 90:
+            continue
+        for dlng in (-1, 0, 1):
+            lng = (center_lng + dlng * lng_step + 180) % 360 - 180
+            cells.add(encode(lat, lng, len(geohash)))
+    return cells
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, map(float, (lat1, lng1, lat2, lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell_radius_km(precision, lat):
+    # A 3x3 block of cells always covers this radius around its centre cell.
+    height, width = CELL_SIZE_KM[precision]
+    return min(height, width * max(math.cos(math.radians(float(lat))), 0.01))
+
+
+def precision_for_radius(radius_km, lat=0.0):
+    """Finest precision whose cells are still at least ``radius_km`` across."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if _cell_radius_km(precision, lat) >= radius_km:
+            return precision
+    return 1
+
+
+def _prefix_range(prefix):
+    # Every geohash starting with ``prefix`` sorts in [prefix, prefix + '~'),
+    # which SQLite answers with an index range scan (unlike LIKE 'x%').
+    return prefix, prefix + '~'
+
+
+def _candidates(queryset, lat, lng, radius_km):
+    from django.db.models import Q
+
+    precision = precision_for_radius(radius_km, lat)
+    condition = Q()
+    for cell in neighbours(encode(lat, lng, precision)):
+        low, high = _prefix_range(cell)
+        condition |= Q(geohash__gte=low, geohash__lt=high)
+    return queryset.filter(condition)
+
+
+def sites_within(lat, lng, radius_km, queryset=None):
+    """
+    Sites within ``radius_km`` of the point, nearest first, each annotated
+    with ``distance_km``.
+    """
+    from .models import ProjectSite
+
+    queryset = ProjectSite.objects.all() if queryset is None else queryset
+    matches = []
+    for site in _candidates(queryset, lat, lng, radius_km):
+        distance = haversine_km(lat, lng, site.location_lat, site.location_lng)
+        if distance <= radius_km:
+            site.distance_km = distance
+            matches.append(site)
+    matches.sort(key=lambda site: site.distance_km)
+    return matches
+
+
+def nearest_sites(lat, lng, count=5, max_radius_km=500.0, queryset=None):
+    """
+    The ``count`` nearest sites within ``max_radius_km``, searched one
+    geohash level at a time from fine to coarse cells until enough are found.
+    """
+    for precision in range(precision_for_radius(1.0, lat), 0, -1):
+        radius = min(_cell_radius_km(precision, lat), max_radius_km)
+        matches = sites_within(lat, lng, radius, queryset)
+        if len(matches) >= count or radius >= max_radius_km:
+            return matches[:count]
+    return sites_within(lat, lng, max_radius_km, queryset)[:count]
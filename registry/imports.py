@@ -0,0 +1,187 @@
+"""
+Bulk import of plantation records from CSV or GeoJSON.
+
+Rows are validated one at a time with the same field rules as
+``PlantationRecordForm``. ``project_site`` references (a site UUID or its
+exact name) resolve against one prefetched map of the uploader's own sites.
+Valid rows are inserted with ``bulk_create`` in batches. Invalid rows are
+collected into an error report instead of aborting the import.
+
+Each batch is committed in its own ``db.write_transaction``, together with
+its stats and fragment bumps. The SQLite write lock is held for one batch
+at a time, never for the whole file, so other writers get their turn in
+between. A file that fails to read halfway keeps the batches committed
+before the failure; ``progress`` is called after every batch with the
+result so far.
+
+CSV files are read row by row. GeoJSON has to be parsed in one piece with
+``json.load``, so GeoJSON files larger than
+``REGISTRY_IMPORT_GEOJSON_MAX_BYTES`` are refused before parsing.
+"""
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+
+from . import db, fragments, stats
+from .forms import PlantationRecordForm
+from .models import ProjectSite, PlantationRecord
+
+IMPORT_FIELDS = ('project_site', 'date_planted', 'species', 'number_of_plants')
+FORMATS = ('csv', 'geojson')
+
+
+def batch_size():
+    return getattr(settings, 'REGISTRY_IMPORT_BATCH_SIZE', 2000)
+
+
+def geojson_max_bytes():
+    return getattr(settings, 'REGISTRY_IMPORT_GEOJSON_MAX_BYTES', 32 * 1024 * 1024)
+
+
+class FileTooLarge(ValueError):
+    pass
+
+
+class RowError:
+    def __init__(self, row_number, errors):
+        self.row_number = row_number
+        self.errors = errors
+
+    def __str__(self):
+        details = '; '.join(f'{field}: {" ".join(messages)}' for field, messages in self.errors.items())
+        return f'Row {self.row_number}: {details}'
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.batches = 0
+        self.errors = []
+
+    @property
+    def rows(self):
+        return self.created + len(self.errors)
+
+
+def detect_format(filename):
+    return 'geojson' if filename.lower().endswith(('.geojson', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield ``(row_number, dict)`` pairs from a binary file object."""
+    if fmt == 'geojson':
+        limit = geojson_max_bytes()
+        data = stream.read(limit + 1)
+        if len(data) > limit:
+            raise FileTooLarge(f'GeoJSON imports may be at most {filesizeformat(limit)}; split the file or use CSV.')
+        collection = json.loads(codecs.decode(data, 'utf-8-sig'))
+        features = collection.get('features', []) if isinstance(collection, dict) else []
+        for number, feature in enumerate(features, start=1):
+            yield number, (feature.get('properties') or {}) if isinstance(feature, dict) else {}
+        return
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    # Row 1 is the header, so data rows are numbered from 2 like a spreadsheet.
+    for number, row in enumerate(reader, start=2):
+        yield number, row
+
+
+def site_map(user):
+    """Map site UUIDs and names to ``(site_id, ecosystem_type)`` for one owner."""
+    sites = {}
+    ambiguous = set()
+    for site_id, name, ecosystem_type in ProjectSite.objects.filter(created_by=user).values_list(
+            'id', 'name', 'ecosystem_type'):
+        sites[str(site_id)] = (site_id, ecosystem_type)
+        key = name.strip().casefold()
+        if key in sites:
+            ambiguous.add(key)
+        sites[key] = (site_id, ecosystem_type)
+    for key in ambiguous:
+        sites[key] = None
+    return sites
+
+
+class RowValidator:
+    def __init__(self, user):
+        self.sites = site_map(user)
+        self.fields = {name: PlantationRecordForm.base_fields[name] for name in IMPORT_FIELDS[1:]}
+
+    def clean(self, row):
+        """Return ``(cleaned_data, errors)`` for one raw row."""
+        cleaned = {}
+        errors = {}
+
+        reference = str(row.get('project_site') or '').strip()
+        site = self.sites.get(reference) or self.sites.get(reference.casefold())
+        if not reference:
+            errors['project_site'] = ['This field is required.']
+        elif reference.casefold() in self.sites and site is None:
+            errors['project_site'] = ['Several of your sites have this name; use the site ID instead.']
+        elif site is None:
+            errors['project_site'] = ['Select one of your own project sites.']
+        else:
+            cleaned['project_site_id'], cleaned['ecosystem_type'] = site
+
+        for name, field in self.fields.items():
+            value = row.get(name)
+            try:
+                cleaned[name] = field.clean(value.strip() if isinstance(value, str) else value)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+        return cleaned, errors
+
+
+@db.write_transaction
+def _insert(user, records, created_per_ecosystem):
+    PlantationRecord.objects.bulk_create(records)
+    stats.bump_many(
+        (user.pk, ecosystem_type, {'total_records': count})
+        for ecosystem_type, count in created_per_ecosystem.items()
+    )
+    fragments.bump(user.pk, resources=('records',))
+
+
+def import_records(user, stream, fmt='csv', dry_run=False, batch=None, progress=None):
+    batch = batch or batch_size()
+    validator = RowValidator(user)
+    result = ImportResult()
+    pending = []
+    created_per_ecosystem = {}
+
+    def flush():
+        if not pending:
+            return
+        if not dry_run:
+            _insert(user, pending, created_per_ecosystem)
+        result.created += len(pending)
+        result.batches += 1
+        pending.clear()
+        created_per_ecosystem.clear()
+        if progress:
+            progress(result)
+
+    for row_number, row in read_rows(stream, fmt):
+        cleaned, errors = validator.clean(row)
+        if errors:
+            result.errors.append(RowError(row_number, errors))
+            continue
+        ecosystem_type = cleaned.pop('ecosystem_type')
+        created_per_ecosystem[ecosystem_type] = created_per_ecosystem.get(ecosystem_type, 0) + 1
+        pending.append(PlantationRecord(uploaded_by=user, **cleaned))
+        if len(pending) >= batch:
+            flush()
+    flush()
+    return result
+
+
+def write_error_report(errors, output):
+    writer = csv.writer(output)
+    writer.writerow(['row', 'field', 'error'])
+    for error in errors:
+        for field, messages in error.errors.items():
+            for message in messages:
+                writer.writerow([error.row_number, field, message])
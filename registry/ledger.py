@@ -0,0 +1,260 @@
+"""
+Hash-chained credit ledger.
+
+Every issued credit gets a ``LedgerEntry`` whose hash commits to the entry
+before it. Each block of ``REGISTRY_LEDGER_CHECKPOINT_INTERVAL`` entries is sealed
+with a ``LedgerCheckpoint`` holding the block's Merkle root, and checkpoints
+are chained to each other. A single credit is proven with a Merkle audit path
+of ``log2(interval)`` hashes plus its checkpoint. The whole ledger is
+verified in one ordered pass that only ever holds one block in memory.
+"""
+import hashlib
+
+from django.apps import apps as global_apps
+from django.conf import settings
+
+GENESIS_HASH = '0' * 64
+AUDIT_CHUNK_SIZE = 2000
+
+
+def checkpoint_interval():
+    return getattr(settings, 'REGISTRY_LEDGER_CHECKPOINT_INTERVAL', 1024)
+
+
+def compute_entry_hash(sequence, prev_hash, txn_hash, project_site_uuid, plantation_record_uuid, year, credits_issued):
+    data = '|'.join([
+        str(sequence), prev_hash, txn_hash, str(project_site_uuid), str(plantation_record_uuid),
+        str(year), f'{credits_issued:.2f}',
+    ])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def compute_checkpoint_hash(prev_checkpoint_hash, first_sequence, last_sequence, merkle_root):
+    data = f'{prev_checkpoint_hash}|{first_sequence}|{last_sequence}|{merkle_root}'
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+# -------------------
+# Merkle trees
+# -------------------
+def _leaf(entry_hash):
+    return hashlib.sha256(b'\x00' + bytes.fromhex(entry_hash)).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _next_level(level):
+    # An unpaired last node is carried up unchanged.
+    paired = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        paired.append(level[-1])
+    return paired
+
+
+def merkle_root(entry_hashes):
+    level = [_leaf(h) for h in entry_hashes]
+    if not level:
+        return GENESIS_HASH
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+
+def merkle_path(entry_hashes, index):
+    """Audit path for ``entry_hashes[index]`` as a list of ``(side, sibling_hex)``."""
+    level = [_leaf(h) for h in entry_hashes]
+    path = []
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append(('L' if sibling < index else 'R', level[sibling].hex()))
+        level = _next_level(level)
+        index //= 2
+    return path
+
+
+def verify_path(entry_hash, path, root):
+    node = _leaf(entry_hash)
+    for side, sibling in path:
+        sibling = bytes.fromhex(sibling)
+        node = _node(sibling, node) if side == 'L' else _node(node, sibling)
+    return node.hex() == root
+
+
+# -------------------
+# Appending
+# -------------------
+def append(credits, apps=global_apps):
+    """
+    Chain ``credits`` onto the ledger in the given order and seal any block
+    that becomes full. Call inside the transaction that creates the credits.
+    """
+    LedgerEntry = apps.get_model('registry', 'LedgerEntry')
+    tail = LedgerEntry.objects.order_by('-sequence').values_list('sequence', 'entry_hash').first()
+    sequence, prev_hash = tail or (0, GENESIS_HASH)
+
+    entries = []
+    for credit in credits:
+        sequence += 1
+        entry = LedgerEntry(
+            sequence=sequence,
+            credit_id=credit.pk,
+            txn_hash=credit.txn_hash,
+            project_site_uuid=credit.project_site_id,
+            plantation_record_uuid=credit.plantation_record_id,
+            year=credit.year,
+            credits_issued=credit.credits_issued,
+            prev_hash=prev_hash,
+        )
+        entry.entry_hash = prev_hash = compute_entry_hash(
+            entry.sequence, entry.prev_hash, entry.txn_hash, entry.project_site_uuid,
+            entry.plantation_record_uuid, entry.year, entry.credits_issued,
+        )
+        entries.append(entry)
+    if entries:
+        LedgerEntry.objects.bulk_create(entries)
+        seal_checkpoints(sequence, apps)
+    return entries
+
+
+def seal_checkpoints(tail_sequence, apps=global_apps):
+    LedgerEntry = apps.get_model('registry', 'LedgerEntry')
+    LedgerCheckpoint = apps.get_model('registry', 'LedgerCheckpoint')
+    interval = checkpoint_interval()
+
+    last = LedgerCheckpoint.objects.order_by('-last_sequence').values_list('last_sequence', 'checkpoint_hash').first()
+    last_sequence, prev_checkpoint_hash = last or (0, GENESIS_HASH)
+    while tail_sequence - last_sequence >= interval:
+        first, last_sequence = last_sequence + 1, last_sequence + interval
+        hashes = list(
+            LedgerEntry.objects.filter(sequence__range=(first, last_sequence))
+            .order_by('sequence').values_list('entry_hash', flat=True)
+        )
+        root = merkle_root(hashes)
+        checkpoint_hash = compute_checkpoint_hash(prev_checkpoint_hash, first, last_sequence, root)
+        LedgerCheckpoint.objects.create(
+            first_sequence=first,
+            last_sequence=last_sequence,
+            merkle_root=root,
+            prev_checkpoint_hash=prev_checkpoint_hash,
+            checkpoint_hash=checkpoint_hash,
+        )
+        prev_checkpoint_hash = checkpoint_hash
+
+
+def backfill(apps=global_apps, chunk_size=AUDIT_CHUNK_SIZE):
+    """Append every credit that has no ledger entry yet, oldest first."""
+    CarbonCredit = apps.get_model('registry', 'CarbonCredit')
+    pending = CarbonCredit.objects.filter(ledger_entry__isnull=True).order_by('issued_date', 'id')
+    batch = []
+    for credit in pending.iterator(chunk_size):
+        batch.append(credit)
+        if len(batch) >= chunk_size:
+            append(batch, apps)
+            batch = []
+    append(batch, apps)
+
+
+# -------------------
+# Proofs and audits
+# -------------------
+def prove(entry):
+    """
+    Inclusion proof for a ``LedgerEntry``: its checkpoint and Merkle audit
+    path. Entries in the still-open tail block have no checkpoint yet and
+    are covered by the hash chain alone.
+    """
+    from .models import LedgerEntry, LedgerCheckpoint
+
+    checkpoint = LedgerCheckpoint.objects.filter(
+        first_sequence__lte=entry.sequence, last_sequence__gte=entry.sequence,
+    ).first()
+    proof = {
+        'sequence': entry.sequence,
+        'entry_hash': entry.entry_hash,
+        'checkpoint': None,
+        'path': [],
+    }
+    if checkpoint is None:
+        return proof
+    hashes = list(
+        LedgerEntry.objects.filter(sequence__range=(checkpoint.first_sequence, checkpoint.last_sequence))
+        .order_by('sequence').values_list('entry_hash', flat=True)
+    )
+    proof['checkpoint'] = {
+        'first_sequence': checkpoint.first_sequence,
+        'last_sequence': checkpoint.last_sequence,
+        'merkle_root': checkpoint.merkle_root,
+        'checkpoint_hash': checkpoint.checkpoint_hash,
+    }
+    proof['path'] = merkle_path(hashes, entry.sequence - checkpoint.first_sequence)
+    return proof
+
+
+def audit(chunk_size=AUDIT_CHUNK_SIZE):
+    """
+    Verify the whole ledger in one ordered pass, yielding a message for
+    every problem found. Memory use is bounded by one checkpoint block.
+    """
+    from .models import CarbonCredit, LedgerEntry, LedgerCheckpoint
+
+    rows = LedgerEntry.objects.order_by('sequence').values_list(
+        'sequence', 'txn_hash', 'project_site_uuid', 'plantation_record_uuid', 'year', 'credits_issued',
+        'prev_hash', 'entry_hash', 'credit__txn_hash', 'credit__credits_issued',
+    ).iterator(chunk_size)
+    checkpoints = LedgerCheckpoint.objects.order_by('first_sequence').iterator(chunk_size)
+
+    expected_sequence = 1
+    prev_hash = GENESIS_HASH
+    prev_checkpoint_hash = GENESIS_HASH
+    checkpoint = next(checkpoints, None)
+    block = []
+
+    for (sequence, txn_hash, site_uuid, record_uuid, year, credits_issued,
+         stored_prev_hash, entry_hash, credit_txn_hash, credit_amount) in rows:
+        if sequence != expected_sequence:
+            yield f'Entry #{sequence}: expected sequence {expected_sequence} (entries missing).'
+        if stored_prev_hash != prev_hash:
+            yield f'Entry #{sequence}: chain broken, prev_hash does not match entry #{sequence - 1}.'
+        recomputed = compute_entry_hash(
+            sequence, stored_prev_hash, txn_hash, site_uuid, record_uuid, year, credits_issued,
+        )
+        if recomputed != entry_hash:
+            yield f'Entry #{sequence}: entry_hash does not match its contents.'
+        if credit_txn_hash is None:
+            yield f'Entry #{sequence}: credit {txn_hash[:16]} no longer exists.'
+        elif credit_txn_hash != txn_hash or credit_amount != credits_issued:
+            yield f'Entry #{sequence}: credit {txn_hash[:16]} differs from its ledger entry.'
+
+        expected_sequence = sequence + 1
+        prev_hash = entry_hash
+
+        if checkpoint is not None and checkpoint.first_sequence <= sequence <= checkpoint.last_sequence:
+            block.append(entry_hash)
+            if sequence == checkpoint.last_sequence:
+                yield from _check_checkpoint(checkpoint, block, prev_checkpoint_hash)
+                prev_checkpoint_hash = checkpoint.checkpoint_hash
+                checkpoint = next(checkpoints, None)
+                block = []
+
+    if checkpoint is not None:
+        yield f'Checkpoint {checkpoint.first_sequence}-{checkpoint.last_sequence} covers entries that do not exist.'
+
+    unrecorded = CarbonCredit.objects.filter(ledger_entry__isnull=True).count()
+    if unrecorded:
+        yield f'{unrecorded} credits have no ledger entry.'
+
+
+def _check_checkpoint(checkpoint, block, prev_checkpoint_hash):
+    label = f'Checkpoint {checkpoint.first_sequence}-{checkpoint.last_sequence}'
+    if len(block) != checkpoint.last_sequence - checkpoint.first_sequence + 1:
+        yield f'{label}: block is incomplete.'
+    if merkle_root(block) != checkpoint.merkle_root:
+        yield f'{label}: Merkle root does not match its entries.'
+    expected = compute_checkpoint_hash(
+        prev_checkpoint_hash, checkpoint.first_sequence, checkpoint.last_sequence, checkpoint.merkle_root,
+    )
+    if checkpoint.prev_checkpoint_hash != prev_checkpoint_hash or checkpoint.checkpoint_hash != expected:
+        yield f'{label}: checkpoint chain broken.'
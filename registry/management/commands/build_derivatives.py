@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from registry import derivatives
+from registry.models import PlantationRecord, ImageDerivative, ImageHash
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnails, review-size derivatives and perceptual hashes for uploaded evidence images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only process images missing a derivative or their perceptual hash.')
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that already exist.')
+
+    def handle(self, *args, **options):
+        sources = (
+            PlantationRecord.objects.exclude(uploaded_images='').exclude(uploaded_images__isnull=True)
+            .values_list('uploaded_images', flat=True).distinct()
+        )
+        complete = set()
+        if options['missing'] and not options['force']:
+            per_source = {}
+            for source, kind in ImageDerivative.objects.values_list('source', 'kind'):
+                per_source.setdefault(source, set()).add(kind)
+            complete = {s for s, kinds in per_source.items() if kinds >= set(derivatives.DERIVATIVE_SPECS)}
+            complete &= set(ImageHash.objects.values_list('source', flat=True))
+
+        built = 0
+        for source in sources.iterator():
+            if source in complete:
+                continue
+            hashed = ImageHash.objects.filter(source=source).exists()
+            if derivatives.build(source, force=options['force']) or not hashed:
+                built += 1
+                self.stdout.write(f'Built derivatives for {source}')
+        self.stdout.write(self.style.SUCCESS(f'Processed {built} images.'))
@@ -0,0 +1,182 @@
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+
+from registry import db, synthetic
+from registry.models import User
+
+# The current deployment (gunicorn sync workers) and the ASGI one from asgi.py.
+SERVERS = {
+    'wsgi': ['-m', 'gunicorn', 'blue_carbon_registry.wsgi:application', '--workers', '{workers}',
+             '--bind', '127.0.0.1:{port}', '--log-level', 'warning'],
+    'asgi': ['-m', 'uvicorn', 'blue_carbon_registry.asgi:application', '--workers', '{workers}',
+             '--host', '127.0.0.1', '--port', '{port}', '--lifespan', 'off', '--log-level', 'warning',
+             '--no-access-log'],
+}
+STARTUP_TIMEOUT = 30
+# Slow clients download the records export at about this many bytes per second.
+SLOW_CLIENT_RATE = 256 * 1024
+SLOW_CLIENT_READ = 16 * 1024
+
+
+def wait_for_port(port, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'Server exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Server did not listen on port {port} within {STARTUP_TIMEOUT}s.')
+
+
+def run_load(port, targets, concurrency, duration):
+    """
+    ``concurrency`` clients request ``targets`` (path, cookie) round-robin
+    for ``duration`` seconds. Returns the latencies and the error count.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        number = offset
+        mine = []
+        failed = 0
+        while time.monotonic() < deadline:
+            path, cookie = targets[number % len(targets)]
+            number += 1
+            started = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                conn.request('GET', path, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                if response.status != 200:
+                    failed += 1
+                    continue
+            except OSError:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+
+def slow_download(port, path, cookie, deadline):
+    """Download ``path`` over and over at ``SLOW_CLIENT_RATE`` until ``deadline``."""
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            conn.request('GET', path, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            while time.monotonic() < deadline and response.read(SLOW_CLIENT_READ):
+                time.sleep(SLOW_CLIENT_READ / SLOW_CLIENT_RATE)
+            conn.close()
+        except OSError:
+            time.sleep(0.1)
+
+
+def session_cookie(user):
+    client = Client()
+    client.force_login(user)
+    return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve a scratch database of synthetic data with gunicorn sync workers and with uvicorn, '
+        'load both with concurrent dashboard reads and compare throughput and latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=20000, help='Synthetic plantation records.')
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes per server.')
+        parser.add_argument('--concurrency', default='1,8,32',
+                            help='Comma-separated numbers of concurrent clients.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per measurement.')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Clients downloading the records export slowly while the dashboards are read.')
+        parser.add_argument('--servers', default='wsgi,asgi', help=f'Any of {", ".join(SERVERS)}.')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        servers = [name.strip() for name in options['servers'].split(',') if name.strip()]
+        unknown = set(servers) - set(SERVERS)
+        if unknown:
+            raise CommandError(f'Unknown server: {", ".join(sorted(unknown))}')
+        levels = [int(value) for value in options['concurrency'].split(',') if value.strip()]
+
+        cache_dir = tempfile.mkdtemp(prefix='registry-load-cache-')
+        try:
+            with db.scratch_database() as path:
+                synthetic.generate(records=options['records'])
+                admin = User.objects.get(username=f'{synthetic.SYNTHETIC_PREFIX}-admin')
+                owner = User.objects.filter(role__in=['NGO', 'COMMUNITY']).order_by('-stats__total_records').first()
+                owner_cookie, admin_cookie = session_cookie(owner), session_cookie(admin)
+                connections.close_all()
+
+                targets = [('/', ''), ('/ngo-dashboard/', owner_cookie), ('/admin-dashboard/', admin_cookie)]
+                slow_target = ('/export/records.csv', admin_cookie)
+                env = dict(os.environ, REGISTRY_DATABASE=path, REGISTRY_CACHE_DIR=cache_dir,
+                           DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'blue_carbon_registry.settings'))
+                for server in servers:
+                    self.run_server(server, env, targets, slow_target, levels, options)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def run_server(self, server, env, targets, slow_target, levels, options):
+        port = options['port']
+        command = [sys.executable] + [part.format(workers=options['workers'], port=port) for part in SERVERS[server]]
+        process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+        try:
+            wait_for_port(port, process)
+            run_load(port, targets, 1, 1.0)  # warm the workers and the fragment cache
+            slow = f', {options["slow_clients"]} slow export downloads' if options['slow_clients'] else ''
+            self.stdout.write(f'{server} ({options["workers"]} workers{slow}):')
+            for concurrency in levels:
+                deadline = time.monotonic() + options['duration']
+                downloads = [
+                    threading.Thread(target=slow_download, args=(port, *slow_target, deadline))
+                    for _ in range(options['slow_clients'])
+                ]
+                for download in downloads:
+                    download.start()
+                latencies, errors = run_load(port, targets, concurrency, options['duration'])
+                for download in downloads:
+                    download.join()
+                if not latencies:
+                    raise CommandError(f'{server}: every request failed.')
+                p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+                self.stdout.write(
+                    f'  {concurrency:>4} clients  {len(latencies) / options["duration"]:>8.1f} req/s   '
+                    f'median {statistics.median(latencies) * 1000:>8.1f} ms   p95 {p95 * 1000:>8.1f} ms   '
+                    f'{errors} errors'
+                )
+        finally:
+            process.terminate()
+            process.wait(timeout=STARTUP_TIMEOUT)
@@ -0,0 +1,95 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from registry.models import ImageDerivative, ImageHash, PlantationRecord
+from registry.storage import content_name, file_digest, is_content_name
+
+IMAGE_DIRECTORY = 'plantation_images'
+
+
+def rekey(name, target=None):
+    """
+    Point the derivatives and hash of ``name`` at ``target``, except those
+    ``target`` already has. Whatever is left of ``name`` is deleted.
+    """
+    derivatives = ImageDerivative.objects.filter(source=name)
+    if target is not None:
+        taken = ImageDerivative.objects.filter(source=target).values_list('kind', flat=True)
+        derivatives.exclude(kind__in=list(taken)).update(source=target)
+        if not ImageHash.objects.filter(source=target).exists():
+            ImageHash.objects.filter(source=name).update(source=target)
+    for derivative in derivatives:
+        derivative.delete()
+        # Derivative files are content-addressed too and may be shared.
+        if not ImageDerivative.objects.filter(file=derivative.file.name).exists():
+            derivative.file.delete(save=False)
+    ImageHash.objects.filter(source=name).delete()
+
+
+class Command(BaseCommand):
+    help = 'Move existing plantation images into content-addressed storage and drop duplicate copies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without touching files.')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Delete legacy image files that no record references instead of storing them.')
+
+    def handle(self, *args, **options):
+        storage = PlantationRecord._meta.get_field('uploaded_images').storage
+        dry_run = options['dry_run']
+        moved = freed = missing = 0
+        seen_digests = set()
+
+        def relocate(name):
+            nonlocal freed
+            path = storage.path(name)
+            size = os.path.getsize(path)
+            digest = file_digest(path)
+            target = content_name(os.path.dirname(name), digest, name)
+            if digest in seen_digests or storage.exists(target):
+                freed += size
+            seen_digests.add(digest)
+            if dry_run:
+                return target
+            target = storage.adopt(path, name)
+            # update() below sends no signals, so the derivative rows are moved here.
+            rekey(name, target)
+            return target
+
+        referenced = set(
+            PlantationRecord.objects.exclude(uploaded_images='').exclude(uploaded_images__isnull=True)
+            .values_list('uploaded_images', flat=True).distinct()
+        )
+        for name in sorted(referenced):
+            if is_content_name(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Missing file for {name}')
+                continue
+            target = relocate(name)
+            moved += 1
+            self.stdout.write(f'{name} -> {target}')
+            if not dry_run:
+                PlantationRecord.objects.filter(uploaded_images=name).update(uploaded_images=target)
+
+        root = storage.path(IMAGE_DIRECTORY)
+        for entry in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            name = f'{IMAGE_DIRECTORY}/{entry}'
+            if name in referenced or not os.path.isfile(storage.path(name)):
+                continue
+            if options['delete_orphans']:
+                freed += os.path.getsize(storage.path(name))
+                self.stdout.write(f'{name} deleted (unreferenced)')
+                if not dry_run:
+                    storage.delete(name)
+                    rekey(name)
+            else:
+                self.stdout.write(f'{name} -> {relocate(name)} (unreferenced)')
+                moved += 1
+
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved} files into content-addressed storage, freeing {freed} bytes; {missing} missing.'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from registry import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream carbon credits or plantation records as CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--year')
+        parser.add_argument('--ecosystem', dest='ecosystem_type')
+        parser.add_argument('--organization')
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=exports.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            # call_command(year=2024) passes an int, the command line a string.
+            year = exports.parse_year('' if options['year'] is None else str(options['year']))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        chunks = exports.stream(
+            options['dataset'], options['fmt'], chunk_size=options['chunk_size'],
+            year=year, ecosystem_type=options['ecosystem_type'], organization=options['organization'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registry import synthetic
+from registry.models import User
+
+
+class Command(BaseCommand):
+    help = 'Bulk-insert seedable synthetic organizations, sites, records and credits for load and benchmark runs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=1000, help='Plantation records to create.')
+        parser.add_argument('--records-per-site', type=int, default=10)
+        parser.add_argument('--verified-ratio', type=float, default=0.75)
+        parser.add_argument('--organizations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f'{synthetic.SYNTHETIC_PREFIX}-').exists():
+            raise CommandError('Synthetic data already exists in this database.')
+        started = time.perf_counter()
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {result.records} records, {result.credits} credits')
+
+        result = synthetic.generate(
+            records=options['records'],
+            records_per_site=options['records_per_site'],
+            verified_ratio=options['verified_ratio'],
+            organizations=options['organizations'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.users} users, {result.sites} sites, {result.records} records and '
+            f'{result.credits} credits in {elapsed:.1f}s ({result.records / elapsed:.0f} records/s).'
+        ))
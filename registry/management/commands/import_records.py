@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registry import imports
+from registry.models import User
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import plantation records from a CSV or GeoJSON file on behalf of a user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username that owns the sites and uploads the records.')
+        parser.add_argument('--format', dest='fmt', choices=imports.FORMATS,
+                            help='Defaults to geojson for .geojson/.json files, csv otherwise.')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; do not save records.')
+        parser.add_argument('--errors', help='Write the rejected-row report to this CSV file.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['user']}.")
+
+        fmt = options['fmt'] or imports.detect_format(options['path'])
+        def progress(result):
+            self.stdout.write(f'Batch {result.batches}: {result.created} records so far, {len(result.errors)} rejected.')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = imports.import_records(
+                    user, stream, fmt, dry_run=options['dry_run'], batch=options['batch_size'], progress=progress,
+                )
+        except imports.FileTooLarge as exc:
+            raise CommandError(str(exc))
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as output:
+                imports.write_error_report(result.errors, output)
+        elif result.errors:
+            imports.write_error_report(result.errors, sys.stderr)
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created} of {result.rows} rows; {len(result.errors)} rejected.'
+        ))
@@ -0,0 +1,62 @@
+from argparse import ArgumentTypeError
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand
+
+from registry.credits import CreditEngine, ECOSYSTEM_MULTIPLIERS, BASE_CREDITS_PER_PLANT
+from registry.models import PlantationRecord, CarbonCredit
+
+
+def rate(value):
+    """A non-negative decimal, for ``--base-rate`` and multiplier values."""
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ArgumentTypeError(f'{value!r} is not a number.')
+    if not number.is_finite() or number < 0:
+        raise ArgumentTypeError(f'{value!r} must be a non-negative number.')
+    return number
+
+
+def multiplier(value):
+    """An ``ECOSYSTEM=VALUE`` override, as an ``(ecosystem_type, Decimal)`` pair."""
+    ecosystem_type, separator, number = value.partition('=')
+    ecosystem_type = ecosystem_type.strip().upper()
+    if not separator:
+        raise ArgumentTypeError(f'{value!r} is not ECOSYSTEM=VALUE.')
+    if ecosystem_type not in ECOSYSTEM_MULTIPLIERS:
+        raise ArgumentTypeError(
+            f'Unknown ecosystem {ecosystem_type!r}; expected one of {", ".join(ECOSYSTEM_MULTIPLIERS)}.')
+    return ecosystem_type, rate(number)
+
+
+class Command(BaseCommand):
+    help = 'Price plantation records with the credit engine and compare against credits already issued.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Only price records planted in this year.')
+        parser.add_argument('--base-rate', type=rate, default=BASE_CREDITS_PER_PLANT,
+                            help='Credits per plant before the ecosystem multiplier.')
+        parser.add_argument('--multiplier', type=multiplier, action='append', default=[], metavar='ECOSYSTEM=VALUE',
+                            help='Override an ecosystem multiplier, e.g. MANGROVE=1.6. May be repeated.')
+        parser.add_argument('--verified-only', action='store_true', help='Skip records still pending verification.')
+
+    def handle(self, *args, **options):
+        multipliers = dict(ECOSYSTEM_MULTIPLIERS)
+        multipliers.update(options['multiplier'])
+        engine = CreditEngine(options['base_rate'], multipliers)
+
+        records = PlantationRecord.objects.all()
+        if options['year']:
+            records = records.filter(date_planted__year=options['year'])
+        if options['verified_only']:
+            records = records.filter(verified=True)
+
+        count, repriced = engine.total(records)
+        issued = CarbonCredit.objects.filter(plantation_record__in=records).values_list('credits_issued', flat=True)
+        previous = sum(issued.iterator(), Decimal('0'))
+
+        self.stdout.write(f'Records priced: {count}')
+        self.stdout.write(f'Credits under this methodology: {repriced}')
+        self.stdout.write(f'Credits currently issued: {previous}')
+        self.stdout.write(self.style.SUCCESS(f'Difference: {repriced - previous}'))
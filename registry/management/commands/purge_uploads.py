@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from registry import resumable
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove resumable uploads that have been idle for longer than REGISTRY_UPLOAD_SESSION_TTL_HOURS, '
+        'and partial files left without an upload.'
+    )
+
+    def handle(self, *args, **options):
+        removed = resumable.purge()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} abandoned uploads.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from registry import rollups, stats
+from registry.models import RollupBucket
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the registry, organization and ecosystem statistics and the report rollups from scratch.'
+
+    def handle(self, *args, **options):
+        stats.rebuild()
+        rollups.rebuild()
+        totals = stats.registry_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt statistics: {totals.total_sites} sites, {totals.total_records} records, '
+            f'{totals.verified_records} verified, {totals.total_credits} credits; '
+            f'{RollupBucket.objects.count()} rollup buckets.'
+        ))
@@ -0,0 +1,171 @@
+import datetime
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from registry import db, synthetic
+from registry.credits import credits_for_records
+from registry.metrics import RequestSample
+from registry.models import User, PlantationRecord
+
+DEFAULT_SCALES = '1000,100000,1000000'
+WARMUP = 2
+# Regressions above this are flagged by --compare.
+REGRESSION_THRESHOLD = 0.10
+
+
+def measure(action, repeat):
+    """Run ``action`` ``repeat`` times; return latency and query statistics."""
+    for _ in range(WARMUP):
+        action()
+    durations = []
+    queries = []
+    for _ in range(repeat):
+        sample = RequestSample(None)
+        with connection.execute_wrapper(sample):
+            started = time.perf_counter()
+            action()
+            durations.append(time.perf_counter() - started)
+        queries.append(sample.queries)
+    durations.sort()
+    return {
+        'repeat': repeat,
+        'median_ms': round(statistics.median(durations) * 1000, 3),
+        'p95_ms': round(durations[min(len(durations) - 1, int(0.95 * len(durations)))] * 1000, 3),
+        'min_ms': round(durations[0] * 1000, 3),
+        'max_ms': round(durations[-1] * 1000, 3),
+        'queries': int(statistics.median(queries)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the dashboards, record verification, rollup reports and credit calculation against '
+        'synthetic data in scratch databases, and write the results as JSON. Pages render with DEBUG off, '
+        'so static files are first collected into a scratch directory for the manifest to be read from.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default=DEFAULT_SCALES,
+                            help=f'Comma-separated plantation record counts (default {DEFAULT_SCALES}).')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per request benchmark.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default='benchmark-results.json', help='Where to write the JSON results.')
+        parser.add_argument('--compare', metavar='PATH', help='Earlier results to compare against.')
+
+    def handle(self, *args, **options):
+        # Time the code as production runs it, without the debug cursor.
+        settings.DEBUG = False
+        repeat = options['repeat']
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'seed': options['seed'],
+                'repeat': repeat,
+            },
+            'scales': {},
+        }
+        # Without DEBUG, {% static %} needs the manifest collectstatic writes.
+        with tempfile.TemporaryDirectory(prefix='registry-benchmark-static-') as static_root:
+            with override_settings(STATIC_ROOT=static_root):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                for scale in [int(value) for value in options['scales'].split(',') if value.strip()]:
+                    self.stdout.write(f'{scale} records:')
+                    with db.scratch_database():
+                        results['scales'][str(scale)] = self.run_scale(scale, repeat, options['seed'])
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+        if options['compare']:
+            with open(options['compare']) as previous:
+                self.compare(json.load(previous), results)
+
+    def run_scale(self, scale, repeat, seed):
+        started = time.perf_counter()
+        generated = synthetic.generate(records=scale, seed=seed)
+        entry = {'generated': generated.as_dict(), 'generate_seconds': round(time.perf_counter() - started, 2)}
+        self.stdout.write(f'  generated in {entry["generate_seconds"]}s')
+
+        admin = User.objects.get(username=f'{synthetic.SYNTHETIC_PREFIX}-admin')
+        owner = User.objects.filter(role__in=['NGO', 'COMMUNITY']).order_by('-stats__total_records').first()
+        anonymous, ngo_client, admin_client = Client(), Client(), Client()
+        ngo_client.force_login(owner)
+        admin_client.force_login(admin)
+
+        def get(client, name):
+            def action():
+                response = client.get(reverse(name))
+                assert response.status_code == 200, response.status_code
+            return action
+
+        pending = iter(
+            PlantationRecord.objects.filter(verified=False).order_by('upload_date', 'id')
+            .values_list('id', flat=True)[:repeat + WARMUP]
+        )
+
+        def verify():
+            response = admin_client.post(reverse('verify_record', args=[next(pending)]), {'action': 'approve'})
+            assert response.status_code == 302, response.status_code
+
+        def report():
+            response = admin_client.get(reverse('rollup_report'), {'group_by': 'year,ecosystem_type,organization'})
+            assert response.status_code == 200, response.status_code
+
+        def calculate():
+            for _ in credits_for_records(PlantationRecord.objects.all()):
+                pass
+
+        timings = {
+            'home': measure(get(anonymous, 'home'), repeat),
+            'ngo_dashboard': measure(get(ngo_client, 'ngo_dashboard'), repeat),
+            'admin_dashboard': measure(get(admin_client, 'admin_dashboard'), repeat),
+            'verify_record': measure(verify, repeat),
+            'rollup_report': measure(report, repeat),
+            'credit_calculation': measure(calculate, min(repeat, 3)),
+        }
+        timings['credit_calculation']['records_per_second'] = round(
+            scale / (timings['credit_calculation']['median_ms'] / 1000)
+        )
+        for name, timing in timings.items():
+            self.stdout.write(f'  {name:<20} median {timing["median_ms"]:>10.2f} ms   '
+                              f'p95 {timing["p95_ms"]:>10.2f} ms   {timing["queries"]} queries')
+        entry['timings'] = timings
+        return entry
+
+    def compare(self, previous, current):
+        self.stdout.write(f'Compared with {previous["meta"].get("commit")} (median ms):')
+        for scale, entry in current['scales'].items():
+            before = previous['scales'].get(scale, {}).get('timings', {})
+            for name, timing in entry['timings'].items():
+                if name not in before:
+                    continue
+                old, new = before[name]['median_ms'], timing['median_ms']
+                change = (new - old) / old if old else 0
+                line = f'  {scale:>8} {name:<20} {old:>10.2f} -> {new:>10.2f}  {change:+.1%}'
+                self.stdout.write(self.style.ERROR(line) if change > REGRESSION_THRESHOLD else line)
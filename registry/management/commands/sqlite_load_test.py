@@ -0,0 +1,105 @@
+import multiprocessing
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from registry import db, ledger
+from registry.credits import build_credits
+from registry.models import User, ProjectSite, PlantationRecord, CarbonCredit
+from registry.views import calculate_carbon_credits
+
+# What a stock SQLite setup does: rollback journal, deferred transactions.
+UNTUNED_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'mmap_size': 0, 'busy_timeout': 5000}
+
+
+def use_untuned_settings():
+    connections.close_all()
+    options = connections['default'].settings_dict['OPTIONS']
+    options.pop('transaction_mode', None)
+    settings.REGISTRY_SQLITE_PRAGMAS = UNTUNED_PRAGMAS
+
+
+def issue_credit(user_id, site_id, plants):
+    """One verification: a new record, verified, with its credit and ledger entry."""
+    site = ProjectSite.objects.get(pk=site_id)
+    record = PlantationRecord.objects.create(
+        project_site=site, date_planted=timezone.now().date(), species='Rhizophora mucronata',
+        number_of_plants=plants, uploaded_by_id=user_id,
+        verified=True, verified_by_id=user_id, verified_date=timezone.now(),
+    )
+    build_credits([record], [calculate_carbon_credits(record)])[0].save()
+
+
+def run_writer(untuned, writes, user_id, site_id):
+    # Forked from the parent, so settings already point at the scratch database.
+    connections.close_all()
+    write = transaction.atomic()(issue_credit) if untuned else db.write_transaction(issue_credit)
+    done = errors = 0
+    for number in range(writes):
+        try:
+            write(user_id, site_id, 100 + number)
+            done += 1
+        except OperationalError as exc:
+            if not db.is_lock_error(exc):
+                raise
+            errors += 1
+    connections.close_all()
+    return done, errors, db.lock_metrics.snapshot()
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent writer processes against a scratch copy of the schema and report '
+        'lock errors and lock waits. The real database is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Number of writer processes.')
+        parser.add_argument('--writes', type=int, default=200, help='Verifications per writer.')
+        parser.add_argument('--untuned', action='store_true',
+                            help='Use stock SQLite settings and plain atomic() for comparison.')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('The load test only applies to SQLite.')
+        writers, writes, untuned = options['writers'], options['writes'], options['untuned']
+        original_pragmas = getattr(settings, 'REGISTRY_SQLITE_PRAGMAS', {})
+        try:
+            with db.scratch_database():
+                if untuned:
+                    use_untuned_settings()
+                user = User.objects.create_user('load-test', role='NGO')
+                site = ProjectSite.objects.create(
+                    name='Load test site', location_lat=Decimal('22.2587'), location_lng=Decimal('89.9375'),
+                    ecosystem_type='MANGROVE', area_ha=Decimal('10.00'), created_by=user,
+                )
+                connections.close_all()
+
+                started = time.perf_counter()
+                with multiprocessing.get_context('fork').Pool(writers) as pool:
+                    results = pool.starmap(run_writer, [(untuned, writes, user.pk, site.pk)] * writers)
+                elapsed = time.perf_counter() - started
+
+                done = sum(result[0] for result in results)
+                errors = sum(result[1] for result in results)
+                metrics = [result[2] for result in results]
+                problems = list(ledger.audit())
+                credits = CarbonCredit.objects.count()
+        finally:
+            settings.REGISTRY_SQLITE_PRAGMAS = original_pragmas
+
+        self.stdout.write(f'{"untuned" if untuned else "tuned"}: {writers} writers x {writes} verifications')
+        self.stdout.write(f'  committed:        {done} in {elapsed:.2f}s ({done / elapsed:.0f}/s)')
+        self.stdout.write(f'  lock errors:      {errors}')
+        self.stdout.write(f'  retries:          {sum(m["retries"] for m in metrics)}')
+        self.stdout.write(f'  contended begins: {sum(m["contended"] for m in metrics)}')
+        self.stdout.write(f'  lock wait:        {sum(m["wait_seconds"] for m in metrics):.2f}s total, '
+                          f'{max(m["max_wait_seconds"] for m in metrics) * 1000:.0f}ms max')
+        self.stdout.write(f'  ledger:           {credits} credits, {len(problems)} audit problems')
+        if errors or problems or credits != done:
+            raise CommandError('Load test failed.')
+        self.stdout.write(self.style.SUCCESS('No lock errors.'))
@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from registry import events
+
+
+class Command(BaseCommand):
+    help = (
+        'Print change events after a sequence number as JSON Lines. With --cursor-file the last '
+        'sequence printed is saved, so the next run continues where this one stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, help='Print events after this sequence number (default 0).')
+        parser.add_argument('--cursor-file', metavar='PATH',
+                            help='Read the starting sequence from PATH and write the last one back.')
+        parser.add_argument('--limit', type=int, default=events.PAGE_SIZE, help='Events fetched per query.')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events until interrupted.')
+
+    def handle(self, *args, **options):
+        sequence = options['since']
+        path = options['cursor_file']
+        if sequence is None and path and os.path.exists(path):
+            with open(path) as cursor:
+                try:
+                    sequence = int(cursor.read().strip() or 0)
+                except ValueError:
+                    raise CommandError(f'{path} does not hold a sequence number.')
+        sequence = sequence or 0
+
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        try:
+            while True:
+                batch = events.since(sequence, options['limit'])
+                for event in batch:
+                    self.stdout.write(encoder.encode(events.as_dict(event)))
+                if batch:
+                    sequence = batch[-1].sequence
+                    self.save(path, sequence)
+                if len(batch) < options['limit']:
+                    if not options['follow']:
+                        break
+                    time.sleep(events.POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        self.stderr.write(f'Last sequence: {sequence}')
+
+    def save(self, path, sequence):
+        if not path:
+            return
+        # Write then rename, so an interrupted run never leaves a torn cursor.
+        with open(f'{path}.tmp', 'w') as cursor:
+            cursor.write(f'{sequence}\n')
+        os.replace(f'{path}.tmp', path)
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registry import ledger
+from registry.models import LedgerEntry, LedgerCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Verify the hash-chained credit ledger in one streaming pass, or print an inclusion proof for one credit.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ledger.AUDIT_CHUNK_SIZE)
+        parser.add_argument('--prove', metavar='TXN_HASH', help='Print the Merkle inclusion proof for this credit.')
+        parser.add_argument('--backfill', action='store_true', help='Chain credits that have no ledger entry first.')
+
+    def handle(self, *args, **options):
+        if options['prove']:
+            entry = LedgerEntry.objects.filter(txn_hash=options['prove']).first()
+            if entry is None:
+                raise CommandError(f"No ledger entry for credit {options['prove']}.")
+            proof = ledger.prove(entry)
+            self.stdout.write(json.dumps(proof, indent=2))
+            if proof['checkpoint'] is not None and not ledger.verify_path(
+                    entry.entry_hash, proof['path'], proof['checkpoint']['merkle_root']):
+                raise CommandError('Inclusion proof does not verify.')
+            return
+
+        if options['backfill']:
+            ledger.backfill(chunk_size=options['chunk_size'])
+
+        problems = 0
+        for problem in ledger.audit(chunk_size=options['chunk_size']):
+            problems += 1
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'Ledger verification failed with {problems} problems.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ledger verified: {LedgerEntry.objects.count()} entries, '
+            f'{LedgerCheckpoint.objects.count()} checkpoints.'
+        ))
@@ -0,0 +1,258 @@
+"""
+Per-request instrumentation.
+
+``RequestMetricsMiddleware`` measures every routed request: wall time, the
+number of SQL queries and time spent in them (through
+``connection.execute_wrapper``), template render time (through
+``InstrumentedTemplates``, a drop-in for the Django template backend) and
+response size. The same SQL run ``REGISTRY_METRICS_DUPLICATE_QUERIES``
+times or more in one request is flagged as a likely N+1 pattern and logged.
+
+Totals per view are kept as counters. The last ``REGISTRY_METRICS_BUFFER``
+requests are kept in a ring buffer for latency quantiles. Both are exposed
+in Prometheus text format by ``render_prometheus``.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from .db import lock_metrics
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = contextvars.ContextVar('registry_request_metrics', default=None)
+
+
+class RequestSample:
+    __slots__ = (
+        'view', 'method', 'status', 'duration', 'queries', 'sql_seconds', 'template_seconds',
+        'response_bytes', 'duplicate_sql', '_sql_counts',
+    )
+
+    def __init__(self, method):
+        self.view = None
+        self.method = method
+        self.status = None
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+        self.duplicate_sql = []
+        self._sql_counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed as a connection execute wrapper for the request.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+            self._sql_counts[sql] += 1
+
+    def finish(self, threshold):
+        self.duplicate_sql = [(sql, count) for sql, count in self._sql_counts.items() if count >= threshold]
+        self._sql_counts = None
+
+
+class MetricsRegistry:
+    """Thread-safe counters per view plus a ring buffer of recent samples."""
+
+    def __init__(self, size=1000):
+        self._lock = threading.Lock()
+        self.samples = deque(maxlen=size)
+        self.totals = {}
+        self.requests = Counter()
+
+    def record(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+            self.requests[(sample.view, sample.method, sample.status)] += 1
+            totals = self.totals.setdefault(sample.view, [0, 0.0, 0, 0.0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += sample.duration
+            totals[2] += sample.queries
+            totals[3] += sample.sql_seconds
+            totals[4] += sample.template_seconds
+            totals[5] += sample.response_bytes
+            totals[6] += bool(sample.duplicate_sql)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.samples), {view: list(t) for view, t in self.totals.items()}, Counter(self.requests)
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.totals.clear()
+            self.requests.clear()
+
+
+registry = MetricsRegistry(getattr(settings, 'REGISTRY_METRICS_BUFFER', 1000))
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'REGISTRY_METRICS_ENABLED', True)
+        self.threshold = getattr(settings, 'REGISTRY_METRICS_DUPLICATE_QUERIES', 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        sample = RequestSample(request.method)
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _wrap_connections(stack, sample)
+                response = self.get_response(request)
+        finally:
+            sample.duration = time.perf_counter() - started
+            _current.reset(token)
+        return self.record(request, response, sample)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        # Connections belong to the thread the async ORM runs queries on, so
+        # the wrappers are installed and removed there.
+        sample = RequestSample(request.method)
+        token = _current.set(sample)
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            await sync_to_async(_wrap_connections)(stack, sample)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            sample.duration = time.perf_counter() - started
+            _current.reset(token)
+        return self.record(request, response, sample)
+
+    def record(self, request, response, sample):
+        match = request.resolver_match
+        if match is None or match.url_name == 'metrics':
+            return response
+        sample.view = match.view_name
+        sample.status = response.status_code
+        if not response.streaming:
+            sample.response_bytes = len(response.content)
+        sample.finish(self.threshold)
+        for sql, count in sample.duplicate_sql:
+            logger.warning('Possible N+1 in %s: query ran %d times: %s', sample.view, count, sql)
+        registry.record(sample)
+        return response
+
+
+def _wrap_connections(stack, sample):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(sample))
+
+
+class InstrumentedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            sample.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _labels(**labels):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def render_prometheus():
+    samples, totals, requests = registry.snapshot()
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('registry_requests_total', 'counter', 'Requests handled, by view, method and status.')
+    for (view, method, status), count in sorted(requests.items()):
+        lines.append(f'registry_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+    family('registry_request_duration_seconds', 'summary', 'Wall time per request; quantiles over recent requests.')
+    by_view = {}
+    for sample in samples:
+        by_view.setdefault(sample.view, []).append(sample.duration)
+    for view in sorted(totals):
+        durations = sorted(by_view.get(view, ()))
+        for q in QUANTILES if durations else ():
+            lines.append(f'registry_request_duration_seconds{_labels(view=view, quantile=q)} {_quantile(durations, q):.6f}')
+        lines.append(f'registry_request_duration_seconds_sum{_labels(view=view)} {totals[view][1]:.6f}')
+        lines.append(f'registry_request_duration_seconds_count{_labels(view=view)} {totals[view][0]}')
+
+    for index, name, kind, help_text in (
+        (2, 'registry_db_queries_total', 'counter', 'SQL queries executed.'),
+        (3, 'registry_db_query_seconds_total', 'counter', 'Time spent in SQL queries.'),
+        (4, 'registry_template_render_seconds_total', 'counter', 'Time spent rendering templates.'),
+        (5, 'registry_response_bytes_total', 'counter', 'Bytes in non-streaming response bodies.'),
+        (6, 'registry_duplicate_query_requests_total', 'counter', 'Requests that repeated one query (likely N+1).'),
+    ):
+        family(name, kind, help_text)
+        for view in sorted(totals):
+            value = totals[view][index]
+            lines.append(f'{name}{_labels(view=view)} {value:.6f}' if isinstance(value, float)
+                         else f'{name}{_labels(view=view)} {value}')
+
+    locks = lock_metrics.snapshot()
+    for key, name, help_text in (
+        ('transactions', 'registry_db_write_transactions_total', 'Write transactions started.'),
+        ('contended', 'registry_db_write_contended_total', 'Write transactions that waited for the lock.'),
+        ('retries', 'registry_db_write_retries_total', 'Write transactions retried on a locked database.'),
+        ('failures', 'registry_db_write_failures_total', 'Write transactions that failed.'),
+        ('wait_seconds', 'registry_db_write_lock_wait_seconds_total', 'Time spent waiting for the write lock.'),
+    ):
+        family(name, 'counter', help_text)
+        lines.append(f'{name} {locks[key]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_stats(apps, schema_editor):
+    from registry.stats import rebuild
+    rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EcosystemStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_sites', models.IntegerField(default=0)),
+                ('total_records', models.IntegerField(default=0)),
+                ('verified_records', models.IntegerField(default=0)),
+                ('total_credits', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ecosystem_type', models.CharField(choices=[('MANGROVE', 'Mangrove'), ('SEAGRASS', 'Seagrass'), ('MARSH', 'Salt Marsh')], max_length=20, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_sites', models.IntegerField(default=0)),
+                ('total_records', models.IntegerField(default=0)),
+                ('verified_records', models.IntegerField(default=0)),
+                ('total_credits', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='OrganizationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_sites', models.IntegerField(default=0)),
+                ('total_records', models.IntegerField(default=0)),
+                ('verified_records', models.IntegerField(default=0)),
+                ('total_credits', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
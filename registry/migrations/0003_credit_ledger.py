@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def chain_existing_credits(apps, schema_editor):
+    from registry.ledger import backfill
+    backfill(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0002_registry_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_sequence', models.PositiveBigIntegerField(unique=True)),
+                ('last_sequence', models.PositiveBigIntegerField(unique=True)),
+                ('merkle_root', models.CharField(max_length=64)),
+                ('prev_checkpoint_hash', models.CharField(max_length=64)),
+                ('checkpoint_hash', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('sequence', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('txn_hash', models.CharField(max_length=64)),
+                ('project_site_uuid', models.UUIDField()),
+                ('plantation_record_uuid', models.UUIDField()),
+                ('year', models.PositiveIntegerField()),
+                ('credits_issued', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('prev_hash', models.CharField(max_length=64)),
+                ('entry_hash', models.CharField(max_length=64, unique=True)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('credit', models.OneToOneField(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_entry', to='registry.carboncredit')),
+            ],
+        ),
+        migrations.RunPython(chain_existing_credits, migrations.RunPython.noop),
+    ]
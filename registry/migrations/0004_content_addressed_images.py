@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:52
+
+import registry.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0003_credit_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='plantationrecord',
+            name='uploaded_images',
+            field=models.ImageField(blank=True, null=True, storage=registry.storage.plantation_image_storage, upload_to='plantation_images/'),
+        ),
+    ]
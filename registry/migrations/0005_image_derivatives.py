@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:53
+
+import registry.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0004_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(db_index=True, max_length=255)),
+                ('kind', models.CharField(choices=[('THUMB_JPEG', 'Thumbnail (JPEG)'), ('THUMB_WEBP', 'Thumbnail (WebP)'), ('REVIEW', 'Review size (JPEG)')], max_length=20)),
+                ('file', models.ImageField(storage=registry.storage.plantation_image_storage, upload_to='plantation_derivatives/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('source_width', models.PositiveIntegerField()),
+                ('source_height', models.PositiveIntegerField()),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'kind'), name='unique_derivative_per_source')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:56
+
+from django.db import migrations, models
+
+
+def index_sites(apps, schema_editor):
+    from registry.geo import encode
+    ProjectSite = apps.get_model('registry', 'ProjectSite')
+    sites = list(ProjectSite.objects.only('id', 'location_lat', 'location_lng'))
+    for site in sites:
+        site.geohash = encode(site.location_lat, site.location_lng)
+    ProjectSite.objects.bulk_update(sites, ['geohash'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0005_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectsite',
+            name='geohash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(index_sites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0006_site_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(fields=['project_site', '-issued_date'], name='credit_site_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(fields=['issued_date', 'id'], name='credit_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(fields=['year', 'issued_date'], name='credit_year_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantationrecord',
+            index=models.Index(condition=models.Q(('verified', False)), fields=['upload_date', 'id'], name='record_pending_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantationrecord',
+            index=models.Index(fields=['uploaded_by', '-upload_date'], name='record_uploader_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantationrecord',
+            index=models.Index(fields=['date_planted'], name='record_planted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectsite',
+            index=models.Index(fields=['created_by', '-created_date'], name='site_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectsite',
+            index=models.Index(fields=['-created_date'], name='site_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0007_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plantationrecord',
+            index=models.Index(fields=['upload_date', 'id'], name='record_upload_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:40
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+def publish_existing_changes(apps, schema_editor):
+    from registry.events import backfill
+    backfill(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0008_api_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('record.verified', 'Record verified'), ('credit.issued', 'Credit issued')], max_length=32)),
+                ('object_id', models.UUIDField()),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(publish_existing_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    from registry.rollups import rebuild
+    rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0009_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('ecosystem_type', models.CharField(choices=[('MANGROVE', 'Mangrove'), ('SEAGRASS', 'Seagrass'), ('MARSH', 'Salt Marsh')], max_length=20)),
+                ('species', models.CharField(max_length=200)),
+                ('verified_records', models.IntegerField(default=0)),
+                ('total_plants', models.BigIntegerField(default=0)),
+                ('total_credits', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'month'], name='rollup_owner_month_idx'), models.Index(fields=['ecosystem_type', 'month'], name='rollup_ecosystem_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('month', 'ecosystem_type', 'owner', 'species'), name='unique_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registry', '0011_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('dhash', models.BigIntegerField()),
+                ('band0', models.PositiveIntegerField()),
+                ('band1', models.PositiveIntegerField()),
+                ('band2', models.PositiveIntegerField()),
+                ('band3', models.PositiveIntegerField()),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band0'], name='image_hash_band0_idx'), models.Index(fields=['band1'], name='image_hash_band1_idx'), models.Index(fields=['band2'], name='image_hash_band2_idx'), models.Index(fields=['band3'], name='image_hash_band3_idx')],
+            },
+        ),
+    ]
@@ -2,7 +2,9 @@ from django.db import models
 import hashlib
 import uuid
 from django.contrib.auth.models import AbstractUser, Group, Permission
-from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from .geo import encode as geohash_encode
+from .storage import plantation_image_storage
 
 # -------------------
 # Custom User Model
@@ -50,10 +52,25 @@ class ProjectSite(models.Model):
     area_ha = models.DecimalField(max_digits=10, decimal_places=2)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_date = models.DateTimeField(auto_now_add=True)
+    geohash = models.CharField(max_length=12, db_index=True, editable=False, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', '-created_date'], name='site_owner_created_idx'),
+            models.Index(fields=['-created_date'], name='site_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.ecosystem_type}"
 
+    def save(self, *args, **kwargs):
+        # Keep the grid index in step with the coordinates on every save.
+        self.geohash = geohash_encode(self.location_lat, self.location_lng)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'location_lat', 'location_lng'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
 # -------------------
 # Plantation Record
 # -------------------
@@ -63,7 +80,9 @@ class PlantationRecord(models.Model):
     date_planted = models.DateField()
     species = models.CharField(max_length=200)
     number_of_plants = models.PositiveIntegerField()
-    uploaded_images = models.ImageField(upload_to='plantation_images/', blank=True, null=True)
+    uploaded_images = models.ImageField(
+        upload_to='plantation_images/', storage=plantation_image_storage, blank=True, null=True
+    )
     verified = models.BooleanField(default=False)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     upload_date = models.DateTimeField(auto_now_add=True)
@@ -76,6 +95,19 @@ class PlantationRecord(models.Model):
         related_name='verified_records'
     )
 
+    class Meta:
+        indexes = [
+            # Admin verification queue, paged by (upload_date, id). Partial so
+            # it matches the NOT verified filter and skips verified rows.
+            models.Index(
+                fields=['upload_date', 'id'], condition=models.Q(verified=False), name='record_pending_queue_idx'
+            ),
+            models.Index(fields=['uploaded_by', '-upload_date'], name='record_uploader_recent_idx'),
+            # All records in upload order, as the JSON API pages them.
+            models.Index(fields=['upload_date', 'id'], name='record_upload_idx'),
+            models.Index(fields=['date_planted'], name='record_planted_idx'),
+        ]
+
     def __str__(self):
         return f"{self.species} - {self.project_site.name}"
 
@@ -91,12 +123,236 @@ class CarbonCredit(models.Model):
     txn_hash = models.CharField(max_length=64, unique=True)
     issued_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project_site', '-issued_date'], name='credit_site_issued_idx'),
+            models.Index(fields=['issued_date', 'id'], name='credit_issued_idx'),
+            models.Index(fields=['year', 'issued_date'], name='credit_year_issued_idx'),
+        ]
+
+    def build_txn_hash(self):
+        # Fake blockchain transaction hash from the credit's own columns, so no
+        # site is loaded and no clock is read. Each plantation record has at most
+        # one credit, which keeps hashes unique however many are built at once.
+        data = f"{self.project_site_id}:{self.plantation_record_id}:{self.id}:{self.credits_issued}"
+        return hashlib.sha256(data.encode()).hexdigest()
+
     def save(self, *args, **kwargs):
         if not self.txn_hash:
-            # Generate fake blockchain transaction hash
-            data = f"{self.project_site.id}{self.credits_issued}{timezone.now().timestamp()}"
-            self.txn_hash = hashlib.sha256(data.encode()).hexdigest()
+            self.txn_hash = self.build_txn_hash()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.credits_issued} credits - {self.project_site.name}"
+
+# -------------------
+# Registry Statistics
+# -------------------
+class StatsCounters(models.Model):
+    total_sites = models.IntegerField(default=0)
+    total_records = models.IntegerField(default=0)
+    verified_records = models.IntegerField(default=0)
+    total_credits = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def pending_records(self):
+        return self.total_records - self.verified_records
+
+
+class RegistryStats(StatsCounters):
+    """Registry-wide totals, kept as a single row (pk=1)."""
+
+    def __str__(self):
+        return "Registry statistics"
+
+
+class OrganizationStats(StatsCounters):
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+
+    def __str__(self):
+        return f"Statistics - {self.owner.username}"
+
+
+class EcosystemStats(StatsCounters):
+    ecosystem_type = models.CharField(max_length=20, choices=ProjectSite.ECOSYSTEM_TYPES, unique=True)
+
+    def __str__(self):
+        return f"Statistics - {self.get_ecosystem_type_display()}"
+
+# -------------------
+# Credit Ledger
+# -------------------
+class LedgerEntry(models.Model):
+    """
+    Append-only, hash-chained record of a credit issuance.
+
+    The issuance fields are copied into the entry so the chain can still be
+    verified (and tampering detected) if the CarbonCredit row is edited or
+    deleted afterwards.
+    """
+    sequence = models.PositiveBigIntegerField(primary_key=True)
+    credit = models.OneToOneField(
+        CarbonCredit,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='ledger_entry',
+    )
+    txn_hash = models.CharField(max_length=64)
+    project_site_uuid = models.UUIDField()
+    plantation_record_uuid = models.UUIDField()
+    year = models.PositiveIntegerField()
+    credits_issued = models.DecimalField(max_digits=10, decimal_places=2)
+    prev_hash = models.CharField(max_length=64)
+    entry_hash = models.CharField(max_length=64, unique=True)
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.sequence} {self.entry_hash[:16]}"
+
+
+class LedgerCheckpoint(models.Model):
+    """Merkle root over one block of ledger entries, chained to the previous checkpoint."""
+    first_sequence = models.PositiveBigIntegerField(unique=True)
+    last_sequence = models.PositiveBigIntegerField(unique=True)
+    merkle_root = models.CharField(max_length=64)
+    prev_checkpoint_hash = models.CharField(max_length=64)
+    checkpoint_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Checkpoint {self.first_sequence}-{self.last_sequence}"
+
+# -------------------
+# Image Derivatives
+# -------------------
+class ImageDerivative(models.Model):
+    KINDS = [
+        ('THUMB_JPEG', 'Thumbnail (JPEG)'),
+        ('THUMB_WEBP', 'Thumbnail (WebP)'),
+        ('REVIEW', 'Review size (JPEG)'),
+    ]
+
+    source = models.CharField(max_length=255, db_index=True)
+    kind = models.CharField(max_length=20, choices=KINDS)
+    file = models.ImageField(upload_to='plantation_derivatives/', storage=plantation_image_storage)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    source_width = models.PositiveIntegerField()
+    source_height = models.PositiveIntegerField()
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'kind'], name='unique_derivative_per_source'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.source}"
+
+# -------------------
+# Change Feed
+# -------------------
+class ChangeEvent(models.Model):
+    """
+    One change downstream systems mirror, in commit order. Written in the
+    transaction that makes the change; never updated or deleted.
+    """
+    RECORD_VERIFIED = 'record.verified'
+    CREDIT_ISSUED = 'credit.issued'
+    KINDS = [
+        (RECORD_VERIFIED, 'Record verified'),
+        (CREDIT_ISSUED, 'Credit issued'),
+    ]
+
+    # AUTOINCREMENT on SQLite: sequence numbers are never reused.
+    sequence = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=32, choices=KINDS)
+    object_id = models.UUIDField()
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.sequence} {self.kind} {self.object_id}"
+
+# -------------------
+# Report Rollups
+# -------------------
+class RollupBucket(models.Model):
+    """
+    Verified records, plants and credits for one planting month, ecosystem,
+    site owner and species. Kept current by ``registry.rollups``.
+    """
+    month = models.DateField()  # first day of the planting month
+    ecosystem_type = models.CharField(max_length=20, choices=ProjectSite.ECOSYSTEM_TYPES)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rollups')
+    species = models.CharField(max_length=200)
+    verified_records = models.IntegerField(default=0)
+    total_plants = models.BigIntegerField(default=0)
+    total_credits = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'ecosystem_type', 'owner', 'species'], name='unique_rollup_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'month'], name='rollup_owner_month_idx'),
+            models.Index(fields=['ecosystem_type', 'month'], name='rollup_ecosystem_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.ecosystem_type} {self.species}"
+
+# -------------------
+# Resumable Uploads
+# -------------------
+class UploadSession(models.Model):
+    """
+    An image upload sent in chunks. The bytes received so far are in a
+    partial file on local disk; see ``registry.resumable``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+# -------------------
+# Perceptual Hashes
+# -------------------
+class ImageHash(models.Model):
+    """
+    The difference hash of a stored evidence photo, split into four
+    indexed 16-bit bands for near-duplicate search; see ``registry.duplicates``.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    dhash = models.BigIntegerField()  # the 64 hash bits read as a signed integer
+    band0 = models.PositiveIntegerField()
+    band1 = models.PositiveIntegerField()
+    band2 = models.PositiveIntegerField()
+    band3 = models.PositiveIntegerField()
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band0'], name='image_hash_band0_idx'),
+            models.Index(fields=['band1'], name='image_hash_band1_idx'),
+            models.Index(fields=['band2'], name='image_hash_band2_idx'),
+            models.Index(fields=['band3'], name='image_hash_band3_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dhash & 0xFFFFFFFFFFFFFFFF:016x} {self.source}"
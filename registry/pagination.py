@@ -0,0 +1,106 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset."""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the cursor values, or None if the token is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        return None
+    return values
+
+
+def _parse_ordering(ordering):
+    descending = {field.startswith('-') for field in ordering}
+    if len(descending) != 1:
+        raise ValueError('Keyset ordering fields must all sort in the same direction.')
+    return [field.lstrip('-') for field in ordering], descending.pop()
+
+
+def _after(fields, values, descending):
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, field in enumerate(fields):
+        branch = Q(**{fields[j]: values[j] for j in range(i)})
+        branch &= Q(**{f'{field}__{lookup}': values[i]})
+        condition |= branch
+    # The redundant bound on the first field lets the database seek to the
+    # cursor; with the OR alone SQLite walks the index from the start.
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & condition
+
+
+def seek(queryset, ordering, cursor):
+    """Order ``queryset`` and filter it to the rows after ``cursor``; return it and the fields."""
+    fields, descending = _parse_ordering(ordering)
+    values = decode_cursor(cursor)
+    queryset = queryset.order_by(*ordering)
+    if values is not None and len(values) == len(fields):
+        try:
+            queryset = queryset.filter(_after(fields, values, descending))
+        except ValidationError:
+            pass
+    return queryset, fields
+
+
+def _page(queryset, fields, rows, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        opts = queryset.model._meta
+        next_cursor = encode_cursor([opts.get_field(f).value_to_string(last) for f in fields])
+    return KeysetPage(rows, next_cursor)
+
+
+def keyset_page(queryset, ordering, cursor, page_size):
+    """
+    Slice ``queryset`` into the page that follows ``cursor``.
+
+    ``ordering`` must end in a unique field (normally the primary key) so
+    the seek predicate is total. The cost of a page depends only on
+    ``page_size``, never on how deep into the result set the cursor points.
+    """
+    queryset, fields = seek(queryset, ordering, cursor)
+    return _page(queryset, fields, list(queryset[:page_size + 1]), page_size)
+
+
+async def akeyset_page(queryset, ordering, cursor, page_size):
+    """``keyset_page`` for async views."""
+    queryset, fields = seek(queryset, ordering, cursor)
+    rows = [row async for row in queryset[:page_size + 1]]
+    return _page(queryset, fields, rows, page_size)
@@ -0,0 +1,190 @@
+"""
+Resumable chunked uploads of plantation images.
+
+A client starts an ``UploadSession`` with the file's name and size and
+then sends the file in chunks. Each chunk carries the offset it starts at
+and, optionally, its SHA-256 as ``Upload-Checksum: sha256 <base64>`` (the
+tus convention). Chunks are appended to a partial file under
+``REGISTRY_UPLOAD_PARTIAL_DIR``. A chunk that does not start at the
+session's offset is refused with the offset to resume from. After a
+dropped connection the client asks for the offset and sends only what
+is missing. A chunk that arrives short or fails its checksum is cut off
+again, so the partial file always ends at the recorded offset.
+
+While a chunk is written, the partial file holds an exclusive ``flock``.
+A retry cannot interleave with a request that is still in flight, and
+the database is only written once the chunk is on disk.
+
+The plantation record form attaches a finished upload. ``check`` reads the
+image header and ``attach`` moves the partial file into content-addressed
+storage with ``ContentAddressedStorage.adopt``, which renames it rather
+than copying.
+"""
+import base64
+import binascii
+import datetime
+import hashlib
+import os
+from contextlib import suppress
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from . import uploads
+from .models import PlantationRecord, UploadSession
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A request the upload cannot take. ``status`` is the HTTP status to answer with."""
+    status = 400
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class OffsetMismatch(UploadError):
+    status = 409
+
+
+class ChunkTooLarge(UploadError):
+    status = 413
+
+
+class UploadGone(UploadError):
+    status = 410
+
+
+def partial_dir():
+    return getattr(settings, 'REGISTRY_UPLOAD_PARTIAL_DIR', os.path.join(settings.BASE_DIR, 'partial_uploads'))
+
+
+def chunk_size():
+    """The chunk size clients are told to use."""
+    return getattr(settings, 'REGISTRY_UPLOAD_CHUNK_SIZE', 512 * 1024)
+
+
+def chunk_max_bytes():
+    return getattr(settings, 'REGISTRY_UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024)
+
+
+def session_ttl():
+    return datetime.timedelta(hours=getattr(settings, 'REGISTRY_UPLOAD_SESSION_TTL_HOURS', 48))
+
+
+def partial_path(session):
+    return os.path.join(partial_dir(), f'{session.pk}.part')
+
+
+def start(owner, filename, size):
+    if not 0 < size <= uploads.upload_max_bytes():
+        raise ChunkTooLarge(uploads.too_large_message())
+    session = UploadSession.objects.create(
+        owner=owner, filename=os.path.basename(filename)[-255:] or 'upload', size=size,
+    )
+    os.makedirs(partial_dir(), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def parse_checksum(header):
+    """The digest from an ``Upload-Checksum`` header, or None when there is none."""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Only sha256 chunk checksums are supported.')
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        raise UploadError('The chunk checksum is not valid base64.')
+
+
+def write_chunk(session, offset, stream, length, checksum=None):
+    """
+    Write ``length`` bytes from ``stream`` at ``offset``, which must be the
+    session's offset. Returns the new offset.
+    """
+    if length > chunk_max_bytes():
+        raise ChunkTooLarge(f'Chunks may be at most {chunk_max_bytes()} bytes.', session.offset)
+    if offset + length > session.size:
+        raise ChunkTooLarge('The chunk runs past the end of the file.', session.offset)
+    try:
+        handle = open(partial_path(session), 'r+b')
+    except FileNotFoundError:
+        raise UploadGone('This upload has expired; start it again.')
+
+    with handle:
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise OffsetMismatch('Another chunk of this upload is still being written.', session.offset)
+        session.refresh_from_db(fields=['offset'])
+        if offset != session.offset:
+            raise OffsetMismatch(f'The upload continues at offset {session.offset}.', session.offset)
+
+        # Anything past the offset is the torn end of a chunk that never completed.
+        handle.truncate(offset)
+        handle.seek(offset)
+        digest = hashlib.sha256()
+        received = 0
+        while received < length:
+            data = stream.read(min(COPY_CHUNK_SIZE, length - received))
+            if not data:
+                break
+            digest.update(data)
+            handle.write(data)
+            received += len(data)
+        if received != length or (checksum is not None and digest.digest() != checksum):
+            handle.truncate(offset)
+            raise UploadError('The chunk arrived incomplete or did not match its checksum; send it again.', offset)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+        session.offset = offset + length
+        UploadSession.objects.filter(pk=session.pk).update(offset=session.offset, updated_at=timezone.now())
+    return session.offset
+
+
+def check(session):
+    """Raise ValidationError unless the upload is complete and its header is an acceptable image."""
+    if not session.complete:
+        raise ValidationError('The photo has not finished uploading.', code='incomplete_upload')
+    try:
+        with open(partial_path(session), 'rb') as partial:
+            uploads.inspect_image(partial)
+    except FileNotFoundError:
+        raise ValidationError('The uploaded photo has expired; upload it again.', code='expired_upload')
+
+
+def attach(session):
+    """Move a checked upload into plantation image storage, end the session and return the stored name."""
+    field = PlantationRecord._meta.get_field('uploaded_images')
+    name = field.storage.adopt(partial_path(session), field.generate_filename(None, session.filename))
+    session.delete()
+    return name
+
+
+def purge(now=None):
+    """Delete sessions idle for longer than the TTL, and partial files without a session. Returns the count."""
+    cutoff = (now or timezone.now()) - session_ttl()
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in stale:
+        session.delete()
+    # List the files before the sessions, so an upload started meanwhile keeps its file.
+    names = os.listdir(partial_dir()) if os.path.isdir(partial_dir()) else []
+    live = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+    orphans = [name for name in names if name.endswith('.part') and name not in live]
+    for name in orphans:
+        with suppress(FileNotFoundError):
+            os.remove(os.path.join(partial_dir(), name))
+    return len(stale) + len(orphans)
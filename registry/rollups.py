@@ -0,0 +1,261 @@
+"""
+Pre-aggregated report buckets.
+
+A ``RollupBucket`` holds the verified records, plants and credits for one
+(planting month, ecosystem, site owner, species). Reports such as credits
+per ecosystem per year or plants per species per month sum a few thousand
+buckets, however many records and credits there are.
+
+Buckets follow the records and credits: the signals cover single saves and
+deletes, bulk paths that bypass signals pass their changes to ``add``.
+Credits are bucketed by their record's planting date, so a bucket's year is
+the credit's ``year``. ``rebuild`` recomputes every bucket from the source
+tables (``manage.py rebuild_registry_stats``).
+"""
+import datetime
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear, TruncMonth
+
+from .models import CarbonCredit, PlantationRecord, ProjectSite, RollupBucket
+
+REBUILD_BATCH_SIZE = 2000
+
+# Report dimensions, as bucket fields or expressions over them.
+DIMENSIONS = {
+    'year': ExtractYear('month'),
+    'month': 'month',
+    'ecosystem_type': 'ecosystem_type',
+    'organization': F('owner__organization'),
+    # Named apart from the bucket's ``owner`` field; values() rejects aliases that clash with one.
+    'owner_username': F('owner__username'),
+    'species': 'species',
+}
+MEASURES = {
+    'records': 'verified_records',
+    'plants': 'total_plants',
+    'credits': 'total_credits',
+}
+PERIODS = ('year', 'month')
+
+
+def key(owner_id, ecosystem_type, date_planted, species):
+    """The bucket of a record planted on ``date_planted``, or None if its site is unknown."""
+    if owner_id is None or date_planted is None:
+        return None
+    return date_planted.replace(day=1), ecosystem_type, owner_id, species
+
+
+def record_key(record):
+    """``key`` for a record whose project site is loaded."""
+    site = record.project_site
+    return key(site.created_by_id, site.ecosystem_type, record.date_planted, record.species)
+
+
+def record_share(record):
+    """
+    What the record contributes to its bucket: ``(project_site_id,
+    date_planted, species, verified, number_of_plants)``, from loaded fields.
+    """
+    values = record.__dict__
+    return (
+        values.get('project_site_id'), values.get('date_planted'), values.get('species'),
+        bool(values.get('verified')), values.get('number_of_plants') or 0,
+    )
+
+
+def verified(records, credits=()):
+    """Changes for newly verified ``records`` and newly issued ``credits``, sites and records loaded."""
+    for record in records:
+        yield record_key(record), {'verified_records': 1, 'total_plants': record.number_of_plants}
+    for credit in credits:
+        yield record_key(credit.plantation_record), {'total_credits': credit.credits_issued}
+
+
+def add(changes):
+    """Apply ``(key, deltas)`` changes, one UPDATE per bucket touched."""
+    per_bucket = {}
+    for bucket_key, deltas in changes:
+        if bucket_key is None:
+            continue
+        bucket = per_bucket.setdefault(bucket_key, {})
+        for name, value in deltas.items():
+            bucket[name] = bucket.get(name, 0) + value
+
+    for (month, ecosystem_type, owner_id, species), deltas in per_bucket.items():
+        updates = {name: F(name) + value for name, value in deltas.items() if value}
+        if not updates:
+            continue
+        lookup = {'month': month, 'ecosystem_type': ecosystem_type, 'owner_id': owner_id, 'species': species}
+        if RollupBucket.objects.filter(**lookup).update(**updates):
+            continue
+        # As in stats: a missing bucket with only negative deltas is being
+        # deleted with its owner, or was never built.
+        if all(value <= 0 for value in deltas.values()):
+            continue
+        RollupBucket.objects.create(**lookup, **deltas)
+
+
+def move_site(site_id, old, new):
+    """
+    Move a site's verified records and credits from the buckets of its old
+    ``(owner_id, ecosystem_type)`` to those of the new one.
+    """
+    (old_owner, old_ecosystem), (new_owner, new_ecosystem) = old, new
+    records = PlantationRecord.objects.filter(project_site_id=site_id, verified=True).values_list(
+        TruncMonth('date_planted'), 'species',
+    ).annotate(n=Count('id'), plants=Sum('number_of_plants')).order_by()
+    credits = CarbonCredit.objects.filter(project_site_id=site_id).values_list(
+        TruncMonth('plantation_record__date_planted'), 'plantation_record__species',
+    ).annotate(total=Sum('credits_issued')).order_by()
+
+    changes = []
+    for month, species, n, plants in records:
+        changes.append(((month, old_ecosystem, old_owner, species), {'verified_records': -n, 'total_plants': -plants}))
+        changes.append(((month, new_ecosystem, new_owner, species), {'verified_records': n, 'total_plants': plants}))
+    for month, species, total in credits:
+        changes.append(((month, old_ecosystem, old_owner, species), {'total_credits': -total}))
+        changes.append(((month, new_ecosystem, new_owner, species), {'total_credits': total}))
+    add(changes)
+    # Buckets the site leaves behind empty would not exist after a rebuild.
+    RollupBucket.objects.filter(
+        owner_id=old_owner, ecosystem_type=old_ecosystem, verified_records=0, total_plants=0, total_credits=0,
+    ).delete()
+
+
+def site_facts(site_id):
+    row = ProjectSite.objects.filter(pk=site_id).values_list('created_by_id', 'ecosystem_type').first()
+    return row or (None, None)
+
+
+@transaction.atomic
+def rebuild(apps=global_apps, batch_size=REBUILD_BATCH_SIZE):
+    """Recompute every bucket from the verified records and the credits."""
+    PlantationRecord = apps.get_model('registry', 'PlantationRecord')
+    CarbonCredit = apps.get_model('registry', 'CarbonCredit')
+    RollupBucket = apps.get_model('registry', 'RollupBucket')
+
+    per_bucket = {}
+    records = PlantationRecord.objects.filter(verified=True).values_list(
+        TruncMonth('date_planted'), 'project_site__ecosystem_type', 'project_site__created_by', 'species',
+    ).annotate(n=Count('id'), plants=Sum('number_of_plants')).order_by()
+    credits = CarbonCredit.objects.values_list(
+        TruncMonth('plantation_record__date_planted'), 'project_site__ecosystem_type',
+        'project_site__created_by', 'plantation_record__species',
+    ).annotate(total=Sum('credits_issued')).order_by()
+    for *bucket_key, n, plants in records:
+        bucket = per_bucket.setdefault(tuple(bucket_key), {})
+        bucket.update(verified_records=n, total_plants=plants)
+    for *bucket_key, total in credits:
+        per_bucket.setdefault(tuple(bucket_key), {})['total_credits'] = total or Decimal('0')
+
+    RollupBucket.objects.all().delete()
+    RollupBucket.objects.bulk_create(
+        (
+            RollupBucket(month=month, ecosystem_type=ecosystem_type, owner_id=owner_id, species=species, **totals)
+            for (month, ecosystem_type, owner_id, species), totals in per_bucket.items()
+        ),
+        batch_size=batch_size,
+    )
+
+
+def _names(value, choices, label):
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in choices]
+    if unknown:
+        raise ValueError(f'Unknown {label}: {", ".join(unknown)}. Available: {", ".join(choices)}.')
+    return list(dict.fromkeys(names))
+
+
+def _year(value, name):
+    if not value:
+        return None
+    # ``report`` asks for January 1st of the year after ``to``.
+    if not value.isdigit() or not 1 <= int(value) < datetime.MAXYEAR:
+        raise ValueError(f'{name} must be a year from 1 to {datetime.MAXYEAR - 1}.')
+    return int(value)
+
+
+def parse_filters(params):
+    """Report filters from query parameters; raises ValueError for bad values."""
+    filters = {'from_year': _year(params.get('from'), 'from'), 'to_year': _year(params.get('to'), 'to')}
+    for name in ('ecosystem_type', 'organization', 'species'):
+        filters[name] = params.get(name) or None
+    return filters
+
+
+def parse_report(params):
+    """``(group_by, measures, filters)`` for a report query string."""
+    group_by = _names(params.get('group_by') or 'year', DIMENSIONS, 'dimensions')
+    measures = _names(params.get('measures'), MEASURES, 'measures') or list(MEASURES)
+    return group_by, measures, parse_filters(params)
+
+
+def parse_chart(params):
+    """``(x, series, measure, filters)`` for a chart query string."""
+    x = params.get('x') or 'year'
+    if x not in PERIODS:
+        raise ValueError(f'x must be one of {", ".join(PERIODS)}.')
+    series = params.get('series') or None
+    if series is not None and (series not in DIMENSIONS or series in PERIODS):
+        raise ValueError(f'series must be one of {", ".join(d for d in DIMENSIONS if d not in PERIODS)}.')
+    measure = params.get('measure') or 'credits'
+    if measure not in MEASURES:
+        raise ValueError(f'measure must be one of {", ".join(MEASURES)}.')
+    return x, series, measure, parse_filters(params)
+
+
+def report(group_by, measures, owner=None, from_year=None, to_year=None, ecosystem_type=None,
+           organization=None, species=None):
+    """
+    Sums of ``measures`` per combination of ``group_by`` dimensions, as
+    dicts ordered by the dimensions. ``owner`` limits it to one owner's sites.
+    """
+    queryset = RollupBucket.objects.all()
+    if owner is not None:
+        queryset = queryset.filter(owner=owner)
+    if from_year is not None:
+        queryset = queryset.filter(month__gte=datetime.date(from_year, 1, 1))
+    if to_year is not None:
+        queryset = queryset.filter(month__lt=datetime.date(to_year + 1, 1, 1))
+    if ecosystem_type:
+        queryset = queryset.filter(ecosystem_type=ecosystem_type)
+    if organization:
+        queryset = queryset.filter(owner__organization=organization)
+    if species:
+        queryset = queryset.filter(species=species)
+
+    fields = [name for name in group_by if DIMENSIONS[name] == name]
+    expressions = {name: DIMENSIONS[name] for name in group_by if DIMENSIONS[name] != name}
+    return (
+        queryset.values(*fields, **expressions)
+        .annotate(**{name: Sum(MEASURES[name]) for name in measures})
+        .order_by(*group_by)
+    )
+
+
+def label(dimension, value):
+    if dimension == 'month':
+        return f'{value:%Y-%m}'
+    return value
+
+
+def chart(rows, x, series, measure):
+    """
+    Chart.js-style ``{labels, datasets}`` from ``report(x[, series], [measure])``
+    rows. Periods without data in a series are zero.
+    """
+    labels = sorted({row[x] for row in rows})
+    positions = {value: number for number, value in enumerate(labels)}
+    datasets = {}
+    for row in rows:
+        name = row[series] if series else measure
+        data = datasets.setdefault(name, [0] * len(labels))
+        data[positions[row[x]]] = float(row[measure] or 0)
+    return {
+        'labels': [label(x, value) for value in labels],
+        'datasets': [{'label': name, 'data': data} for name, data in datasets.items()],
+    }
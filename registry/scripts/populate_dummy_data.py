@@ -10,6 +10,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blue_carbon_registry.settings')
 django.setup()
 
+from django.db import transaction
+from registry import events, fragments, ledger, rollups, stats
+from registry.credits import build_credits, calculate_credits
 from registry.models import User, ProjectSite, PlantationRecord, CarbonCredit
 
 def create_dummy_data():
@@ -204,29 +207,28 @@ def create_dummy_data():
                 record.verified_by = admin_user
                 record.verified_date = datetime.now() - timedelta(days=days_ago-10)
                 record.save()
-                
-                # Create carbon credits for verified records
-                base_credits_per_plant = Decimal('0.5')
-                ecosystem_multiplier = {
-                    'MANGROVE': Decimal('1.5'),
-                    'SEAGRASS': Decimal('1.2'),
-                    'MARSH': Decimal('1.0'),
-                }
-                
-                multiplier = ecosystem_multiplier.get(site.ecosystem_type, Decimal('1.0'))
-                total_credits = record.number_of_plants * base_credits_per_plant * multiplier
-                
-                CarbonCredit.objects.create(
-                    project_site=site,
-                    plantation_record=record,
-                    year=plant_date.year,
-                    credits_issued=round(total_credits, 2)
-                )
             
             plantation_records.append(record)
     
     print(f"✓ Created {len(plantation_records)} plantation records")
     
+    # Issue carbon credits for the verified records in one bulk insert
+    verified = [record for record in plantation_records if record.verified]
+    amounts = calculate_credits(
+        [record.number_of_plants for record in verified],
+        [record.project_site.ecosystem_type for record in verified],
+    )
+    with transaction.atomic():
+        credits = build_credits(verified, amounts)
+        CarbonCredit.objects.bulk_create(credits)
+        ledger.append(credits)
+        events.append(events.credit_issued(credit) for credit in credits)
+    # bulk_create sends no signals; recount what they would have updated.
+    stats.rebuild()
+    rollups.rebuild()
+    fragments.bump(*{site.created_by_id for site in project_sites})
+    print(f"✓ Issued {len(credits)} carbon credits")
+    
     # Print summary
     total_sites = ProjectSite.objects.count()
     total_records = PlantationRecord.objects.count()
@@ -0,0 +1,282 @@
+import os
+from contextlib import suppress
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import auth, derivatives, events, fragments, ledger, resumable, rollups, stats
+from .models import User, ProjectSite, PlantationRecord, CarbonCredit, UploadSession
+
+
+def _site_facts(instance):
+    """Return (owner_id, ecosystem_type) of the instance's project site without a lazy load."""
+    if type(instance).project_site.is_cached(instance):
+        site = instance.project_site
+        return site.created_by_id, site.ecosystem_type
+    row = ProjectSite.objects.filter(pk=instance.project_site_id).values_list('created_by_id', 'ecosystem_type').first()
+    return row or (None, None)
+
+
+# -------------------
+# Statistics
+# -------------------
+@receiver(post_init, sender=PlantationRecord)
+def remember_record_state(sender, instance, **kwargs):
+    instance._stats_verified = instance.__dict__.get('verified', False)
+    instance._stats_site_id = instance.__dict__.get('project_site_id')
+    instance._feed_verified = instance._stats_verified
+    instance._rollup_share = rollups.record_share(instance)
+    instance._image_name = str(instance.__dict__.get('uploaded_images') or '')
+
+
+@receiver(post_init, sender=ProjectSite)
+def remember_site_state(sender, instance, **kwargs):
+    facts = (instance.__dict__.get('created_by_id'), instance.__dict__.get('ecosystem_type'))
+    instance._stats_site = instance._rollup_site = facts
+
+
+@receiver(post_init, sender=CarbonCredit)
+def remember_credit_state(sender, instance, **kwargs):
+    instance._stats_credits = instance.__dict__.get('credits_issued') or Decimal('0')
+    instance._rollup_credits = instance._stats_credits
+
+
+@receiver(post_save, sender=ProjectSite)
+def count_site(sender, instance, created, raw=False, **kwargs):
+    old = instance._stats_site
+    new = instance._stats_site = (instance.created_by_id, instance.ecosystem_type)
+    if raw:
+        return
+    if created:
+        stats.bump(*new, total_sites=1)
+    elif old != new and None not in old:
+        stats.move_site(instance.pk, old, new)
+
+
+@receiver(post_delete, sender=ProjectSite)
+def uncount_site(sender, instance, **kwargs):
+    stats.bump(instance.created_by_id, instance.ecosystem_type, total_sites=-1)
+
+
+@receiver(post_save, sender=PlantationRecord)
+def count_record(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_verified = 0 if created else int(instance._stats_verified)
+    old_site_id = instance._stats_site_id
+    instance._stats_verified, instance._stats_site_id = instance.verified, instance.project_site_id
+    # A record loaded without its site has nothing to compare against.
+    moved = not created and old_site_id not in (None, instance.project_site_id)
+    if moved:
+        # Records stay with their uploader but count under their site's
+        # ecosystem; their credits keep the site they were issued for.
+        _, old_ecosystem = rollups.site_facts(old_site_id)
+        _, new_ecosystem = _site_facts(instance)
+        stats.bump_many([
+            (instance.uploaded_by_id, old_ecosystem, {'total_records': -1, 'verified_records': -was_verified}),
+            (instance.uploaded_by_id, new_ecosystem, {'total_records': 1, 'verified_records': int(instance.verified)}),
+        ])
+        return
+    verified_delta = int(instance.verified) - was_verified
+    if not created and not verified_delta:
+        return
+    _, ecosystem_type = _site_facts(instance)
+    stats.bump(
+        instance.uploaded_by_id, ecosystem_type,
+        total_records=1 if created else 0,
+        verified_records=verified_delta,
+    )
+
+
+@receiver(post_delete, sender=PlantationRecord)
+def uncount_record(sender, instance, **kwargs):
+    _, ecosystem_type = _site_facts(instance)
+    stats.bump(
+        instance.uploaded_by_id, ecosystem_type,
+        total_records=-1,
+        verified_records=-int(instance._stats_verified),
+    )
+
+
+@receiver(post_save, sender=CarbonCredit)
+def count_credit(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    delta = Decimal(instance.credits_issued) - (Decimal('0') if created else instance._stats_credits)
+    instance._stats_credits = Decimal(instance.credits_issued)
+    if delta:
+        stats.bump(*_site_facts(instance), total_credits=delta)
+
+
+@receiver(post_delete, sender=CarbonCredit)
+def uncount_credit(sender, instance, **kwargs):
+    stats.bump(*_site_facts(instance), total_credits=-instance._stats_credits)
+
+
+# -------------------
+# Dashboard fragments
+# -------------------
+@receiver([post_save, post_delete], sender=ProjectSite)
+def refresh_site_fragments(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        fragments.bump(instance.created_by_id)
+
+
+@receiver([post_save, post_delete], sender=PlantationRecord)
+def refresh_record_fragments(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        # Credits show their record's species and planting date.
+        fragments.bump(instance.uploaded_by_id, resources=('records', 'credits'))
+
+
+@receiver([post_save, post_delete], sender=CarbonCredit)
+def refresh_credit_fragments(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        fragments.bump(_site_facts(instance)[0], resources=('credits',))
+
+
+@receiver([post_save, post_delete], sender=User)
+def refresh_user_fragments(sender, instance, update_fields=None, **kwargs):
+    # Usernames and organizations are shown next to sites, records and credits.
+    # A login only stores last_login, which nothing shows.
+    if kwargs.get('raw') or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    fragments.bump(instance.pk)
+
+
+# -------------------
+# Authentication cache
+# -------------------
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    auth.forget(instance.pk)
+
+
+# -------------------
+# Credit ledger
+# -------------------
+@receiver(post_save, sender=CarbonCredit)
+def chain_credit(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ledger.append([instance])
+
+
+# -------------------
+# Change feed
+# -------------------
+@receiver(post_save, sender=PlantationRecord)
+def publish_verification(sender, instance, raw=False, **kwargs):
+    newly_verified = instance.verified and not instance._feed_verified
+    instance._feed_verified = instance.verified
+    if newly_verified and not raw:
+        events.append([events.record_verified(instance)])
+
+
+@receiver(post_save, sender=CarbonCredit)
+def publish_credit(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.append([events.credit_issued(instance)])
+
+
+# -------------------
+# Report rollups
+# -------------------
+def _rollup_key(instance, site_id, date_planted, species):
+    if site_id == instance.project_site_id:
+        owner_id, ecosystem_type = _site_facts(instance)
+    else:
+        owner_id, ecosystem_type = rollups.site_facts(site_id)
+    return rollups.key(owner_id, ecosystem_type, date_planted, species)
+
+
+def _record_key(credit):
+    """The bucket of the credit's record, without a lazy load."""
+    if type(credit).plantation_record.is_cached(credit):
+        record = credit.plantation_record
+        date_planted, species = record.date_planted, record.species
+    else:
+        row = PlantationRecord.objects.filter(pk=credit.plantation_record_id).values_list(
+            'date_planted', 'species').first()
+        date_planted, species = row or (None, None)
+    return rollups.key(*_site_facts(credit), date_planted, species)
+
+
+@receiver(post_save, sender=ProjectSite)
+def roll_over_site(sender, instance, created, raw=False, **kwargs):
+    old = instance._rollup_site
+    new = instance._rollup_site = (instance.created_by_id, instance.ecosystem_type)
+    # A site loaded without these fields has nothing to compare against.
+    if raw or created or old == new or None in old:
+        return
+    rollups.move_site(instance.pk, old, new)
+
+
+@receiver(post_save, sender=PlantationRecord)
+def roll_up_record(sender, instance, created, raw=False, **kwargs):
+    old = instance._rollup_share
+    new = instance._rollup_share = rollups.record_share(instance)
+    if raw or (old == new and not created):
+        return
+    changes = []
+    if old[3] and not created:
+        changes.append((_rollup_key(instance, *old[:3]), {'verified_records': -1, 'total_plants': -old[4]}))
+    if new[3]:
+        changes.append((_rollup_key(instance, *new[:3]), {'verified_records': 1, 'total_plants': new[4]}))
+    if not created and old[:3] != new[:3]:
+        # The record moved to another bucket; its credit moves with it.
+        amount = CarbonCredit.objects.filter(plantation_record=instance).values_list(
+            'credits_issued', flat=True).first()
+        if amount:
+            changes.append((_rollup_key(instance, *old[:3]), {'total_credits': -amount}))
+            changes.append((_rollup_key(instance, *new[:3]), {'total_credits': amount}))
+    rollups.add(changes)
+
+
+@receiver(post_delete, sender=PlantationRecord)
+def roll_down_record(sender, instance, **kwargs):
+    share = instance._rollup_share
+    if share[3]:
+        rollups.add([(_rollup_key(instance, *share[:3]), {'verified_records': -1, 'total_plants': -share[4]})])
+
+
+@receiver(post_save, sender=CarbonCredit)
+def roll_up_credit(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    delta = Decimal(instance.credits_issued) - (Decimal('0') if created else instance._rollup_credits)
+    instance._rollup_credits = Decimal(instance.credits_issued)
+    if delta:
+        rollups.add([(_record_key(instance), {'total_credits': delta})])
+
+
+@receiver(post_delete, sender=CarbonCredit)
+def roll_down_credit(sender, instance, **kwargs):
+    rollups.add([(_record_key(instance), {'total_credits': -instance._rollup_credits})])
+
+
+# -------------------
+# Image derivatives
+# -------------------
+@receiver(post_save, sender=PlantationRecord)
+def queue_derivatives(sender, instance, raw=False, **kwargs):
+    name = instance.uploaded_images.name if instance.uploaded_images else ''
+    if raw or not name or name == instance._image_name:
+        return
+    instance._image_name = name
+    transaction.on_commit(lambda: derivatives.enqueue(name))
+
+
+# -------------------
+# Resumable uploads
+# -------------------
+@receiver(post_delete, sender=UploadSession)
+def remove_partial_upload(sender, instance, **kwargs):
+    path = resumable.partial_path(instance)
+
+    def remove():
+        # A finished upload has already been moved into image storage.
+        with suppress(FileNotFoundError):
+            os.remove(path)
+    transaction.on_commit(remove)
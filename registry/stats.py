@@ -0,0 +1,157 @@
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import CarbonCredit, PlantationRecord, RegistryStats, OrganizationStats, EcosystemStats
+
+REGISTRY_STATS_PK = 1
+
+
+def registry_stats():
+    stats, _ = RegistryStats.objects.get_or_create(pk=REGISTRY_STATS_PK)
+    return stats
+
+
+def organization_stats(owner):
+    stats, _ = OrganizationStats.objects.get_or_create(owner=owner)
+    return stats
+
+
+async def aregistry_stats():
+    stats, _ = await RegistryStats.objects.aget_or_create(pk=REGISTRY_STATS_PK)
+    return stats
+
+
+async def aorganization_stats(owner):
+    stats, _ = await OrganizationStats.objects.aget_or_create(owner=owner)
+    return stats
+
+
+def _apply(model, lookup, deltas):
+    updates = {name: F(name) + value for name, value in deltas.items() if value}
+    if not updates:
+        return
+    updates['updated_at'] = timezone.now()
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    # A missing row with only negative deltas means the owner is being
+    # deleted (or stats were never built); rebuild_registry_stats fixes both.
+    if all(value <= 0 for value in deltas.values()):
+        return
+    model.objects.get_or_create(**lookup)
+    model.objects.filter(**lookup).update(**updates)
+
+
+def bump(owner_id=None, ecosystem_type=None, **deltas):
+    """
+    Add ``deltas`` (e.g. ``total_records=1``) to the registry-wide row and,
+    when given, to the owner's and the ecosystem's rows.
+    """
+    _apply(RegistryStats, {'pk': REGISTRY_STATS_PK}, deltas)
+    if owner_id is not None:
+        _apply(OrganizationStats, {'owner_id': owner_id}, deltas)
+    if ecosystem_type:
+        _apply(EcosystemStats, {'ecosystem_type': ecosystem_type}, deltas)
+
+
+def move_site(site_id, old, new):
+    """
+    Move a site's counts from its old ``(owner_id, ecosystem_type)`` to the
+    new one. Records stay with the owner who uploaded them.
+    """
+    (old_owner, old_ecosystem), (new_owner, new_ecosystem) = old, new
+    credits = CarbonCredit.objects.filter(project_site_id=site_id).aggregate(
+        total_credits=Sum('credits_issued'))['total_credits'] or Decimal('0')
+    if old_ecosystem != new_ecosystem:
+        counts = PlantationRecord.objects.filter(project_site_id=site_id).aggregate(
+            total_records=Count('id'), verified_records=Count('id', filter=Q(verified=True)),
+        )
+        counts.update(total_sites=1, total_credits=credits)
+        _apply(EcosystemStats, {'ecosystem_type': old_ecosystem}, {name: -value for name, value in counts.items()})
+        _apply(EcosystemStats, {'ecosystem_type': new_ecosystem}, counts)
+    if old_owner != new_owner:
+        counts = {'total_sites': 1, 'total_credits': credits}
+        _apply(OrganizationStats, {'owner_id': old_owner}, {name: -value for name, value in counts.items()})
+        _apply(OrganizationStats, {'owner_id': new_owner}, counts)
+
+
+@transaction.atomic
+def rebuild(apps=global_apps):
+    """
+    Recompute every statistics row from the source tables.
+
+    ``apps`` lets the schema migration run this against historical models.
+    """
+    ProjectSite = apps.get_model('registry', 'ProjectSite')
+    PlantationRecord = apps.get_model('registry', 'PlantationRecord')
+    CarbonCredit = apps.get_model('registry', 'CarbonCredit')
+    RegistryStats = apps.get_model('registry', 'RegistryStats')
+    OrganizationStats = apps.get_model('registry', 'OrganizationStats')
+    EcosystemStats = apps.get_model('registry', 'EcosystemStats')
+
+    per_owner = {}
+    per_ecosystem = {}
+
+    sites = ProjectSite.objects.values('created_by', 'ecosystem_type').annotate(n=Count('id'))
+    records = PlantationRecord.objects.values('uploaded_by', 'project_site__ecosystem_type').annotate(
+        n=Count('id'), verified=Count('id', filter=Q(verified=True)),
+    )
+    credits = CarbonCredit.objects.values('project_site__created_by', 'project_site__ecosystem_type').annotate(
+        n=Sum('credits_issued'),
+    )
+
+    def add(key, ecosystem_type, **values):
+        for bucket, bucket_key in ((per_owner, key), (per_ecosystem, ecosystem_type)):
+            counters = bucket.setdefault(bucket_key, {})
+            for name, value in values.items():
+                counters[name] = counters.get(name, 0) + value
+
+    for row in sites:
+        add(row['created_by'], row['ecosystem_type'], total_sites=row['n'])
+    for row in records:
+        add(row['uploaded_by'], row['project_site__ecosystem_type'],
+            total_records=row['n'], verified_records=row['verified'])
+    for row in credits:
+        add(row['project_site__created_by'], row['project_site__ecosystem_type'],
+            total_credits=row['n'] or Decimal('0'))
+
+    OrganizationStats.objects.all().delete()
+    EcosystemStats.objects.all().delete()
+    RegistryStats.objects.all().delete()
+
+    totals = {}
+    for counters in per_ecosystem.values():
+        for name, value in counters.items():
+            totals[name] = totals.get(name, 0) + value
+
+    RegistryStats.objects.create(pk=REGISTRY_STATS_PK, **totals)
+    OrganizationStats.objects.bulk_create(
+        OrganizationStats(owner_id=owner_id, **counters) for owner_id, counters in per_owner.items()
+    )
+    EcosystemStats.objects.bulk_create(
+        EcosystemStats(ecosystem_type=ecosystem_type, **counters)
+        for ecosystem_type, counters in per_ecosystem.items()
+    )
+
+
+def bump_many(changes):
+    """
+    Apply many ``(owner_id, ecosystem_type, deltas)`` changes at once, as
+    produced by bulk operations that bypass model signals.
+    """
+    totals, per_owner, per_ecosystem = {}, {}, {}
+    for owner_id, ecosystem_type, deltas in changes:
+        for bucket in (totals, per_owner.setdefault(owner_id, {}), per_ecosystem.setdefault(ecosystem_type, {})):
+            for name, value in deltas.items():
+                bucket[name] = bucket.get(name, 0) + value
+
+    _apply(RegistryStats, {'pk': REGISTRY_STATS_PK}, totals)
+    for owner_id, deltas in per_owner.items():
+        if owner_id is not None:
+            _apply(OrganizationStats, {'owner_id': owner_id}, deltas)
+    for ecosystem_type, deltas in per_ecosystem.items():
+        if ecosystem_type:
+            _apply(EcosystemStats, {'ecosystem_type': ecosystem_type}, deltas)
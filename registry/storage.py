@@ -0,0 +1,160 @@
+"""
+Content-addressed file storage, and the static files build.
+
+Uploads are stored under the SHA-256 digest of their bytes, e.g.
+``plantation_images/3f/3fa4...e1.jpg``. The digest is computed while the
+file is being written, and a repeat upload of the same bytes resolves to
+the existing file instead of creating a suffixed copy.
+
+``StaticAssetStorage`` is the ``collectstatic`` pipeline. Every file gets a
+content hash in its name, and gzip and brotli copies are written next to it
+(WhiteNoise's compressed manifest storage). WhiteNoise serves hashed names
+as immutable for a year and picks a precompressed copy per request.
+Before hashing, PNGs are losslessly re-encoded when that is smaller, and
+every PNG or JPEG gets a WebP copy; templates offer it with ``webp_static``.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.move import file_move_safe
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+HASH_CHUNK_SIZE = 1024 * 1024
+STATIC_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+STATIC_WEBP_QUALITY = 80
+
+
+def content_name(directory, digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    return '/'.join(part for part in (directory, digest[:2], digest + extension) if part)
+
+
+def is_content_name(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    parent = os.path.basename(os.path.dirname(name))
+    return len(stem) == 64 and stem.startswith(parent) and all(c in '0123456789abcdef' for c in stem)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible(path='registry.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name is the content digest chosen in _save(); identical
+        # content must map to the same name, never to a suffixed copy.
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        os.makedirs(self.path(directory) if directory else self.location, exist_ok=True)
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it in one read pass, then move it into place.
+            source = content.temporary_file_path()
+            digest = file_digest(source)
+            final_name = content_name(directory, digest, name)
+            if not self.exists(final_name):
+                os.makedirs(os.path.dirname(self.path(final_name)), exist_ok=True)
+                file_move_safe(source, self.path(final_name))
+                self._set_permissions(final_name)
+            return final_name
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.path(directory) if directory else self.location, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            final_name = content_name(directory, digest.hexdigest(), name)
+            if self.exists(final_name):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(self.path(final_name)), exist_ok=True)
+                os.replace(temp_path, self.path(final_name))
+                self._set_permissions(final_name)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return final_name
+
+    def adopt(self, path, name):
+        """
+        Move an existing local file at ``path`` into the store under the
+        content name for ``name`` and return that name. Used to dedupe files
+        that are already on disk without copying them.
+        """
+        directory = os.path.dirname(name)
+        final_name = content_name(directory, file_digest(path), name)
+        if self.exists(final_name):
+            if os.path.abspath(path) != os.path.abspath(self.path(final_name)):
+                os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(self.path(final_name)), exist_ok=True)
+            os.replace(path, self.path(final_name))
+            self._set_permissions(final_name)
+        return final_name
+
+    def _set_permissions(self, name):
+        if self.file_permissions_mode is not None:
+            os.chmod(self.path(name), self.file_permissions_mode)
+
+
+def plantation_image_storage():
+    return ContentAddressedStorage()
+
+
+def webp_name(name):
+    return os.path.splitext(name)[0] + '.webp'
+
+
+class StaticAssetStorage(CompressedManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for name in [name for name in paths if name.lower().endswith(STATIC_IMAGE_EXTENSIONS)]:
+                # Hash the collected copy, which may have been re-encoded, not the source.
+                paths[name] = (self, name)
+                self.optimize_image(name)
+                variant = webp_name(name)
+                if variant not in paths and self.save_webp(name, variant):
+                    paths[variant] = (self, variant)
+        yield from super().post_process(paths, dry_run, **options)
+
+    def optimize_image(self, name):
+        with self.open(name) as source:
+            original = source.read()
+        with Image.open(io.BytesIO(original)) as image:
+            if image.format != 'PNG':
+                return
+            optimized = io.BytesIO()
+            image.save(optimized, 'PNG', optimize=True)
+        if optimized.tell() < len(original):
+            self.delete(name)
+            self._save(name, ContentFile(optimized.getvalue()))
+
+    def save_webp(self, name, variant):
+        """Write a WebP copy of ``name`` if it comes out smaller. Returns whether it did."""
+        with self.open(name) as source, Image.open(source) as image:
+            size = source.size
+            converted = io.BytesIO()
+            image.save(converted, 'WEBP', quality=STATIC_WEBP_QUALITY, method=6)
+        if converted.tell() >= size:
+            return False
+        if self.exists(variant):
+            self.delete(variant)
+        self._save(variant, ContentFile(converted.getvalue()))
+        return True
@@ -0,0 +1,142 @@
+"""
+Seedable synthetic registry data at scale.
+
+``generate`` bulk-inserts organizations, project sites, plantation records
+and the credits of verified records. It writes in batches, each in its own
+transaction, chains the credits onto the ledger and rebuilds the statistics
+and rollup tables at the end. The same seed always produces the same sites,
+records and credit amounts (UUIDs included), so benchmark runs on different
+commits see identical data.
+"""
+import datetime
+import math
+import random
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, fragments, geo, ledger, rollups, stats
+from .credits import build_credits, calculate_credits
+from .models import User, ProjectSite, PlantationRecord, CarbonCredit
+
+SPECIES = {
+    'MANGROVE': ['Rhizophora mucronata', 'Avicennia marina', 'Sonneratia alba', 'Bruguiera gymnorrhiza'],
+    'SEAGRASS': ['Zostera marina', 'Halophila ovalis', 'Cymodocea serrulata', 'Thalassia hemprichii'],
+    'MARSH': ['Spartina alterniflora', 'Salicornia europaea', 'Juncus roemerianus', 'Distichlis spicata'],
+}
+ECOSYSTEMS = list(SPECIES)
+# Rough bounding box of the Indian coastline: latitude, longitude.
+REGION = ((8.0, 23.5), (68.0, 93.0))
+SYNTHETIC_PREFIX = 'synthetic'
+
+
+class SyntheticResult:
+    def __init__(self):
+        self.users = 0
+        self.sites = 0
+        self.records = 0
+        self.credits = 0
+
+    def as_dict(self):
+        return {'users': self.users, 'sites': self.sites, 'records': self.records, 'credits': self.credits}
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _users(organizations):
+    admin = User(username=f'{SYNTHETIC_PREFIX}-admin', role='ADMIN', organization='Synthetic Registry')
+    owners = [
+        User(
+            username=f'{SYNTHETIC_PREFIX}-org-{number:04d}',
+            role='NGO' if number % 3 else 'COMMUNITY',
+            organization=f'Synthetic Organization {number:04d}',
+        )
+        for number in range(organizations)
+    ]
+    for user in [admin] + owners:
+        user.set_unusable_password()
+    User.objects.bulk_create([admin] + owners)
+    return admin, owners
+
+
+def generate(records=1000, records_per_site=10, verified_ratio=0.75, organizations=20, seed=1,
+             batch_size=5000, progress=None):
+    """
+    Insert ``records`` plantation records spread over
+    ``records / records_per_site`` sites owned by ``organizations`` owners.
+    About ``verified_ratio`` of them are verified and get a credit.
+    """
+    rng = random.Random(seed)
+    result = SyntheticResult()
+    admin, owners = _users(organizations)
+    result.users = len(owners) + 1
+
+    total_sites = max(1, math.ceil(records / records_per_site))
+    sites_per_batch = max(1, batch_size // records_per_site)
+    today = datetime.date(2025, 1, 1)
+
+    for first in range(0, total_sites, sites_per_batch):
+        with transaction.atomic():
+            sites = []
+            for _ in range(min(sites_per_batch, total_sites - first)):
+                lat = Decimal(f'{rng.uniform(*REGION[0]):.6f}')
+                lng = Decimal(f'{rng.uniform(*REGION[1]):.6f}')
+                owner = owners[int(rng.paretovariate(1.2)) % len(owners)]
+                sites.append(ProjectSite(
+                    id=_uuid(rng),
+                    name=f'Site {first + len(sites):07d}',
+                    location_lat=lat,
+                    location_lng=lng,
+                    geohash=geo.encode(lat, lng),
+                    ecosystem_type=rng.choice(ECOSYSTEMS),
+                    area_ha=Decimal(f'{rng.uniform(5, 250):.2f}'),
+                    created_by=owner,
+                ))
+            ProjectSite.objects.bulk_create(sites, batch_size=batch_size)
+
+            batch_records = []
+            for number, site in enumerate(sites, start=first):
+                count = min(records_per_site, records - number * records_per_site)
+                for _ in range(count):
+                    verified = rng.random() < verified_ratio
+                    planted = today - datetime.timedelta(days=rng.randint(30, 1800))
+                    batch_records.append(PlantationRecord(
+                        id=_uuid(rng),
+                        project_site=site,
+                        date_planted=planted,
+                        species=rng.choice(SPECIES[site.ecosystem_type]),
+                        number_of_plants=rng.randint(100, 5000),
+                        verified=verified,
+                        uploaded_by_id=site.created_by_id,
+                        verified_by=admin if verified else None,
+                        verified_date=timezone.now() if verified else None,
+                    ))
+            PlantationRecord.objects.bulk_create(batch_records, batch_size=batch_size)
+
+            verified = [record for record in batch_records if record.verified]
+            amounts = calculate_credits(
+                [record.number_of_plants for record in verified],
+                [record.project_site.ecosystem_type for record in verified],
+            )
+            credits = build_credits(verified, amounts, ids=(_uuid(rng) for _ in verified))
+            CarbonCredit.objects.bulk_create(credits, batch_size=batch_size)
+            ledger.append(credits)
+            events.append(
+                event for record, credit in zip(verified, credits)
+                for event in (events.record_verified(record), events.credit_issued(credit))
+            )
+
+        result.sites += len(sites)
+        result.records += len(batch_records)
+        result.credits += len(credits)
+        if progress:
+            progress(result)
+
+    stats.rebuild()
+    rollups.rebuild()
+    fragments.bump(*[owner.pk for owner in owners])
+    return result
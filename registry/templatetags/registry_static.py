@@ -0,0 +1,18 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+from ..storage import webp_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def webp_static(name):
+    """
+    URL of the WebP copy ``collectstatic`` made of the image ``name``, or an
+    empty string when there is none (no build yet, or WebP was not smaller).
+    """
+    variant = webp_name(name)
+    if variant not in getattr(staticfiles_storage, 'hashed_files', {}):
+        return ''
+    return staticfiles_storage.url(variant)
@@ -1,3 +1,1562 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import async_views, db, derivatives, duplicates, fragments, geo, imports, ledger, metrics, resumable, rollups, stats, synthetic, uploads
+from .credits import CreditEngine, build_credits, credits_for_records
+from .forms import ProjectSiteForm
+from .models import (
+    User, ProjectSite, PlantationRecord, CarbonCredit,
+    RegistryStats, OrganizationStats, EcosystemStats, LedgerEntry, LedgerCheckpoint, ImageDerivative, ChangeEvent,
+    RollupBucket, UploadSession, ImageHash,
+)
+from .pagination import encode_cursor, seek
+from .storage import is_content_name
+from .urls import patterns
+from .views import calculate_carbon_credits
+
+# Keep cached dashboard fragments out of the shared file cache and away from other runs,
+# and render static URLs without a collectstatic manifest.
+_test_cache = override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'registry-tests'},
+    },
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+
+
+def setUpModule():
+    _test_cache.enable()
+
+
+def tearDownModule():
+    _test_cache.disable()
+
+
+def make_user(username, role='NGO', **extra):
+    return User.objects.create_user(username=username, password='password123', role=role, **extra)
+
+
+def make_site(owner, ecosystem_type='MANGROVE', **extra):
+    fields = {
+        'name': f'{owner.username} site',
+        'location_lat': Decimal('22.258700'),
+        'location_lng': Decimal('89.937500'),
+        'ecosystem_type': ecosystem_type,
+        'area_ha': Decimal('10.00'),
+        'created_by': owner,
+    }
+    fields.update(extra)
+    return ProjectSite.objects.create(**fields)
+
+
+def make_records(site, count, **extra):
+    fields = {
+        'project_site': site,
+        'date_planted': datetime.date(2024, 1, 1),
+        'species': 'Rhizophora mucronata',
+        'uploaded_by': site.created_by,
+    }
+    fields.update(extra)
+    return [PlantationRecord.objects.create(number_of_plants=100 + i, **fields) for i in range(count)]
+
+
+class AdminDashboardQueueTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('ocean_guardians', organization='Ocean Guardians')
+        self.site = make_site(self.ngo)
+        self.client.force_login(self.admin)
+
+    def dashboard_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin_dashboard'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_queue_size(self):
+        self.dashboard_queries()  # load the admin into the user cache
+        make_records(self.site, 3)
+        small, _ = self.dashboard_queries()
+        make_records(self.site, 80)
+        large, response = self.dashboard_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(response.context['pending_count'], 83)
+
+    def test_keyset_pages_cover_queue_once(self):
+        records = make_records(self.site, 60)
+        seen = []
+        params = {}
+        while True:
+            _, response = self.dashboard_queries(**params)
+            page = response.context['pending_records']
+            seen.extend(record.id for record in page)
+            if not page.has_next:
+                break
+            params = {'after': page.next_cursor}
+        self.assertEqual(sorted(seen), sorted(r.id for r in records))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        make_records(self.site, 2)
+        _, response = self.dashboard_queries(after='not-a-cursor')
+        self.assertEqual(len(response.context['pending_records']), 2)
+
+
+class RegistryStatsTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('coastal_restore')
+        self.mangrove = make_site(self.ngo)
+        self.seagrass = make_site(self.ngo, ecosystem_type='SEAGRASS', name='Seagrass')
+
+    def snapshot(self):
+        counters = ('total_sites', 'total_records', 'verified_records', 'total_credits')
+
+        def rows(model, key):
+            return sorted(row for row in model.objects.values_list(key, *counters) if any(row[1:]))
+
+        return {
+            'registry': rows(RegistryStats, 'pk'),
+            'owners': rows(OrganizationStats, 'owner_id'),
+            'ecosystems': rows(EcosystemStats, 'ecosystem_type'),
+        }
+
+    def test_incremental_updates_match_rebuild(self):
+        records = make_records(self.mangrove, 3) + make_records(self.seagrass, 2)
+        for record in records[:3]:
+            record.verified = True
+            record.save()
+            CarbonCredit.objects.create(
+                project_site=record.project_site, plantation_record=record,
+                year=2024, credits_issued=Decimal('12.50'),
+            )
+        records[0].delete()
+        self.seagrass.delete()
+
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+        totals = stats.registry_stats()
+        self.assertEqual((totals.total_sites, totals.total_records, totals.verified_records), (1, 2, 2))
+        self.assertEqual(totals.total_credits, Decimal('25.00'))
+
+    def test_editing_a_site_moves_its_counts(self):
+        other = make_user('tidal_trust')
+        for record in make_records(self.mangrove, 2):
+            record.verified = True
+            record.save()
+            CarbonCredit.objects.create(
+                project_site=self.mangrove, plantation_record=record,
+                year=2024, credits_issued=Decimal('5.00'),
+            )
+        make_records(self.seagrass, 1)
+        self.mangrove.ecosystem_type = 'SEAGRASS'
+        self.mangrove.save()
+        self.seagrass.created_by = other
+        self.seagrass.save()
+
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(EcosystemStats.objects.get(ecosystem_type='SEAGRASS').total_sites, 2)
+
+    def test_moving_a_record_to_another_site_moves_its_counts(self):
+        other = make_user('tidal_trust')
+        marsh = make_site(other, ecosystem_type='MARSH', name='Marsh')
+        verified, pending, approved_on_move = make_records(self.mangrove, 3)
+        verified.verified = True
+        verified.save()
+        CarbonCredit.objects.create(
+            project_site=self.mangrove, plantation_record=verified,
+            year=2024, credits_issued=Decimal('5.00'),
+        )
+        verified.project_site = marsh
+        pending.project_site = approved_on_move.project_site = self.seagrass
+        approved_on_move.verified = True
+        for record in (verified, pending, approved_on_move):
+            record.save()
+
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(EcosystemStats.objects.get(ecosystem_type='MARSH').verified_records, 1)
+        self.assertEqual(EcosystemStats.objects.get(ecosystem_type='SEAGRASS').total_records, 2)
+
+    def test_home_reads_a_single_stats_row(self):
+        make_records(self.mangrove, 5)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_records'], 5)
+        self.assertEqual(response.context['total_sites'], 2)
+
+
+class BulkVerificationTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('blue_planet_ngo')
+        self.site = make_site(self.ngo, ecosystem_type='SEAGRASS')
+        self.client.force_login(self.admin)
+
+    def test_approve_issues_credits_and_reports_outcomes(self):
+        records = make_records(self.site, 4)
+        records[0].verified = True
+        records[0].save()
+        missing = '00000000-0000-0000-0000-000000000000'
+        ids = [str(r.id) for r in records] + [missing, 'garbage']
+
+        response = self.client.post(
+            reverse('bulk_verify_records'), {'action': 'approve', 'record_ids': ids},
+            HTTP_ACCEPT='application/json',
+        )
+
+        outcomes = response.json()['outcomes']
+        self.assertEqual(outcomes[ids[0]], 'already_verified')
+        self.assertEqual([outcomes[i] for i in ids[1:4]], ['approved'] * 3)
+        self.assertEqual(outcomes[missing], 'not_found')
+        self.assertEqual(outcomes['garbage'], 'invalid')
+        self.assertEqual(CarbonCredit.objects.count(), 3)
+        self.assertEqual(
+            CarbonCredit.objects.get(plantation_record=records[1]).credits_issued,
+            Decimal('60.60'),
+        )
+        totals = stats.registry_stats()
+        self.assertEqual(totals.verified_records, 4)
+        self.assertEqual(totals.total_credits, sum(c.credits_issued for c in CarbonCredit.objects.all()))
+
+    @override_settings(REGISTRY_BULK_VERIFY_MAX_RECORDS=2)
+    def test_ids_past_the_limit_are_reported_not_dropped(self):
+        records = make_records(self.site, 3)
+        ids = [str(r.id) for r in records]
+
+        response = self.client.post(
+            reverse('bulk_verify_records'), {'action': 'approve', 'record_ids': ids},
+            HTTP_ACCEPT='application/json',
+        )
+
+        outcomes = response.json()['outcomes']
+        self.assertEqual([outcomes[i] for i in ids], ['approved', 'approved', 'over_limit'])
+        self.assertFalse(PlantationRecord.objects.get(pk=records[2].pk).verified)
+
+        response = self.client.post(
+            reverse('bulk_verify_records'), {'action': 'approve', 'record_ids': ids}, follow=True,
+        )
+        self.assertContains(response, '1 records were not processed: at most 2 can be verified at once.')
+
+    def test_approving_a_record_twice_issues_one_credit(self):
+        record = make_records(self.site, 1)[0]
+        for _ in range(2):
+            response = self.client.post(reverse('verify_record', args=[record.id]), {'action': 'approve'})
+            self.assertRedirects(response, reverse('admin_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(CarbonCredit.objects.count(), 1)
+        totals = stats.registry_stats()
+        self.assertEqual((totals.verified_records, totals.total_credits), (1, Decimal('60.00')))
+
+    def test_reject_leaves_records_pending(self):
+        records = make_records(self.site, 2)
+        response = self.client.post(
+            reverse('bulk_verify_records'), {'action': 'reject', 'record_ids': [str(r.id) for r in records]},
+        )
+        self.assertRedirects(response, reverse('admin_dashboard'))
+        self.assertFalse(PlantationRecord.objects.filter(verified=True).exists())
+        self.assertFalse(CarbonCredit.objects.exists())
+
+
+class CreditEngineTests(TestCase):
+    def test_matches_decimal_rounding(self):
+        engine = CreditEngine(Decimal('0.35'), {'MANGROVE': Decimal('1.333'), 'SEAGRASS': Decimal('1.25')})
+        plants = [0, 1, 7, 13, 999, 123457]
+        for ecosystem_type, multiplier in (('MANGROVE', Decimal('1.333')), ('SEAGRASS', Decimal('1.25')),
+                                           ('MARSH', Decimal('1.0'))):
+            expected = [round(n * Decimal('0.35') * multiplier, 2) for n in plants]
+            result = engine.calculate(plants, [ecosystem_type] * len(plants))
+            self.assertEqual([str(r) for r in result], [str(e) for e in expected])
+
+    def test_queryset_pricing_matches_single_record_wrapper(self):
+        owner = make_user('kerala_fishers', role='COMMUNITY')
+        records = make_records(make_site(owner), 3) + make_records(make_site(owner, 'MARSH', name='Marsh'), 2)
+        priced = dict(credits_for_records(PlantationRecord.objects.all(), chunk_size=2))
+        self.assertEqual(priced, {r.id: calculate_carbon_credits(r) for r in records})
+
+    def test_database_pricing_matches_python(self):
+        owner = make_user('kerala_fishers', role='COMMUNITY')
+        sites = [make_site(owner, eco, name=eco) for eco in ('MANGROVE', 'SEAGRASS', 'MARSH')]
+        for site in sites:
+            make_records(site, 4)
+        rows = list(PlantationRecord.objects.values_list('id', 'number_of_plants', 'project_site__ecosystem_type'))
+        for engine in (CreditEngine(), CreditEngine(Decimal('0.35'), {'MANGROVE': Decimal('1.333')})):
+            ids, plants, ecosystem_types = zip(*rows)
+            expected = dict(zip(ids, engine.calculate(plants, ecosystem_types)))
+            self.assertEqual(dict(engine.calculate_queryset(PlantationRecord.objects.all())), expected)
+            with self.assertNumQueries(1):
+                self.assertEqual(engine.total(PlantationRecord.objects.all()), (12, sum(expected.values())))
+
+    def test_price_records_checks_its_rates(self):
+        make_records(make_site(make_user('kerala_fishers', role='COMMUNITY')), 2)
+        out = io.StringIO()
+        call_command('price_records', '--multiplier', 'mangrove=2', '--base-rate', '0.5', stdout=out)
+        self.assertIn('Records priced: 2', out.getvalue())
+        for args in (['--multiplier', 'MANGROVE=abc'], ['--multiplier', 'MANGROVE'], ['--multiplier', 'REEF=1.2'],
+                     ['--multiplier', 'MANGROVE=-1'], ['--base-rate', 'NaN']):
+            with self.assertRaises(CommandError, msg=args):
+                call_command('price_records', *args, stdout=io.StringIO())
+
+
+    def test_built_credits_bulk_insert_without_loading_sites(self):
+        owner = make_user('kerala_fishers', role='COMMUNITY')
+        make_records(make_site(owner), 50)
+        records = list(PlantationRecord.objects.all())
+        with self.assertNumQueries(0):
+            credits = build_credits(records, [Decimal('300.00')] * len(records))
+        self.assertEqual(len({credit.txn_hash for credit in credits}), 50)
+        self.assertEqual(
+            [credit.build_txn_hash() for credit in credits], [credit.txn_hash for credit in credits],
+        )
+        with self.assertNumQueries(1):
+            CarbonCredit.objects.bulk_create(credits)
+        self.assertEqual(CarbonCredit.objects.filter(year=2024).count(), 50)
+
+@override_settings(REGISTRY_LEDGER_CHECKPOINT_INTERVAL=4)
+class CreditLedgerTests(TestCase):
+    def setUp(self):
+        owner = make_user('sundarbans_community', role='COMMUNITY')
+        self.records = make_records(make_site(owner), 11)
+
+    def issue(self, records):
+        return [
+            CarbonCredit.objects.create(
+                project_site=r.project_site, plantation_record=r, year=2024, credits_issued=Decimal('7.25'),
+            )
+            for r in records
+        ]
+
+    def test_chain_checkpoints_and_proofs(self):
+        credits = self.issue(self.records)
+        self.assertEqual(list(ledger.audit()), [])
+        self.assertEqual(LedgerCheckpoint.objects.count(), 2)
+
+        proof = ledger.prove(credits[5].ledger_entry)
+        self.assertEqual(len(proof['path']), 2)
+        self.assertTrue(ledger.verify_path(proof['entry_hash'], proof['path'], proof['checkpoint']['merkle_root']))
+        self.assertFalse(ledger.verify_path(credits[4].ledger_entry.entry_hash, proof['path'],
+                                            proof['checkpoint']['merkle_root']))
+        self.assertIsNone(ledger.prove(credits[10].ledger_entry)['checkpoint'])
+
+    def test_audit_detects_tampering(self):
+        credits = self.issue(self.records[:6])
+        CarbonCredit.objects.filter(pk=credits[1].pk).update(credits_issued=Decimal('9999.00'))
+        LedgerEntry.objects.filter(sequence=3).update(credits_issued=Decimal('1.00'))
+        LedgerEntry.objects.filter(sequence=4).update(entry_hash='f' * 64)
+        credits[5].delete()
+
+        problems = list(ledger.audit())
+        self.assertTrue(any('#2' in p and 'differs' in p for p in problems))
+        self.assertTrue(any('#3' in p and 'entry_hash' in p for p in problems))
+        self.assertTrue(any('#5' in p and 'chain broken' in p for p in problems))
+        self.assertTrue(any('Merkle root' in p for p in problems))
+        self.assertTrue(any('#6' in p and 'no longer exists' in p for p in problems))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('nccr', role='ADMIN')
+        owner = make_user('ocean_guardians', organization='Ocean Guardians')
+        self.records = make_records(make_site(owner), 3) + make_records(make_site(owner, 'MARSH', name='Marsh'), 2)
+        for record in self.records:
+            CarbonCredit.objects.create(
+                project_site=record.project_site, plantation_record=record, year=2024,
+                credits_issued=calculate_carbon_credits(record),
+            )
+        self.client.force_login(self.admin)
+
+    def test_credit_csv_streams_filtered_rows(self):
+        response = self.client.get(reverse('export_data', args=['credits', 'csv']), {'ecosystem': 'MARSH'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['txn_hash', 'credit_id', 'year', 'credits_issued'])
+        self.assertEqual(len(lines), 3)
+
+    def test_record_jsonl_is_one_object_per_line(self):
+        response = self.client.get(reverse('export_data', args=['records', 'jsonl']),
+                                   {'year': '2024', 'organization': 'Ocean Guardians'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['organization'], 'Ocean Guardians')
+
+    def test_unknown_dataset_is_404(self):
+        response = self.client.get(reverse('export_data', args=['users', 'csv']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_years_out_of_range_are_400(self):
+        for year in ('0', '9999', '99999', 'abc'):
+            response = self.client.get(reverse('export_data', args=['records', 'csv']), {'year': year})
+            self.assertEqual(response.status_code, 400, year)
+
+
+    def test_command_checks_the_year_and_writes_to_its_stdout(self):
+        out = io.StringIO()
+        call_command('export_registry', 'credits', '--year', '2024', '--ecosystem', 'MARSH', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        for year in ('0', '9999', 'abc'):
+            with self.assertRaisesMessage(CommandError, 'year must be a year'):
+                call_command('export_registry', 'records', '--year', year, stdout=io.StringIO())
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.ngo = make_user('coastal_restore')
+        self.site = make_site(self.ngo, name='Gujarat Marsh', ecosystem_type='MARSH')
+        self.client.force_login(self.ngo)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('import_records'), {'data_file': SimpleUploadedFile(name, content.encode())})
+
+    def test_csv_import_creates_valid_rows_and_reports_invalid_ones(self):
+        other = make_site(make_user('someone_else'), name='Not Mine')
+        content = (
+            'project_site,date_planted,species,number_of_plants\n'
+            f'{self.site.id},2024-03-01,Spartina alterniflora,250\n'
+            'gujarat marsh,2024-03-02,Salicornia europaea,120\n'
+            f'{other.id},2024-03-03,Juncus roemerianus,80\n'
+            'Gujarat Marsh,not-a-date,Juncus roemerianus,-4\n'
+        )
+        response = self.upload('season.csv', content)
+        result = response.context['result']
+        self.assertEqual(result.created, 2)
+        self.assertEqual([e.row_number for e in result.errors], [4, 5])
+        self.assertIn('project_site', result.errors[0].errors)
+        self.assertEqual(set(result.errors[1].errors), {'date_planted', 'number_of_plants'})
+        self.assertEqual(PlantationRecord.objects.filter(uploaded_by=self.ngo).count(), 2)
+        self.assertEqual(stats.organization_stats(self.ngo).total_records, 2)
+
+    def test_geojson_import_and_dry_run(self):
+        content = json.dumps({'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [72.57, 23.02]},
+             'properties': {'project_site': 'Gujarat Marsh', 'date_planted': '2024-05-01',
+                            'species': 'Distichlis spicata', 'number_of_plants': 40}},
+        ]})
+        response = self.client.post(reverse('import_records'), {
+            'data_file': SimpleUploadedFile('plots.geojson', content.encode()), 'dry_run': 'on',
+        })
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertFalse(PlantationRecord.objects.exists())
+        self.upload('plots.geojson', content)
+        self.assertEqual(PlantationRecord.objects.get().number_of_plants, 40)
+
+    def test_each_batch_is_saved_before_the_next_is_read(self):
+        content = 'project_site,date_planted,species,number_of_plants\n' + ''.join(
+            f'Gujarat Marsh,2024-03-0{n},Spartina alterniflora,{n}\n' for n in range(1, 6))
+        saved = []
+
+        def progress(result):
+            saved.append((result.batches, result.created, PlantationRecord.objects.count()))
+
+        result = imports.import_records(self.ngo, io.BytesIO(content.encode()), batch=2, progress=progress)
+        self.assertEqual(saved, [(1, 2, 2), (2, 4, 4), (3, 5, 5)])
+        self.assertEqual(stats.organization_stats(self.ngo).total_records, 5)
+
+        out = io.StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.csv') as upload:
+            upload.write(content.encode())
+            upload.flush()
+            call_command('import_records', upload.name, user='coastal_restore', batch_size=2, stdout=out)
+        self.assertIn('Batch 3: 5 records so far', out.getvalue())
+
+    @override_settings(REGISTRY_IMPORT_GEOJSON_MAX_BYTES=100)
+    def test_oversized_geojson_is_refused_before_parsing(self):
+        features = [{'type': 'Feature', 'properties': {'project_site': 'Gujarat Marsh'}}] * 5
+        response = self.upload('plots.geojson', json.dumps({'type': 'FeatureCollection', 'features': features}))
+        self.assertFormError(response.context['form'], 'data_file', [
+            'GeoJSON imports may be at most 100\xa0bytes; split the file or use CSV.'])
+        self.assertFalse(PlantationRecord.objects.exists())
+
+
+def make_image(name='field.png', size=(32, 24), color=(20, 120, 60), fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class TemporaryMediaMixin:
+    def use_temporary_media(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ContentAddressedImageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.ngo = make_user('kerala_fishers', role='COMMUNITY')
+        self.site = make_site(self.ngo)
+        self.client.force_login(self.ngo)
+
+    def upload(self, image):
+        return self.client.post(reverse('upload_record'), {
+            'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': 'Avicennia marina',
+            'number_of_plants': 300, 'uploaded_images': image,
+        })
+
+    def test_identical_uploads_share_one_file(self):
+        self.upload(make_image('a.png'))
+        self.upload(make_image('b.png'))
+        self.upload(make_image('c.png', color=(200, 10, 10)))
+
+        names = list(PlantationRecord.objects.values_list('uploaded_images', flat=True))
+        self.assertEqual(len(names), 3)
+        self.assertEqual(len(set(names)), 2)
+        stored = [f for _, _, files in os.walk(self.media_root) for f in files]
+        self.assertEqual(len(stored), 2)
+        self.assertTrue(all(is_content_name(name) for name in names))
+
+    @override_settings(REGISTRY_DERIVATIVES_ASYNC=False)
+    def test_dedupe_images_moves_legacy_files_and_their_derivatives(self):
+        legacy = os.path.join(self.media_root, 'plantation_images')
+        os.makedirs(legacy)
+        for name, color in (('a.png', (20, 120, 60)), ('b.png', (20, 120, 60)), ('orphan.png', (9, 9, 9))):
+            with open(os.path.join(legacy, name), 'wb') as image:
+                image.write(make_image(name, color=color).read())
+        records = [
+            make_records(self.site, 1, uploaded_images=f'plantation_images/{name}')[0] for name in ('a.png', 'b.png')
+        ]
+        for name in ('a.png', 'b.png', 'orphan.png'):
+            derivatives.build(f'plantation_images/{name}')
+
+        out = io.StringIO()
+        call_command('dedupe_images', dry_run=True, delete_orphans=True, stdout=out)
+        self.assertIn('Would move 2 files', out.getvalue())
+        self.assertEqual(sorted(os.listdir(legacy)), ['a.png', 'b.png', 'orphan.png'])
+        self.assertEqual(ImageHash.objects.count(), 3)
+
+        call_command('dedupe_images', delete_orphans=True, stdout=io.StringIO())
+        names = {record.uploaded_images.name for record in PlantationRecord.objects.filter(id__in=[r.id for r in records])}
+        self.assertEqual(len(names), 1)
+        target = names.pop()
+        self.assertTrue(is_content_name(target))
+        self.assertFalse({'a.png', 'b.png', 'orphan.png'} & set(os.listdir(legacy)))
+        self.assertEqual(list(ImageHash.objects.values_list('source', flat=True)), [target])
+        derivative_rows = ImageDerivative.objects.all()
+        self.assertEqual({(d.source, d.kind) for d in derivative_rows}, {(target, kind) for kind in derivatives.DERIVATIVE_SPECS})
+        stored = [f for _, _, files in os.walk(os.path.join(self.media_root, 'plantation_derivatives')) for f in files]
+        self.assertEqual(len(stored), len(derivatives.DERIVATIVE_SPECS))
+
+
+def png_claiming_size(width, height):
+    """A 1x1 PNG whose header declares ``width`` x ``height`` pixels."""
+    png = make_image('claim.png', size=(1, 1)).read()
+    header = struct.pack('>II', width, height) + png[24:29]
+    return png[:16] + header + struct.pack('>I', zlib.crc32(b'IHDR' + header)) + png[33:]
+
+
+@override_settings(REGISTRY_UPLOAD_MAX_BYTES=100_000, REGISTRY_UPLOAD_MAX_PIXELS=1_000_000)
+class UploadLimitTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.ngo = make_user('kerala_fishers', role='COMMUNITY')
+        self.site = make_site(self.ngo)
+        self.client.force_login(self.ngo)
+
+    def upload(self, name, content):
+        response = self.client.post(reverse('upload_record'), {
+            'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': 'Avicennia marina',
+            'number_of_plants': 300, 'uploaded_images': SimpleUploadedFile(name, content),
+        })
+        self.assertFalse(PlantationRecord.objects.exists())
+        return response.context['form'].errors['uploaded_images']
+
+    def test_oversized_uploads_are_cut_off(self):
+        self.assertIn('at most 97.7', self.upload('orthophoto.tif', os.urandom(120_000))[0])
+
+    def test_oversized_uploads_pass_csrf_checks(self):
+        # The stream is cut off after the CSRF token, which comes first in the form.
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.ngo)
+        token = str(client.get(reverse('upload_record')).context['csrf_token'])
+        response = client.post(reverse('upload_record'), {
+            'csrfmiddlewaretoken': token, 'project_site': self.site.id, 'date_planted': '2024-02-01',
+            'species': 'Avicennia marina', 'number_of_plants': 300,
+            'uploaded_images': SimpleUploadedFile('orthophoto.tif', os.urandom(1_000_000)),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('at most 97.7', response.context['form'].errors['uploaded_images'][0])
+        self.assertFalse(PlantationRecord.objects.exists())
+
+    def test_oversized_bodies_are_drained_not_reset(self):
+        request = RequestFactory().post('/')
+        handler = uploads.BoundedUploadHandler(request)
+        handler.new_file('uploaded_images', 'orthophoto.tif', 'image/tiff', 120_000)
+        with self.assertRaises(StopUpload) as stopped:
+            for start in range(0, 120_000, 65_536):
+                handler.receive_data_chunk(os.urandom(65_536), start)
+        self.assertFalse(stopped.exception.connection_reset)
+        self.assertTrue(request.upload_too_large)
+
+    def test_dimensions_are_checked_from_the_header(self):
+        self.assertIn('at most 1 megapixels', self.upload('wide.png', png_claiming_size(2000, 1000))[0])
+        # Past Pillow's own decompression-bomb threshold.
+        self.assertIn('at most 1 megapixels', self.upload('bomb.png', png_claiming_size(100_000, 100_000))[0])
+        self.assertIn('not an image', self.upload('notes.png', b'not really a picture')[0])
+        with io.BytesIO() as gif:
+            Image.new('RGB', (10, 10)).save(gif, 'GIF')
+            self.assertIn('not GIF', self.upload('anim.gif', gif.getvalue())[0])
+
+    def test_images_within_limits_are_stored(self):
+        self.client.post(reverse('upload_record'), {
+            'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': 'Avicennia marina',
+            'number_of_plants': 300, 'uploaded_images': make_image(size=(1000, 1000), fmt='JPEG'),
+        })
+        record = PlantationRecord.objects.get()
+        self.assertTrue(is_content_name(record.uploaded_images.name))
+
+
+class ResumableUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        override = override_settings(REGISTRY_UPLOAD_PARTIAL_DIR=os.path.join(self.media_root, 'partial'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.ngo = make_user('kerala_fishers', role='COMMUNITY')
+        self.site = make_site(self.ngo)
+        self.client.force_login(self.ngo)
+        self.photo = make_image('mangroves.png', size=(300, 200)).read()
+
+    def start(self):
+        response = self.client.post(reverse('start_upload'), {'filename': 'mangroves.png', 'size': len(self.photo)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, url, offset, chunk, checksum=None):
+        headers = {'Upload-Offset': str(offset)}
+        if checksum is not None:
+            headers['Upload-Checksum'] = 'sha256 ' + base64.b64encode(hashlib.sha256(checksum).digest()).decode()
+        return self.client.patch(url, chunk, content_type='application/offset+octet-stream', headers=headers)
+
+    def test_chunks_resume_from_the_server_offset(self):
+        upload = self.start()
+        url, half = upload['url'], len(self.photo) // 2
+        self.assertEqual(self.send(url, 0, self.photo[:half], checksum=self.photo[:half]).json()['offset'], half)
+
+        # A resent chunk is refused with the offset to continue from.
+        response = self.send(url, 0, self.photo[:half])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, str(half)))
+        # A corrupted chunk is cut off again.
+        response = self.send(url, half, b'x' * (len(self.photo) - half), checksum=self.photo[half:])
+        self.assertEqual((response.status_code, response.json()['offset']), (400, half))
+        self.assertEqual(os.path.getsize(resumable.partial_path(UploadSession.objects.get())), half)
+
+        self.assertEqual(self.client.get(url).json()['offset'], half)
+        self.assertEqual(self.send(url, half, self.photo[half:]).json()['offset'], len(self.photo))
+
+    def test_finished_upload_is_moved_into_image_storage(self):
+        upload = self.start()
+        self.send(upload['url'], 0, self.photo)
+        partial = resumable.partial_path(UploadSession.objects.get())
+        inode = os.stat(partial).st_ino
+
+        self.client.post(reverse('upload_record'), {
+            'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': 'Avicennia marina',
+            'number_of_plants': 300, 'upload_id': upload['id'],
+        })
+        record = PlantationRecord.objects.get()
+        self.assertTrue(is_content_name(record.uploaded_images.name))
+        self.assertEqual(os.stat(record.uploaded_images.path).st_ino, inode)
+        self.assertFalse(os.path.exists(partial))
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_unfinished_or_foreign_uploads_are_refused(self):
+        upload = self.start()
+        self.send(upload['url'], 0, self.photo[:100])
+        response = self.client.post(reverse('upload_record'), {
+            'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': 'Avicennia marina',
+            'number_of_plants': 300, 'upload_id': upload['id'],
+        })
+        self.assertIn('not finished', response.context['form'].errors['upload_id'][0])
+        self.assertFalse(PlantationRecord.objects.exists())
+
+        self.client.force_login(make_user('ocean_guardians'))
+        self.assertEqual(self.client.get(upload['url']).status_code, 404)
+        self.client.force_login(self.ngo)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(upload['url']).status_code, 204)
+        self.assertEqual(os.listdir(resumable.partial_dir()), [])
+
+    def test_purge_removes_idle_uploads(self):
+        self.start()
+        UploadSession.objects.update(updated_at=timezone.now() - datetime.timedelta(days=3))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_uploads', stdout=io.StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(resumable.partial_dir()), [])
+
+
+@override_settings(REGISTRY_DERIVATIVES_ASYNC=False)
+class ImageDerivativeTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.ngo = make_user('ocean_guardians')
+        self.site = make_site(self.ngo)
+
+    def test_upload_builds_stripped_thumbnails_shown_on_dashboard(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), (30, 90, 150)).save(buffer, 'JPEG', exif=exif)
+
+        self.client.force_login(self.ngo)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload_record'), {
+                'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': 'Avicennia marina',
+                'number_of_plants': 300,
+                'uploaded_images': SimpleUploadedFile('phone.jpg', buffer.getvalue(), content_type='image/jpeg'),
+            })
+
+        thumbs = {d.kind: d for d in ImageDerivative.objects.all()}
+        self.assertEqual(set(thumbs), {'THUMB_JPEG', 'THUMB_WEBP', 'REVIEW'})
+        review = thumbs['REVIEW']
+        self.assertEqual((review.source_width, review.source_height), (1000, 2000))
+        self.assertEqual((review.width, review.height), (800, 1600))
+        with Image.open(thumbs['THUMB_JPEG'].file.path) as thumbnail:
+            self.assertEqual(max(thumbnail.size), 320)
+            self.assertEqual(len(thumbnail.getexif()), 0)
+
+        self.client.force_login(make_user('nccr', role='ADMIN'))
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertContains(response, thumbs['THUMB_WEBP'].file.url)
+
+
+def field_photo(seed, size=(640, 480)):
+    """A photo-like image: a gradient with shapes placed by ``seed``."""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for n in range(6):
+        x, y = (seed * 97 + n * 131) % size[0], (seed * 53 + n * 71) % size[1]
+        draw.ellipse((x, y, x + 120, y + 90), fill=((seed * 40 + n * 30) % 256, 120, 60))
+    return image
+
+
+def encode(image, name, fmt='PNG', **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+@override_settings(REGISTRY_DERIVATIVES_ASYNC=False)
+class DuplicateImageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.ngo = make_user('ocean_guardians')
+        self.site = make_site(self.ngo)
+        self.client.force_login(self.ngo)
+
+    def upload(self, photo, species='Avicennia marina'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload_record'), {
+                'project_site': self.site.id, 'date_planted': '2024-02-01', 'species': species,
+                'number_of_plants': 300, 'uploaded_images': photo,
+            })
+        return PlantationRecord.objects.latest('upload_date')
+
+    def test_reencoded_photos_are_flagged_in_the_queue(self):
+        original = self.upload(encode(field_photo(1), 'original.png'))
+        copy = self.upload(encode(field_photo(1).resize((400, 300)), 'copy.jpg', 'JPEG', quality=60), 'Rhizophora')
+        other = self.upload(encode(field_photo(7), 'other.png'), 'Sonneratia')
+        self.assertEqual(ImageHash.objects.count(), 3)
+        self.assertNotEqual(original.uploaded_images.name, copy.uploaded_images.name)
+
+        self.client.force_login(make_user('nccr', role='ADMIN'))
+        response = self.client.get(reverse('admin_dashboard'))
+        flagged = {record.id: record.near_duplicates for record in response.context['pending_records']}
+        self.assertEqual([match['id'] for match in flagged[original.id]], [copy.id])
+        self.assertEqual([match['id'] for match in flagged[copy.id]], [original.id])
+        self.assertEqual(flagged[other.id], [])
+        self.assertContains(response, 'Possible duplicate of 1 record', count=2)
+
+    def test_cropped_copies_are_only_flagged_when_barely_cropped(self):
+        # The hash covers the whole frame; see the duplicates module docstring.
+        original = self.upload(encode(field_photo(1), 'original.png'))
+        trimmed = self.upload(encode(field_photo(1).crop((16, 12, 624, 468)), 'trimmed.png'), 'Rhizophora')
+        cropped = self.upload(encode(field_photo(1).crop((0, 0, 480, 360)), 'cropped.png'), 'Sonneratia')
+
+        records = duplicates.flag(list(PlantationRecord.objects.all()))
+        flagged = {record.id: [match['id'] for match in record.near_duplicates] for record in records}
+        self.assertEqual(flagged[original.id], [trimmed.id])
+        self.assertEqual(flagged[cropped.id], [])
+
+    def test_search_reads_band_indexes(self):
+        value = duplicates.index('plantation_images/a.png', field_photo(3))
+        near, far = value ^ 0b1011, value ^ 0b1111111
+        self.assertEqual(duplicates.similar(near), [('plantation_images/a.png', 3)])
+        self.assertEqual(duplicates.similar(far), [])
+
+        query = duplicates._candidates([near], 1).query
+        with connection.cursor() as cursor:
+            sql, params = query.sql_with_params()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('image_hash_band0_idx', plan)
+        self.assertNotIn('SCAN registry_imagehash', plan)
+
+
+class SpatialIndexTests(TestCase):
+    def setUp(self):
+        self.ngo = make_user('ocean_guardians')
+        # Sundarbans sites roughly 0.3 km, 3 km and 40 km from the origin.
+        self.origin = (Decimal('22.258700'), Decimal('89.937500'))
+        self.near = make_site(self.ngo, name='Near', location_lat=Decimal('22.261400'))
+        self.mid = make_site(self.ngo, name='Mid', location_lat=Decimal('22.285700'))
+        self.far = make_site(self.ngo, name='Far', location_lat=Decimal('22.618000'))
+
+    def test_geohash_is_maintained_on_save(self):
+        self.assertEqual(self.near.geohash, geo.encode(Decimal('22.261400'), Decimal('89.937500')))
+        self.far.location_lat = self.origin[0]
+        self.far.save(update_fields=['location_lat'])
+        self.far.refresh_from_db()
+        self.assertEqual(self.far.geohash, geo.encode(*self.origin))
+
+    def test_radius_and_nearest_queries(self):
+        within = geo.sites_within(*self.origin, radius_km=5)
+        self.assertEqual([site.name for site in within], ['Near', 'Mid'])
+        self.assertAlmostEqual(within[0].distance_km, 0.30, places=2)
+        self.assertEqual([site.name for site in geo.nearest_sites(*self.origin, count=3)], ['Near', 'Mid', 'Far'])
+        self.assertEqual(geo.sites_within(Decimal('-33.9'), Decimal('151.2'), radius_km=50), [])
+
+    def test_radius_query_crosses_cell_boundaries(self):
+        # Two points either side of the 0 degree meridian share no geohash prefix.
+        west = make_site(self.ngo, name='West', location_lat=Decimal('5.0'), location_lng=Decimal('-0.001'))
+        east = make_site(self.ngo, name='East', location_lat=Decimal('5.0'), location_lng=Decimal('0.001'))
+        self.assertNotEqual(west.geohash[0], east.geohash[0])
+        self.assertEqual([site.name for site in geo.sites_within(Decimal('5.0'), Decimal('0.0005'), 1)],
+                         ['East', 'West'])
+
+    def test_form_flags_near_duplicate_site(self):
+        data = {
+            'name': 'Copy', 'location_lat': '22.258800', 'location_lng': '89.937500',
+            'ecosystem_type': 'MANGROVE', 'area_ha': '5.00',
+        }
+        form = ProjectSiteForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('Near', form.non_field_errors()[0])
+        self.assertTrue(ProjectSiteForm(dict(data, confirm_nearby='on')).is_valid())
+        # Editing a site never flags the site itself.
+        self.assertTrue(ProjectSiteForm(data, instance=self.near).is_valid())
+        self.assertTrue(ProjectSiteForm(dict(data, location_lat='23.5')).is_valid())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific.')
+class DashboardQueryPlanTests(TestCase):
+    """Every query behind the dashboards must be answered from an index."""
+
+    def setUp(self):
+        self.ngo = make_user('ocean_guardians')
+        self.admin = make_user('nccr', role='ADMIN')
+        site = make_site(self.ngo)
+        records = make_records(site, 8)
+        for record in records[:3]:
+            record.verified = True
+            record.save()
+            CarbonCredit.objects.create(
+                project_site=site, plantation_record=record, year=2024, credits_issued=Decimal('12.50'),
+            )
+
+    def second_page_cursor(self):
+        first = PlantationRecord.objects.filter(verified=False).order_by('upload_date', 'id').first()
+        return encode_cursor([first.upload_date.isoformat(), str(first.id)])
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for sql, params in queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params or ())
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if not detail.startswith('SCAN ') or 'CONSTANT ROW' in detail:
+                        continue
+                    # Walking an index in ORDER BY order is fine when a LIMIT
+                    # stops it early; anything else is a full scan.
+                    if 'USING' not in detail or ' LIMIT ' not in sql:
+                        scans.append(f'{detail}\n    in: {sql}')
+        return scans
+
+    def select_queries(self, user, url):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        self.client.force_login(user)
+        with connection.execute_wrapper(record):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def test_dashboard_queries_use_indexes(self):
+        for user, url in (
+            (self.ngo, reverse('home')),
+            (self.ngo, reverse('ngo_dashboard')),
+            (self.admin, reverse('admin_dashboard')),
+            (self.admin, reverse('admin_dashboard') + '?after=' + self.second_page_cursor()),
+            (self.admin, reverse('api_list', args=['sites'])),
+            (self.admin, reverse('api_list', args=['records']) + '?after=' + self.second_page_cursor()),
+            (self.admin, reverse('api_list', args=['credits'])),
+            (self.ngo, reverse('api_list', args=['credits'])),
+        ):
+            with self.subTest(url=url):
+                queries = self.select_queries(user, url)
+                self.assertTrue(queries)
+                scans = self.full_scans(queries)
+                self.assertEqual(scans, [], '\n'.join(scans))
+
+    def test_pending_queue_walks_only_pending_records(self):
+        queue = PlantationRecord.objects.filter(verified=False).order_by('upload_date', 'id')[:25]
+        plan = queue.explain()
+        self.assertIn('record_pending_queue_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_cursor_seeks_into_the_index(self):
+        queue, _ = seek(PlantationRecord.objects.filter(verified=False), ('upload_date', 'id'), self.second_page_cursor())
+        plan = queue[:25].explain()
+        self.assertIn('SEARCH', plan)
+        self.assertIn('record_pending_queue_idx', plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite tuning only applies to SQLite.')
+class WriteTransactionTests(TransactionTestCase):
+    def setUp(self):
+        db.lock_metrics.reset()
+
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    @override_settings(REGISTRY_WRITE_BACKOFF=0)
+    def test_retries_while_database_is_locked(self):
+        owner = make_user('ocean_guardians')
+        calls = []
+
+        @db.write_transaction
+        def add_site():
+            calls.append(1)
+            make_site(owner)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        self.assertEqual(add_site(), 'done')
+        self.assertEqual(ProjectSite.objects.count(), 1)  # failed attempts rolled back
+        metrics = db.lock_metrics.snapshot()
+        self.assertEqual((metrics['transactions'], metrics['retries'], metrics['failures']), (3, 2, 0))
+
+    @override_settings(REGISTRY_WRITE_BACKOFF=0, REGISTRY_WRITE_RETRIES=1)
+    def test_gives_up_and_never_retries_other_errors(self):
+        @db.write_transaction
+        def locked():
+            raise OperationalError('database is locked')
+
+        @db.write_transaction
+        def broken():
+            raise OperationalError('no such table: nowhere')
+
+        self.assertRaises(OperationalError, locked)
+        self.assertRaises(OperationalError, broken)
+        metrics = db.lock_metrics.snapshot()
+        self.assertEqual((metrics['transactions'], metrics['retries'], metrics['failures']), (3, 1, 2))
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.ngo = make_user('ocean_guardians')
+        self.admin = make_user('nccr', role='ADMIN')
+        self.site = make_site(self.ngo)
+
+    def test_dashboard_request_is_measured_and_exported(self):
+        make_records(self.site, 3)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin_dashboard'))
+
+        samples, totals, _ = metrics.registry.snapshot()
+        sample = samples[-1]
+        self.assertEqual((sample.view, sample.method, sample.status), ('admin_dashboard', 'GET', 200))
+        self.assertGreater(sample.queries, 0)
+        self.assertGreater(sample.template_seconds, 0)
+        self.assertLess(sample.template_seconds, sample.duration)
+        self.assertEqual(sample.response_bytes, len(response.content))
+        self.assertEqual(sample.duplicate_sql, [])
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('registry_requests_total{view="admin_dashboard",method="GET",status="200"} 1', body)
+        self.assertIn('registry_request_duration_seconds{view="admin_dashboard",quantile="0.95"}', body)
+        self.assertIn('registry_db_write_lock_wait_seconds_total', body)
+
+    def test_repeated_query_is_flagged(self):
+        records = make_records(self.site, 6)
+        sample = metrics.RequestSample('GET')
+        with connection.execute_wrapper(sample):
+            for record in PlantationRecord.objects.filter(pk__in=[r.pk for r in records]):
+                record.project_site.name  # one query per record
+        sample.finish(threshold=5)
+        self.assertEqual(sample.queries, 7)
+        [(sql, count)] = sample.duplicate_sql
+        self.assertIn('registry_projectsite', sql)
+        self.assertEqual(count, 6)
+
+    def test_metrics_are_staff_only(self):
+        self.client.force_login(self.ngo)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(REGISTRY_METRICS_TOKEN='s3cret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class AsgiUrls:
+    """The URLs asgi.py serves, with the async read-only views."""
+    urlpatterns = [path('', include(patterns(async_views)))]
+
+
+@override_settings(ROOT_URLCONF=AsgiUrls)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('ocean_guardians', organization='Ocean Guardians')
+        self.records = make_records(make_site(self.ngo, name='Sundarbans Restoration'), 3)
+
+    async def test_dashboards_render_under_asgi(self):
+        await self.async_client.aforce_login(self.ngo)
+        response = await self.async_client.get(reverse('ngo_dashboard'))
+        self.assertContains(response, 'Sundarbans Restoration')
+
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('admin_dashboard'))
+        self.assertContains(response, self.records[0].species)
+        response = await self.async_client.get(reverse('ngo_dashboard'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    async def test_async_requests_are_measured(self):
+        await self.async_client.get(reverse('home'))
+        samples, _, _ = metrics.registry.snapshot()
+        self.assertEqual(samples[-1].view, 'home')
+        self.assertGreater(samples[-1].queries, 0)
+        self.assertGreater(samples[-1].template_seconds, 0)
+
+    async def test_export_streams_from_an_async_iterator(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('export_data', args=['records', 'csv']))
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'record_id')
+        self.assertEqual(len(lines), 4)
+
+    async def test_login_is_required(self):
+        response = await self.async_client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_api_feed_and_reports_answer_like_the_sync_views(self):
+        await self.async_client.aforce_login(self.admin)
+        url, query = reverse('api_list', args=['records']), {'fields': 'species'}
+        response = await self.async_client.get(url, query)
+        self.assertEqual(len(response.json()['data']), 3)
+        response = await self.async_client.get(url, query, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse('events_feed'), {'wait': '0.1'})
+        self.assertEqual(response.json()['events'], [])
+        response = await self.async_client.get(reverse('rollup_report'), {'group_by': 'species'})
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('export_data', args=['records', 'csv']), {'year': '0'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_wsgi_serves_the_sync_views(self):
+        with override_settings(ROOT_URLCONF='blue_carbon_registry.urls'):
+            self.client.force_login(self.admin)
+            response = self.client.get(reverse('admin_dashboard'))
+            view = response.resolver_match.func
+        self.assertFalse(asyncio.iscoroutinefunction(view))
+        self.assertContains(response, self.records[0].species)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('ocean_guardians', organization='Ocean Guardians')
+        self.other = make_user('coastal_community', role='COMMUNITY')
+        self.site = make_site(self.ngo)
+        self.records = make_records(self.site, 5)
+        for record in self.records[:3]:
+            self.issue(record)
+        make_records(make_site(self.other), 2)
+        self.client.force_login(self.admin)
+
+    def issue(self, record):
+        return CarbonCredit.objects.create(
+            project_site=record.project_site, plantation_record=record, year=2024,
+            credits_issued=calculate_carbon_credits(record),
+        )
+
+    def get(self, resource, **params):
+        return self.client.get(reverse('api_list', args=[resource]), params)
+
+    def test_pages_follow_the_cursor_with_sparse_fields(self):
+        first = self.get('records', limit=4, fields='record_id,species,organization').json()
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['data']), 4)
+        self.assertEqual(set(first['data'][0]), {'record_id', 'species', 'organization'})
+
+        second = self.get('records', limit=4, after=first['next_cursor']).json()
+        self.assertFalse(second['has_more'])
+        ids = [row['record_id'] for row in first['data'] + second['data']]
+        self.assertEqual(len(set(ids)), 7)
+
+    def test_owners_see_only_their_rows(self):
+        self.client.force_login(self.ngo)
+        self.assertEqual(len(self.get('records').json()['data']), 5)
+        self.assertEqual(len(self.get('credits').json()['data']), 3)
+        self.assertEqual(len(self.get('sites').json()['data']), 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get('credits', fields='txn_hash,password').status_code, 400)
+        self.assertEqual(self.get('credits', limit='0').status_code, 400)
+        self.assertEqual(self.get('users').status_code, 404)
+        self.assertEqual(self.client.post(reverse('api_list', args=['credits'])).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.get('credits').status_code, 401)
+
+    def test_polling_for_new_credits_gets_304_until_one_is_issued(self):
+        response = self.get('credits')
+        cursor = response.json()['next_cursor']
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertNotIn('Last-Modified', response)
+
+        poll = self.client.get(reverse('api_list', args=['credits']), {'after': cursor})
+        self.assertEqual(poll.json()['data'], [])
+        with self.assertNumQueries(1):  # page keys; session and user come from the cache
+            again = self.client.get(reverse('api_list', args=['credits']), {'after': cursor},
+                                    HTTP_IF_NONE_MATCH=poll['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+
+        credit = self.issue(self.records[3])
+        fresh = self.client.get(reverse('api_list', args=['credits']), {'after': cursor},
+                                HTTP_IF_NONE_MATCH=poll['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual([row['credit_id'] for row in fresh.json()['data']], [str(credit.id)])
+
+    def test_verification_changes_the_record_page_validators(self):
+        response = self.get('records', fields='record_id,verified')
+        self.assertEqual(self.client.get(reverse('api_list', args=['records']), {'fields': 'record_id,verified'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        record = self.records[4]
+        record.verified = True
+        record.verified_date = timezone.now() + datetime.timedelta(seconds=5)
+        record.save()
+        changed = self.client.get(reverse('api_list', args=['records']), {'fields': 'record_id,verified'},
+                                  HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_edited_rows_change_the_etag(self):
+        records = self.get('records', fields='record_id,species')
+        credits = self.get('credits')
+        record = PlantationRecord.objects.get(pk=self.records[0].pk)
+        record.species = 'Sonneratia alba'
+        record.save()
+        changed = self.client.get(reverse('api_list', args=['records']), {'fields': 'record_id,species'},
+                                  HTTP_IF_NONE_MATCH=records['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('Sonneratia alba', [row['species'] for row in changed.json()['data']])
+
+        self.site.name = 'Renamed'
+        self.site.save()
+        changed = self.client.get(reverse('api_list', args=['credits']), HTTP_IF_NONE_MATCH=credits['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('Renamed', [row['project_site'] for row in changed.json()['data']])
+
+    def test_unrelated_writes_keep_pages_valid(self):
+        def still_valid(resource, response):
+            again = self.client.get(reverse('api_list', args=[resource]), HTTP_IF_NONE_MATCH=response['ETag'])
+            return again.status_code == 304
+
+        self.client.force_login(self.ngo)
+        own = self.get('records')
+        self.client.force_login(self.admin)
+        sites = self.get('sites')
+        credits = self.get('credits')
+
+        self.issue(self.records[3])
+        self.assertTrue(still_valid('sites', sites))
+        self.assertFalse(still_valid('credits', credits))
+
+        record = PlantationRecord.objects.filter(uploaded_by=self.other).first()
+        record.species = 'Sonneratia alba'
+        record.save()
+        self.assertTrue(still_valid('sites', sites))
+        self.client.force_login(self.ngo)
+        self.assertTrue(still_valid('records', own))
+
+    def test_renamed_site_changes_the_etag(self):
+        response = self.get('sites')
+        self.site.name = 'Renamed'
+        self.site.save()
+        changed = self.client.get(reverse('api_list', args=['sites']), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('Renamed', [row['name'] for row in changed.json()['data']])
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('ocean_guardians')
+        self.site = make_site(self.ngo)
+        self.records = make_records(self.site, 4)
+        self.client.force_login(self.admin)
+
+    def feed(self, **params):
+        response = self.client.get(reverse('events_feed'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_verifications_and_credits_are_published_in_order(self):
+        self.client.post(reverse('verify_record', args=[self.records[0].id]), {'action': 'approve'})
+        self.client.post(reverse('bulk_verify_records'), {
+            'action': 'approve', 'record_ids': [str(r.id) for r in self.records[1:3]],
+        })
+        self.client.post(reverse('verify_record', args=[self.records[3].id]), {'action': 'reject'})
+
+        feed = self.feed()
+        kinds = [(event['kind'], event['object_id']) for event in feed['events']]
+        self.assertEqual(len(kinds), 6)
+        # Each verification is followed by its credit; the rejected record publishes nothing.
+        for verified, issued in zip(kinds[::2], kinds[1::2]):
+            credit = CarbonCredit.objects.get(pk=issued[1])
+            self.assertEqual(verified, (ChangeEvent.RECORD_VERIFIED, str(credit.plantation_record_id)))
+            self.assertEqual(issued[0], ChangeEvent.CREDIT_ISSUED)
+        self.assertEqual(kinds[0][1], str(self.records[0].id))
+        self.assertEqual({kind[1] for kind in kinds[2::2]}, {str(r.id) for r in self.records[1:3]})
+        sequences = [event['sequence'] for event in feed['events']]
+        self.assertEqual(sequences, sorted(sequences))
+        self.assertEqual(feed['last_sequence'], sequences[-1])
+        first_credit = CarbonCredit.objects.get(plantation_record=self.records[0])
+        self.assertEqual(Decimal(feed['events'][1]['payload']['credits_issued']), first_credit.credits_issued)
+
+    def test_consumers_page_from_their_last_sequence(self):
+        self.client.post(reverse('bulk_verify_records'), {
+            'action': 'approve', 'record_ids': [str(r.id) for r in self.records],
+        })
+        first = self.feed(limit=5)
+        self.assertTrue(first['has_more'])
+        rest = self.feed(since=first['last_sequence'], limit=5)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(first['events']) + len(rest['events']), 8)
+        self.assertEqual(self.feed(since=rest['last_sequence'], wait='0.1')['events'], [])
+
+    def test_feed_is_for_admins_or_token_holders(self):
+        self.client.force_login(self.ngo)
+        self.assertEqual(self.client.get(reverse('events_feed')).status_code, 403)
+        with override_settings(REGISTRY_FEED_TOKEN='s3cret'):
+            response = self.client.get(reverse('events_feed'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('events_feed'), {'wait': '600'}).status_code, 400)
+
+    def test_command_resumes_from_cursor_file(self):
+        self.client.post(reverse('verify_record', args=[self.records[0].id]), {'action': 'approve'})
+        with tempfile.TemporaryDirectory() as directory:
+            cursor = os.path.join(directory, 'cursor')
+            out = io.StringIO()
+            call_command('sync_events', cursor_file=cursor, stdout=out, stderr=io.StringIO())
+            self.assertEqual([json.loads(line)['kind'] for line in out.getvalue().splitlines()],
+                             [ChangeEvent.RECORD_VERIFIED, ChangeEvent.CREDIT_ISSUED])
+
+            self.client.post(reverse('verify_record', args=[self.records[1].id]), {'action': 'approve'})
+            out = io.StringIO()
+            call_command('sync_events', cursor_file=cursor, stdout=out, stderr=io.StringIO())
+            lines = [json.loads(line) for line in out.getvalue().splitlines()]
+            self.assertEqual([line['object_id'] for line in lines][:1], [str(self.records[1].id)])
+            with open(cursor) as saved:
+                self.assertEqual(int(saved.read()), lines[-1]['sequence'])
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('coastal_restore', organization='Coastal Restore')
+        self.other = make_user('reef_watch', organization='Reef Watch')
+        self.mangrove = make_site(self.ngo)
+        self.seagrass = make_site(self.other, ecosystem_type='SEAGRASS', name='Seagrass')
+        self.records = make_records(self.mangrove, 4) + make_records(
+            self.seagrass, 2, date_planted=datetime.date(2023, 6, 15), species='Zostera marina')
+        self.client.force_login(self.admin)
+
+    def approve(self, *records):
+        self.client.post(reverse('bulk_verify_records'), {
+            'action': 'approve', 'record_ids': [str(r.id) for r in records],
+        })
+
+    def snapshot(self):
+        return sorted(RollupBucket.objects.values_list(
+            'month', 'ecosystem_type', 'owner_id', 'species', 'verified_records', 'total_plants', 'total_credits',
+        ))
+
+    def test_incremental_updates_match_rebuild(self):
+        self.client.post(reverse('verify_record', args=[self.records[0].id]), {'action': 'approve'})
+        self.approve(*self.records[1:3], self.records[4])
+        moved = PlantationRecord.objects.get(pk=self.records[1].pk)
+        moved.species = 'Avicennia marina'
+        moved.save()
+        PlantationRecord.objects.get(pk=self.records[2].pk).delete()
+        credit = CarbonCredit.objects.get(plantation_record=self.records[4])
+        credit.credits_issued += 1
+        credit.save()
+        self.seagrass.ecosystem_type = 'MARSH'
+        self.seagrass.save()
+        self.mangrove.created_by = self.other
+        self.mangrove.save()
+
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(len(incremental), 3)
+        self.assertEqual(sum(row[4] for row in incremental), 3)
+        self.assertEqual(
+            {(row[1], row[2]) for row in incremental}, {('MANGROVE', self.other.pk), ('MARSH', self.other.pk)},
+        )
+
+    def test_report_groups_and_scopes_buckets(self):
+        self.approve(*self.records)
+        response = self.client.get(reverse('rollup_report'), {
+            'group_by': 'year,ecosystem_type', 'measures': 'records,plants',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rows'], [
+            {'year': 2023, 'ecosystem_type': 'SEAGRASS', 'records': 2, 'plants': 201},
+            {'year': 2024, 'ecosystem_type': 'MANGROVE', 'records': 4, 'plants': 406},
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(rollups.report(['organization'], ['credits'], from_year=2024))
+        self.assertEqual([row['organization'] for row in rows], ['Coastal Restore'])
+        self.assertFalse(any('registry_carboncredit' in q['sql'] for q in queries.captured_queries))
+
+        self.client.force_login(self.other)
+        rows = self.client.get(reverse('rollup_report'), {'group_by': 'species'}).json()['rows']
+        self.assertEqual([row['species'] for row in rows], ['Zostera marina'])
+
+    def test_chart_has_one_dataset_per_series(self):
+        self.approve(*self.records)
+        chart = self.client.get(reverse('rollup_chart'), {'series': 'ecosystem_type', 'measure': 'records'}).json()
+        self.assertEqual(chart['labels'], [2023, 2024])
+        self.assertEqual(chart['datasets'], [
+            {'label': 'SEAGRASS', 'data': [2.0, 0]},
+            {'label': 'MANGROVE', 'data': [0, 4.0]},
+        ])
+        monthly = self.client.get(reverse('rollup_chart'), {'x': 'month'}).json()
+        self.assertEqual(monthly['labels'], ['2023-06', '2024-01'])
+
+    def test_every_dimension_groups_reports_and_charts(self):
+        self.approve(*self.records)
+        for dimension in rollups.DIMENSIONS:
+            response = self.client.get(reverse('rollup_report'), {'group_by': dimension})
+            self.assertEqual(response.status_code, 200, dimension)
+            self.assertTrue(all(dimension in row for row in response.json()['rows']), dimension)
+            if dimension not in rollups.PERIODS:
+                response = self.client.get(reverse('rollup_chart'), {'series': dimension})
+                self.assertEqual(response.status_code, 200, dimension)
+        rows = self.client.get(reverse('rollup_report'), {'group_by': 'owner_username'}).json()['rows']
+        self.assertEqual([row['owner_username'] for row in rows], ['coastal_restore', 'reef_watch'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('rollup_report'), {'group_by': 'planet'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('rollup_chart'), {'x': 'species'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('rollup_report'), {'from': 'last year'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('rollup_report'), {'to': '9999'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('rollup_chart'), {'from': '0'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('rollup_report')).status_code, 401)
+
+
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        self.ngo = make_user('ocean_guardians')
+        self.client.force_login(self.ngo)
+
+    def test_warm_session_runs_no_auth_queries(self):
+        self.assertEqual(self.client.get(reverse('add_project')).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('add_project'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.ngo)
+
+    def test_role_changes_apply_on_the_next_request(self):
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).status_code, 302)
+
+        self.ngo.role = 'ADMIN'
+        self.ngo.save()
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).status_code, 200)
+
+        demoted = User.objects.get(pk=self.ngo.pk)
+        demoted.role = 'NGO'
+        demoted.save()
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('add_project')).status_code, 200)
+
+    def test_deactivated_user_is_signed_out(self):
+        self.client.get(reverse('add_project'))
+        self.ngo.is_active = False
+        self.ngo.save()
+        response = self.client.get(reverse('add_project'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+
+    def test_pages_link_shared_assets_instead_of_inlining_them(self):
+        html = self.client.get(reverse('home')).content.decode()
+        self.assertNotIn('<style>', html)
+        self.assertIn('/static/css/registry.css', html)
+        self.assertIn('/static/js/registry.js', html)
+        self.assertNotIn('image/webp', html)  # no build, no WebP copy to offer
+
+    def test_build_fingerprints_precompresses_and_serves_immutable_assets(self):
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'registry.storage.StaticAssetStorage'},
+        }
+        # The project's own static directory only; the admin's files are not under test.
+        finders = ['django.contrib.staticfiles.finders.FileSystemFinder']
+        with override_settings(STATIC_ROOT=self.static_root, STORAGES=storages, STATICFILES_FINDERS=finders):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(self.static_root, 'staticfiles.json')) as manifest:
+                paths = json.load(manifest)['paths']
+            css = paths['css/registry.css']
+            self.assertNotEqual(css, 'css/registry.css')
+            for suffix in ('.gz', '.br'):
+                self.assertTrue(os.path.exists(os.path.join(self.static_root, css + suffix)))
+            with Image.open(os.path.join(self.static_root, paths['logo.webp'])) as webp:
+                self.assertEqual(webp.format, 'WEBP')
+
+            client = self.client_class()
+            html = client.get(reverse('home')).content.decode()
+            self.assertIn(f'/static/{css}', html)
+            self.assertIn(f'srcset="/static/{paths["logo.webp"]}"', html)
+
+            response = client.get(f'/static/{css}', HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+
+
+class SyntheticDataTests(TestCase):
+    def test_generates_consistent_seeded_data(self):
+        result = synthetic.generate(records=95, records_per_site=10, organizations=4, seed=7, batch_size=40)
+
+        self.assertEqual((result.users, result.sites, result.records), (5, 10, 95))
+        self.assertEqual(PlantationRecord.objects.count(), 95)
+        self.assertEqual(CarbonCredit.objects.count(), PlantationRecord.objects.filter(verified=True).count())
+        self.assertEqual(result.credits, CarbonCredit.objects.count())
+        self.assertEqual(list(ledger.audit()), [])
+        self.assertEqual(stats.registry_stats().total_records, 95)
+        self.assertEqual(sum(RollupBucket.objects.values_list('verified_records', flat=True)), result.credits)
+        site = ProjectSite.objects.first()
+        self.assertEqual(site.geohash, geo.encode(site.location_lat, site.location_lng))
+
+        first = sorted(PlantationRecord.objects.values_list('id', 'number_of_plants'))
+        PlantationRecord.objects.all().delete()
+        ProjectSite.objects.all().delete()
+        User.objects.all().delete()
+        LedgerEntry.objects.all().delete()
+        LedgerCheckpoint.objects.all().delete()
+        synthetic.generate(records=95, records_per_site=10, organizations=4, seed=7, batch_size=40)
+        self.assertEqual(sorted(PlantationRecord.objects.values_list('id', 'number_of_plants')), first)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_user('nccr', role='ADMIN')
+        self.ngo = make_user('blue_planet_ngo')
+        self.site = make_site(self.ngo, name='Sundarbans Restoration')
+        self.client.force_login(self.ngo)
+
+    def render_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_warm_dashboard_skips_fragment_queries(self):
+        make_records(self.site, 3)
+        cold, cold_queries = self.render_queries(reverse('ngo_dashboard'))
+        warm, warm_queries = self.render_queries(reverse('ngo_dashboard'))
+
+        self.assertLess(warm_queries, cold_queries)
+        self.assertContains(warm, 'Sundarbans Restoration')
+
+    def test_new_site_invalidates_owner_fragments(self):
+        self.client.get(reverse('ngo_dashboard'))
+        before = fragments.generation(self.ngo.pk)
+        make_site(self.ngo, name='Mahanadi Delta')
+
+        self.assertNotEqual(fragments.generation(self.ngo.pk), before)
+        self.assertContains(self.client.get(reverse('ngo_dashboard')), 'Mahanadi Delta')
+
+    def test_other_owners_keep_their_fragments(self):
+        other = make_user('coastal_community', role='COMMUNITY')
+        before = fragments.generation(other.pk)
+        make_site(self.ngo, name='Mahanadi Delta')
+        self.assertEqual(fragments.generation(other.pk), before)
+
+    def test_bulk_verification_invalidates_dashboards(self):
+        records = make_records(self.site, 2)
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get(reverse('admin_dashboard')), 'Credits will appear here')
+        owner_before, global_before = fragments.generation(self.ngo.pk), fragments.generation()
+
+        self.client.post(
+            reverse('bulk_verify_records'), {'action': 'approve', 'record_ids': [str(r.id) for r in records]},
+        )
+
+        self.assertNotEqual(fragments.generation(self.ngo.pk), owner_before)
+        self.assertNotEqual(fragments.generation(), global_before)
+        credit = CarbonCredit.objects.first()
+        self.assertContains(self.client.get(reverse('admin_dashboard')), f'{credit.credits_issued} Credits')
@@ -0,0 +1,84 @@
+"""
+Memory-bounded image uploads.
+
+``BoundedUploadHandler`` streams every uploaded file to a temporary file on
+disk, never into memory, and stops parsing the request once a file grows
+past ``REGISTRY_UPLOAD_MAX_BYTES``; the rest of the body is drained without
+being stored. The form fields before the file, the CSRF token among them,
+have been parsed by then, so the view can still answer with a form error.
+It finds out through ``request.upload_too_large``.
+
+``inspect_image`` checks an upload from its header only. Pillow's
+``Image.open`` reads the format and dimensions without decoding pixels,
+so a huge or decompression-bomb image is rejected on its declared size,
+before anything allocates memory for it.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP', 'TIFF'}
+
+
+def upload_max_bytes():
+    return getattr(settings, 'REGISTRY_UPLOAD_MAX_BYTES', 25 * 1024 * 1024)
+
+
+def upload_max_pixels():
+    return getattr(settings, 'REGISTRY_UPLOAD_MAX_PIXELS', 50_000_000)
+
+
+def too_large_message():
+    return f'Files may be at most {filesizeformat(upload_max_bytes())}.'
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = upload_max_bytes()
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.request.upload_too_large = True
+            # Stop parsing; fields already read stay in request.POST. The rest
+            # of the body is read and discarded chunk by chunk: a server that
+            # closed the socket mid-upload would leave the browser showing a
+            # connection reset instead of the form error.
+            raise StopUpload(connection_reset=False)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def _too_many_pixels(max_pixels):
+    return ValidationError(f'Images may have at most {max_pixels / 1_000_000:g} megapixels.', code='too_many_pixels')
+
+
+def inspect_image(file):
+    """
+    Return the format, width and height of an uploaded image from its
+    header. Raises ValidationError for unreadable files, other formats and
+    images with too many pixels.
+    """
+    max_pixels = upload_max_pixels()
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            fmt, (width, height) = image.format, image.size
+    except Image.DecompressionBombError:
+        raise _too_many_pixels(max_pixels)
+    except Exception:
+        raise ValidationError('Upload a valid image. The file is not an image or is corrupted.', code='invalid_image')
+    finally:
+        file.seek(0)
+    if width * height > max_pixels:
+        raise _too_many_pixels(max_pixels)
+    if fmt not in IMAGE_FORMATS:
+        raise ValidationError(f'Upload a JPEG, PNG, WebP or TIFF image, not {fmt}.', code='invalid_image_format')
+    return fmt, width, height
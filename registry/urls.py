@@ -1,15 +1,33 @@
 from django.urls import path
+from django.conf import settings
 from django.contrib.auth import views as auth_views
-from . import views
-
-urlpatterns = [
-    path('', views.home, name='home'),
-    path('register/', views.register_view, name='register'),
-    path('login/', views.login_view, name='login'),
-    path('logout/', auth_views.LogoutView.as_view(), name='logout'),
-    path('ngo-dashboard/', views.ngo_dashboard, name='ngo_dashboard'),
-    path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
-    path('add-project/', views.add_project, name='add_project'),
-    path('upload-record/', views.upload_record, name='upload_record'),
-    path('verify-record/<uuid:record_id>/', views.verify_record, name='verify_record'),
-]
+from . import async_views, views
+
+
+def patterns(read_views):
+    """The registry's URLs, with the read-only views taken from ``read_views``."""
+    return [
+        path('', read_views.home, name='home'),
+        path('register/', views.register_view, name='register'),
+        path('login/', views.login_view, name='login'),
+        path('logout/', auth_views.LogoutView.as_view(), name='logout'),
+        path('ngo-dashboard/', read_views.ngo_dashboard, name='ngo_dashboard'),
+        path('admin-dashboard/', read_views.admin_dashboard, name='admin_dashboard'),
+        path('add-project/', views.add_project, name='add_project'),
+        path('upload-record/', views.upload_record, name='upload_record'),
+        path('uploads/', views.start_upload, name='start_upload'),
+        path('uploads/<uuid:upload_id>/', views.upload_session, name='upload_session'),
+        path('import-records/', views.import_records, name='import_records'),
+        path('verify-record/<uuid:record_id>/', views.verify_record, name='verify_record'),
+        path('verify-records/', views.bulk_verify_records, name='bulk_verify_records'),
+        path('export/<slug:dataset>.<slug:fmt>', read_views.export_data, name='export_data'),
+        path('metrics', views.metrics_view, name='metrics'),
+        path('api/v1/events/', read_views.events_feed, name='events_feed'),
+        path('api/v1/rollups/', read_views.rollup_report, name='rollup_report'),
+        path('api/v1/rollups/chart/', read_views.rollup_chart, name='rollup_chart'),
+        path('api/v1/<slug:resource>/', read_views.api_list, name='api_list'),
+    ]
+
+
+# asgi.py turns on the async views; WSGI serves the sync ones.
+urlpatterns = patterns(async_views if getattr(settings, 'REGISTRY_ASYNC_VIEWS', False) else views)
@@ -1,13 +1,32 @@
-import datetime
+import csv
+import uuid
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Sum, Count
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
 from decimal import Decimal
-from .models import User, ProjectSite, PlantationRecord, CarbonCredit
+from .models import User, ProjectSite, PlantationRecord, CarbonCredit, UploadSession
 from .forms import UserRegistrationForm, ProjectSiteForm, PlantationRecordForm
 from .forms import LoginForm 
+from .forms import PlantationImportForm
+from .credits import build_credits, calculate_credits
+from .pagination import keyset_page
+from . import api, db, derivatives, duplicates, events, exports, fragments, imports, ledger, metrics, resumable, rollups, stats, uploads
+from .stats import registry_stats, organization_stats
+
+ADMIN_QUEUE_PAGE_SIZE = 25
+BULK_VERIFY_MAX_RECORDS = 5000
+IMPORT_ERRORS_SHOWN = 200
+
 def login_view(request):
     form = LoginForm(request, data=request.POST or None)
 
@@ -28,18 +47,15 @@ def login_view(request):
     return render(request, 'registry/login.html', {'form': form})
 
 def home(request):
-    total_sites = ProjectSite.objects.count()
-    total_records = PlantationRecord.objects.count()
-    verified_records = PlantationRecord.objects.filter(verified=True).count()
-    total_credits = CarbonCredit.objects.aggregate(Sum('credits_issued'))['credits_issued__sum'] or 0
-    
-    context = {
-        'total_sites': total_sites,
-        'total_records': total_records,
-        'verified_records': verified_records,
-        'total_credits': total_credits,
+    return render(request, 'registry/home.html', home_context(registry_stats()))
+
+def home_context(totals):
+    return {
+        'total_sites': totals.total_sites,
+        'total_records': totals.total_records,
+        'verified_records': totals.verified_records,
+        'total_credits': totals.total_credits,
     }
-    return render(request, 'registry/home.html', context)
 
 def register_view(request):
     if request.method == 'POST':
@@ -67,17 +83,23 @@ def ngo_dashboard(request):
         messages.error(request, 'Access denied.')
         return redirect('home')
     
-    user_sites = ProjectSite.objects.filter(created_by=request.user)
-    user_records = PlantationRecord.objects.filter(uploaded_by=request.user)
-    user_credits = CarbonCredit.objects.filter(project_site__created_by=request.user)
+    context = ngo_dashboard_context(request.user, organization_stats(request.user), fragments.context(request.user.pk))
+    return render(request, 'registry/ngo_dashboard.html', context)
+
+def ngo_dashboard_context(user, totals, fragment_context):
+    user_sites = ProjectSite.objects.filter(created_by=user)
+    user_records = PlantationRecord.objects.filter(uploaded_by=user).select_related('project_site')
+    user_credits = CarbonCredit.objects.filter(project_site__created_by=user).select_related('project_site')
     
-    context = {
+    # The querysets stay lazy: cached fragments never evaluate them.
+    return {
         'user_sites': user_sites,
-        'user_records': user_records,
-        'user_credits': user_credits,
-        'total_credits': user_credits.aggregate(Sum('credits_issued'))['credits_issued__sum'] or 0,
+        'recent_records': user_records.order_by('-upload_date')[:6],
+        'recent_credits': user_credits.order_by('-issued_date')[:3],
+        'stats': totals,
+        'total_credits': totals.total_credits,
+        **fragment_context,
     }
-    return render(request, 'registry/ngo_dashboard.html', context)
 
 @login_required
 def admin_dashboard(request):
@@ -85,19 +107,139 @@ def admin_dashboard(request):
         messages.error(request, 'Access denied.')
         return redirect('home')
     
-    all_sites = ProjectSite.objects.all()
-    pending_records = PlantationRecord.objects.filter(verified=False)
-    all_records = PlantationRecord.objects.all()
-    all_credits = CarbonCredit.objects.all()
-    
-    context = {
-        'all_sites': all_sites,
+    pending_records = keyset_page(pending_queue(), ('upload_date', 'id'), request.GET.get('after'), ADMIN_QUEUE_PAGE_SIZE)
+    derivatives.attach(pending_records.items)
+    duplicates.flag(pending_records.items)
+    context = admin_dashboard_context(pending_records, registry_stats(), fragments.context())
+    return render(request, 'registry/admin_dashboard.html', context)
+
+def pending_queue():
+    return PlantationRecord.objects.filter(verified=False).select_related('project_site', 'uploaded_by')
+
+def admin_dashboard_context(pending_records, totals, fragment_context):
+    return {
         'pending_records': pending_records,
-        'all_records': all_records,
-        'all_credits': all_credits,
-        'total_credits': all_credits.aggregate(Sum('credits_issued'))['credits_issued__sum'] or 0,
+        'recent_sites': ProjectSite.objects.select_related('created_by').order_by('-created_date')[:10],
+        'recent_credits': CarbonCredit.objects.select_related('project_site').order_by('-issued_date')[:5],
+        'total_sites': totals.total_sites,
+        'total_records': totals.total_records,
+        'pending_count': totals.pending_records,
+        'total_credits': totals.total_credits,
+        **fragment_context,
     }
-    return render(request, 'registry/admin_dashboard.html', context)
+
+@login_required
+def export_data(request, dataset, fmt):
+    if request.user.role != 'ADMIN':
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+    return export_response(request, dataset, fmt, exports.stream)
+
+def export_response(request, dataset, fmt, stream):
+    """Stream ``dataset`` with ``stream``, or answer 400 for bad filters."""
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        raise Http404('Unknown export.')
+    
+    filters = {
+        'ecosystem_type': request.GET.get('ecosystem') or None,
+        'organization': request.GET.get('organization') or None,
+    }
+    try:
+        filters['year'] = exports.parse_year(request.GET.get('year'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    
+    response = StreamingHttpResponse(stream(dataset, fmt, **filters), content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+@require_safe
+def api_list(request, resource):
+    query = api_query(request, request.user, resource)
+    if isinstance(query, HttpResponse):
+        return query
+    return api.respond(request, *query)
+
+def api_query(request, user, resource):
+    """``(resource, user, names, cursor, limit)`` for ``api.respond``, or an error response."""
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    if resource not in api.RESOURCES:
+        return JsonResponse({'error': f'Unknown resource: {resource}.'}, status=404)
+    
+    spec = api.RESOURCES[resource]
+    try:
+        names = api.parse_fields(spec, request.GET.get('fields'))
+        limit = api.parse_limit(request.GET.get('limit'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return spec, user, names, request.GET.get('after'), limit
+
+@require_safe
+def events_feed(request):
+    """Change events after ``?since=``. With ``?wait=``, hold the request until one arrives."""
+    query = feed_query(request, request.user)
+    if isinstance(query, HttpResponse):
+        return query
+    since, limit, timeout = query
+    return feed_response(events.poll(since, limit + 1, timeout), since, limit)
+
+def feed_query(request, user):
+    """``(since, limit, wait)`` for the change feed, or an error response."""
+    token = getattr(settings, 'REGISTRY_FEED_TOKEN', '')
+    authorized = user.is_authenticated and user.role == 'ADMIN'
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        authorized = True
+    if not authorized:
+        return JsonResponse({'error': 'Admins only.'}, status=403)
+    
+    try:
+        since = int(request.GET.get('since') or 0)
+        limit = int(request.GET.get('limit') or events.PAGE_SIZE)
+        timeout = float(request.GET.get('wait') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'since, limit and wait must be numbers.'}, status=400)
+    if since < 0 or not 1 <= limit <= events.MAX_PAGE_SIZE or not 0 <= timeout <= events.MAX_WAIT:
+        return JsonResponse({'error': f'limit must be 1-{events.MAX_PAGE_SIZE} and wait 0-{events.MAX_WAIT}.'},
+                            status=400)
+    return since, limit, timeout
+
+def feed_response(batch, since, limit):
+    page = batch[:limit]
+    return JsonResponse({
+        'events': [events.as_dict(event) for event in page],
+        'last_sequence': page[-1].sequence if page else since,
+        'has_more': len(batch) > limit,
+    })
+
+@require_safe
+def rollup_report(request):
+    """Summed rollup buckets grouped by ``?group_by=``. Owners see their own sites only."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        group_by, measures, filters = rollups.parse_report(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    owner = None if request.user.role == 'ADMIN' else request.user
+    rows = list(rollups.report(group_by, measures, owner=owner, **filters))
+    return JsonResponse({'group_by': group_by, 'measures': measures, 'rows': rows})
+
+@require_safe
+def rollup_chart(request):
+    """One measure over years or months, one dataset per ``?series=`` value."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        x, series, measure, filters = rollups.parse_chart(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    owner = None if request.user.role == 'ADMIN' else request.user
+    group_by = [x, series] if series else [x]
+    rows = list(rollups.report(group_by, [measure], owner=owner, **filters))
+    return JsonResponse(rollups.chart(rows, x, series, measure))
 
 @login_required
 def add_project(request):
@@ -118,13 +260,22 @@ def add_project(request):
     return render(request, 'registry/add_project.html', {'form': form})
 
 @login_required
+@csrf_exempt
 def upload_record(request):
+    # Upload handlers must be set before CSRF checking reads request.POST.
+    request.upload_handlers = [uploads.BoundedUploadHandler(request)]
+    return _upload_record(request)
+
+@csrf_protect
+def _upload_record(request):
     if request.user.role not in ['NGO', 'COMMUNITY']:
         messages.error(request, 'Access denied.')
         return redirect('home')
     
     if request.method == 'POST':
         form = PlantationRecordForm(request.user, request.POST, request.FILES)
+        if getattr(request, 'upload_too_large', False):
+            form.add_error('uploaded_images', uploads.too_large_message())
         if form.is_valid():
             record = form.save(commit=False)
             record.uploaded_by = request.user
@@ -133,53 +284,266 @@ def upload_record(request):
             return redirect('ngo_dashboard')
     else:
         form = PlantationRecordForm(request.user)
-    return render(request, 'registry/upload_record.html', {'form': form})
+    context = {'form': form, 'upload_max_bytes': uploads.upload_max_bytes()}
+    return render(request, 'registry/upload_record.html', context)
+
+def _uploader_error(request):
+    """A JSON error response unless an NGO or community user is signed in."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    if request.user.role not in ['NGO', 'COMMUNITY']:
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    return None
+
+def _upload_response(session, status=200):
+    response = JsonResponse({
+        'id': str(session.pk),
+        'offset': session.offset,
+        'size': session.size,
+        'chunk_size': resumable.chunk_size(),
+        'url': reverse('upload_session', args=[session.pk]),
+    }, status=status)
+    response['Upload-Offset'] = str(session.offset)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def _upload_error(exc):
+    response = JsonResponse({'error': str(exc), 'offset': exc.offset}, status=exc.status)
+    if exc.offset is not None:
+        response['Upload-Offset'] = str(exc.offset)
+    return response
+
+@require_POST
+def start_upload(request):
+    """Start a resumable photo upload from ``filename`` and ``size``."""
+    error = _uploader_error(request)
+    if error:
+        return error
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'size must be a number of bytes.'}, status=400)
+    try:
+        session = resumable.start(request.user, request.POST.get('filename', ''), size)
+    except resumable.UploadError as exc:
+        return _upload_error(exc)
+    return _upload_response(session, status=201)
+
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def upload_session(request, upload_id):
+    """GET the offset to resume from, PATCH the next chunk at ``Upload-Offset``, or DELETE to abandon."""
+    error = _uploader_error(request)
+    if error:
+        return error
+    session = UploadSession.objects.filter(pk=upload_id, owner=request.user).first()
+    if session is None:
+        return JsonResponse({'error': 'Upload not found.'}, status=404)
+    
+    if request.method == 'DELETE':
+        session.delete()
+        return HttpResponse(status=204)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required.'}, status=400)
+        try:
+            checksum = resumable.parse_checksum(request.headers.get('Upload-Checksum'))
+            # Read the body as a stream; request.body would hold the whole chunk in memory.
+            resumable.write_chunk(session, offset, request, length, checksum)
+        except resumable.UploadError as exc:
+            return _upload_error(exc)
+    return _upload_response(session)
+
+@login_required
+def import_records(request):
+    if request.user.role not in ['NGO', 'COMMUNITY']:
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+    
+    result = None
+    if request.method == 'POST':
+        form = PlantationImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            data_file = form.cleaned_data['data_file']
+            saved = []
+            try:
+                result = imports.import_records(
+                    request.user, data_file, imports.detect_format(data_file.name),
+                    dry_run=form.cleaned_data['dry_run'], progress=saved.append,
+                )
+            except imports.FileTooLarge as exc:
+                form.add_error('data_file', str(exc))
+            except (ValueError, UnicodeDecodeError, csv.Error):
+                form.add_error('data_file', 'The file could not be read as UTF-8 CSV or GeoJSON.')
+                # Batches are committed as they go; say what was kept.
+                if saved and not form.cleaned_data['dry_run']:
+                    messages.warning(request, f'{saved[-1].created} records before the unreadable part were saved.')
+            else:
+                verb = 'validated' if form.cleaned_data['dry_run'] else 'imported'
+                messages.success(request, f'{result.created} plantation records {verb}.')
+                if result.errors:
+                    messages.warning(request, f'{len(result.errors)} rows were rejected.')
+    else:
+        form = PlantationImportForm()
+    context = {
+        'form': form,
+        'result': result,
+        'row_errors': result.errors[:IMPORT_ERRORS_SHOWN] if result else [],
+    }
+    return render(request, 'registry/import_records.html', context)
 
 @login_required
 def verify_record(request, record_id):
     if request.user.role != 'ADMIN':
-        print("Access denied")
         messages.error(request, 'Access denied.')
         return redirect('home')
     
     record = get_object_or_404(PlantationRecord, id=record_id)
-    print("check")
     if request.method == 'POST':
-        print("Enter")
-        print("POST data:", request.POST) 
         action = request.POST.get('action')
-        print(action)
         if action == 'approve':
-            record.verified = True
-            record.verified_by = request.user
-            record.verified_date = datetime.datetime.now()
-            record.save()
-            
-            # Generate carbon credits
-            credits_amount = calculate_carbon_credits(record)
-            CarbonCredit.objects.create(
-                project_site=record.project_site,
-                plantation_record=record,
-                year=record.date_planted.year,
-                credits_issued=credits_amount
-            )
-            
-            messages.success(request, f'Record verified and {credits_amount} carbon credits issued!')
+            credits_amount = approve_record(record.id, request.user)
+            if credits_amount is None:
+                messages.warning(request, 'This record was already verified.')
+            else:
+                messages.success(request, f'Record verified and {credits_amount} carbon credits issued!')
         elif action == 'reject':
             messages.info(request, 'Record rejected.')
     
     return redirect('admin_dashboard')
 
-def calculate_carbon_credits(record):
-    """Simple calculation for demo purposes"""
-    base_credits_per_plant = Decimal('0.5')  # 0.5 credits per plant
-    ecosystem_multiplier = {
-        'MANGROVE': Decimal('1.5'),
-        'SEAGRASS': Decimal('1.2'),
-        'MARSH': Decimal('1.0'),
-    }
+@login_required
+@require_POST
+def bulk_verify_records(request):
+    if request.user.role != 'ADMIN':
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+    
+    action = request.POST.get('action')
+    limit = getattr(settings, 'REGISTRY_BULK_VERIFY_MAX_RECORDS', BULK_VERIFY_MAX_RECORDS)
+    submitted = request.POST.getlist('record_ids')
+    raw_ids = submitted[:limit]
+    # Ids past the limit are reported, not silently dropped; an id that also
+    # appears within the limit gets its real outcome below.
+    outcomes = dict.fromkeys(submitted[limit:], 'over_limit')
+    record_ids = []
+    for raw_id in raw_ids:
+        try:
+            record_ids.append(uuid.UUID(raw_id))
+        except ValueError:
+            outcomes[raw_id] = 'invalid'
+    
+    if action not in ('approve', 'reject'):
+        messages.error(request, 'Unknown verification action.')
+        return redirect('admin_dashboard')
+    
+    records, pending, credits = verify_batch(record_ids, action, request.user)
+    found = {record.id for record in records}
+    acted_on = {record.id for record in pending}
+    for record_id in record_ids:
+        if record_id not in found:
+            outcomes[str(record_id)] = 'not_found'
+        elif record_id not in acted_on:
+            outcomes[str(record_id)] = 'already_verified'
+    
+    outcome = 'approved' if action == 'approve' else 'rejected'
+    for record in pending:
+        outcomes[str(record.id)] = outcome
+    
+    if not request.accepts('text/html'):
+        return JsonResponse({'action': action, 'outcomes': outcomes})
+    
+    if action == 'approve':
+        issued = sum((c.credits_issued for c in credits), Decimal('0'))
+        messages.success(request, f'{len(pending)} records verified and {issued} carbon credits issued!')
+    else:
+        messages.info(request, f'{len(pending)} records rejected.')
+    over_limit = sum(1 for status in outcomes.values() if status == 'over_limit')
+    skipped = len(outcomes) - len(pending) - over_limit
+    if skipped:
+        messages.warning(request, f'{skipped} records were skipped (already verified or not found).')
+    if over_limit:
+        messages.warning(request, f'{over_limit} records were not processed: at most {limit} can be verified at once.')
+    return redirect('admin_dashboard')
+
+def metrics_view(request):
+    """Request and database metrics in Prometheus text format, for staff only."""
+    token = getattr(settings, 'REGISTRY_METRICS_TOKEN', '')
+    authorized = request.user.is_authenticated and (request.user.is_staff or request.user.role == 'ADMIN')
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        authorized = True
+    if not authorized:
+        return HttpResponseForbidden('Staff only.')
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@db.write_transaction
+def approve_record(record_id, admin):
+    """
+    Verify one record and issue its carbon credits. Returns the credits, or
+    None if the record was verified meanwhile.
+    """
+    record = (
+        PlantationRecord.objects.select_related('project_site').select_for_update()
+        .filter(id=record_id, verified=False).first()
+    )
+    if record is None:
+        return None
+    record.verified = True
+    record.verified_by = admin
+    record.verified_date = timezone.now()
+    record.save()
+    
+    # Generate carbon credits
+    credits_amount = calculate_carbon_credits(record)
+    build_credits([record], [credits_amount])[0].save()
+    return credits_amount
+
+@db.write_transaction
+def verify_batch(record_ids, action, admin):
+    """
+    Approve or reject the pending records among ``record_ids``. Returns the
+    records found, the pending ones acted on and the credits issued.
+    """
+    records = list(
+        PlantationRecord.objects.select_related('project_site')
+        .select_for_update()
+        .filter(id__in=record_ids)
+    )
+    pending = [record for record in records if not record.verified]
+    if action != 'approve' or not pending:
+        return records, pending, []
+    
+    now = timezone.now()
+    for record in pending:
+        record.verified = True
+        record.verified_by = admin
+        record.verified_date = now
+    PlantationRecord.objects.bulk_update(pending, ['verified', 'verified_by', 'verified_date'])
     
-    multiplier = ecosystem_multiplier.get(record.project_site.ecosystem_type, Decimal('1.0'))
-    total_credits = record.number_of_plants * base_credits_per_plant * multiplier
+    amounts = calculate_credits(
+        [record.number_of_plants for record in pending],
+        [record.project_site.ecosystem_type for record in pending],
+    )
+    credits = build_credits(pending, amounts)
+    CarbonCredit.objects.bulk_create(credits)
+    ledger.append(credits)
+    events.append(
+        event for record, credit in zip(pending, credits)
+        for event in (events.record_verified(record), events.credit_issued(credit))
+    )
     
-    return round(total_credits, 2)
+    stats.bump_many(
+        [(r.uploaded_by_id, r.project_site.ecosystem_type, {'verified_records': 1}) for r in pending]
+        + [(c.project_site.created_by_id, c.project_site.ecosystem_type, {'total_credits': c.credits_issued})
+           for c in credits]
+    )
+    rollups.add(rollups.verified(pending, credits))
+    fragments.bump(*{r.uploaded_by_id for r in pending}, *{c.project_site.created_by_id for c in credits},
+                   resources=('records', 'credits'))
+    return records, pending, credits
+
+def calculate_carbon_credits(record):
+    """Simple calculation for demo purposes"""
+    return calculate_credits([record.number_of_plants], [record.project_site.ecosystem_type])[0]
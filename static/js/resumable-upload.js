@@ -0,0 +1,142 @@
+// Resumable photo uploads for the plantation record form; see registry/resumable.py.
+//
+// The photo is sent in chunks before the form is submitted, and the form
+// then carries only the upload's id. When the connection drops, the upload
+// continues from the offset the server reports instead of starting over.
+// Reloading the page and picking the same file resumes it too. Without
+// fetch the form falls back to a plain multipart upload.
+(function() {
+    const form = document.getElementById('recordForm');
+    if (!form || !window.fetch || !window.FormData) {
+        return;
+    }
+    const fileInput = form.querySelector('input[type="file"]');
+    const uploadId = form.querySelector('input[name="upload_id"]');
+    const status = document.getElementById('uploadStatus');
+    const button = form.querySelector('button[type="submit"]');
+    const buttonLabel = button ? button.innerHTML : '';
+    const csrfToken = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    const MAX_FAILURES = 8;
+
+    function report(text) {
+        if (status) {
+            status.textContent = text;
+        }
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function checksum(blob) {
+        // crypto.subtle only exists on HTTPS and localhost; chunks go unchecked elsewhere.
+        if (!window.crypto || !crypto.subtle) {
+            return null;
+        }
+        const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', await blob.arrayBuffer()));
+        return 'sha256 ' + btoa(String.fromCharCode(...digest));
+    }
+
+    async function send(url, options) {
+        options.headers = Object.assign({'X-CSRFToken': csrfToken}, options.headers);
+        options.credentials = 'same-origin';
+        const response = await fetch(url, options);
+        const body = await response.json().catch(() => ({}));
+        return {response, body};
+    }
+
+    async function session(file) {
+        const key = 'registry-upload:' + [file.name, file.size, file.lastModified].join(':');
+        const saved = localStorage.getItem(key);
+        if (saved) {
+            try {
+                const {response, body} = await send(saved, {method: 'GET'});
+                if (response.ok) {
+                    return Object.assign({key}, body);
+                }
+            } catch (error) {
+                // Offline: start a new upload below, which fails the same way.
+            }
+        }
+        const data = new FormData();
+        data.append('filename', file.name);
+        data.append('size', file.size);
+        const {response, body} = await send(form.dataset.uploadUrl, {method: 'POST', body: data});
+        if (!response.ok) {
+            throw new Error(body.error || 'The photo upload could not be started.');
+        }
+        localStorage.setItem(key, body.url);
+        return Object.assign({key}, body);
+    }
+
+    async function upload(file) {
+        const upload = await session(file);
+        let offset = upload.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            report(`Uploading photo… ${Math.floor(offset * 100 / file.size)}%`);
+            const chunk = file.slice(offset, offset + upload.chunk_size);
+            const headers = {'Upload-Offset': String(offset), 'Content-Type': 'application/offset+octet-stream'};
+            const sum = await checksum(chunk);
+            if (sum) {
+                headers['Upload-Checksum'] = sum;
+            }
+
+            let result = null;
+            try {
+                result = await send(upload.url, {method: 'PATCH', headers, body: chunk});
+            } catch (error) {
+                // Network failure: retry below.
+            }
+            if (result && result.response.ok) {
+                offset = result.body.offset;
+                failures = 0;
+                continue;
+            }
+            // Errors without an offset to resume from (expired, not found) are final.
+            if (result && result.response.status < 500 && result.body.offset == null) {
+                localStorage.removeItem(upload.key);
+                throw new Error(result.body.error || 'The photo could not be uploaded.');
+            }
+
+            failures += 1;
+            if (failures > MAX_FAILURES) {
+                throw new Error('The connection keeps dropping. Submit again to continue the upload.');
+            }
+            report('Connection lost, retrying…');
+            await sleep(Math.min(30000, 1000 * 2 ** failures));
+            try {
+                const {response, body} = await send(upload.url, {method: 'GET'});
+                if (response.ok) {
+                    offset = body.offset;
+                }
+            } catch (error) {
+                // Still offline; the next PATCH finds out where to continue.
+            }
+        }
+        localStorage.removeItem(upload.key);
+        return upload.id;
+    }
+
+    form.addEventListener('submit', async function(event) {
+        const file = fileInput && fileInput.files[0];
+        if (!file) {
+            return;
+        }
+        event.preventDefault();
+        try {
+            uploadId.value = await upload(file);
+        } catch (error) {
+            report(error.message);
+            if (button) {
+                button.disabled = false;
+                button.innerHTML = buttonLabel;
+            }
+            return;
+        }
+        // The photo is on the server already; post the form without it.
+        fileInput.value = '';
+        report('Photo uploaded. Saving the record…');
+        form.submit();
+    });
+})();